@@ -0,0 +1,241 @@
+"""
+准入控制：限制并发、有界排队、按租户加权公平调度与快速拒绝
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from tenants import Tenant
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """请求未被准入，由接口层转换为 429/503 + Retry-After"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """准入凭证，release 可重复调用；hold() 可把归还推迟到请求之外的工作（如续传窗口内的上游）结束"""
+
+    __slots__ = ("_controller", "_released", "_holds", "admitted_at", "tenant")
+
+    def __init__(self, controller: "AdmissionController", tenant: Optional["Tenant"] = None):
+        self._controller = controller
+        self._released = False
+        self._holds = 0
+        self.admitted_at = time.monotonic()
+        self.tenant = tenant
+        if tenant is not None:
+            tenant.in_flight += 1
+            tenant.admitted += 1
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            if self._holds == 0:
+                self._return()
+
+    def hold(self) -> Callable[[], None]:
+        """推迟归还名额：返回的回调与 release() 都调用后才归还，回调可重复调用"""
+        if self._released and self._holds == 0:
+            # 名额已归还
+            return lambda: None
+        self._holds += 1
+        dropped = False
+
+        def drop():
+            nonlocal dropped
+            if not dropped:
+                dropped = True
+                self._holds -= 1
+                if self._holds == 0 and self._released:
+                    self._return()
+        return drop
+
+    def _return(self):
+        if self.tenant is not None:
+            self.tenant.in_flight -= 1
+        self._controller._release(time.monotonic() - self.admitted_at)
+
+    async def __aenter__(self) -> "AdmissionTicket":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """最大并发 + 按租户加权公平的有界等待队列
+
+    - 并发未满且无人排队时立即准入
+    - 队列（或该租户的排队配额）已满时立即返回 429
+    - 在队列中等待超过截止时间时返回 503
+    - 释放的名额按虚拟完成时间最小者移交（自计时公平队列）：每个排队请求的标签为
+      max(当前虚拟时间, 该租户上一个排队请求的标签) + 1 / 权重，
+      因此积压很多请求的租户不会饿死其他租户，各租户按权重比例分得名额；未指定租户的请求按 FIFO
+    """
+
+    def __init__(self,
+                 name: str,
+                 max_in_flight: int = 32,
+                 max_queue: int = 64,
+                 queue_timeout: float = 10.0,
+                 max_queue_timeout: float = 30.0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_queue_timeout = max_queue_timeout
+        self.in_flight = 0
+        # 堆元素：(虚拟完成时间, 序号, 等待者, 租户)；放弃排队的等待者被取消后留在堆中，出队时跳过
+        self._queue: List[Tuple[float, int, "asyncio.Future[None]", Optional["Tenant"]]] = []
+        self._depth = 0
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        # 有排队请求的租户：最后一个排队请求的虚拟完成时间与排队数
+        self._finish_tags: Dict[str, float] = {}
+        self._tenant_depth: Dict[str, int] = {}
+        self._service_time: Optional[float] = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _retry_after(self) -> int:
+        """按平均服务时间估算排队清空所需秒数"""
+        service_time = self._service_time or 1.0
+        backlog = self._depth + 1
+        return max(1, math.ceil(backlog * service_time / max(self.max_in_flight, 1)))
+
+    async def acquire(self, timeout: Optional[float] = None, tenant: Optional["Tenant"] = None) -> AdmissionTicket:
+        """等待准入；timeout 为该请求的排队截止时间，受 max_queue_timeout 限制"""
+        if self.in_flight < self.max_in_flight and not self._depth:
+            self.in_flight += 1
+            self.admitted += 1
+            return AdmissionTicket(self, tenant)
+
+        if self._depth >= self.max_queue:
+            self.rejected_queue_full += 1
+            if tenant is not None:
+                tenant.rejected_queue_full += 1
+            raise AdmissionRejected(429, f"{self.name} 请求过多，请稍后重试", self._retry_after())
+        if tenant is not None and self._tenant_depth.get(tenant.id, 0) >= tenant.max_queue:
+            self.rejected_queue_full += 1
+            tenant.rejected_queue_full += 1
+            raise AdmissionRejected(429, f"{self.name} 租户 {tenant.id} 排队请求过多，请稍后重试", self._retry_after())
+
+        if timeout is None:
+            timeout = self.queue_timeout
+        timeout = min(max(timeout, 0.0), self.max_queue_timeout)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._enqueue(waiter, tenant)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            # 不用 wait_for：名额已移交时它会吞掉调用方的取消并返回，凭证随之泄漏
+            await asyncio.wait((waiter,), timeout=timeout)
+        except BaseException:
+            self._abandon(waiter, tenant)
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if tenant is not None:
+                tenant.record_wait(waited)
+        if not waiter.done():
+            self._abandon(waiter, tenant)
+            self.rejected_timeout += 1
+            if tenant is not None:
+                tenant.rejected_timeout += 1
+            raise AdmissionRejected(503, f"{self.name} 排队超时，请稍后重试", self._retry_after())
+
+        self.admitted += 1
+        return AdmissionTicket(self, tenant)
+
+    def _enqueue(self, waiter: "asyncio.Future[None]", tenant: Optional["Tenant"]):
+        if tenant is None:
+            # 未指定租户：排在当前虚拟时间，与同一时刻入队的租户请求按 FIFO
+            tag = self._virtual_time
+        else:
+            start = max(self._virtual_time, self._finish_tags.get(tenant.id, self._virtual_time))
+            tag = start + 1.0 / tenant.weight
+            self._finish_tags[tenant.id] = tag
+            self._tenant_depth[tenant.id] = self._tenant_depth.get(tenant.id, 0) + 1
+            tenant.queued += 1
+        heapq.heappush(self._queue, (tag, next(self._sequence), waiter, tenant))
+        self._depth += 1
+
+    def _dequeued(self, tenant: Optional["Tenant"]):
+        """等待者离开队列（被准入或放弃）时的计数"""
+        self._depth -= 1
+        if tenant is None:
+            return
+        tenant.queued -= 1
+        depth = self._tenant_depth[tenant.id] - 1
+        if depth:
+            self._tenant_depth[tenant.id] = depth
+        else:
+            # 租户队列清空后不再保留其虚拟时间，下次入队从当前虚拟时间开始
+            del self._tenant_depth[tenant.id]
+            del self._finish_tags[tenant.id]
+
+    def _abandon(self, waiter: "asyncio.Future[None]", tenant: Optional["Tenant"]):
+        """放弃排队；若名额已移交给该等待者则转交下一个"""
+        if waiter.done() and not waiter.cancelled():
+            self._release(None)
+            return
+        waiter.cancel()
+        self._dequeued(tenant)
+        # 被取消的等待者过多时重建堆
+        if len(self._queue) > 2 * self._depth + 64:
+            self._queue = [item for item in self._queue if not item[2].done()]
+            heapq.heapify(self._queue)
+
+    def _release(self, service_time: Optional[float]):
+        if service_time is not None:
+            if self._service_time is None:
+                self._service_time = service_time
+            else:
+                self._service_time += 0.2 * (service_time - self._service_time)
+        # 名额直接移交给虚拟完成时间最小的等待者，in_flight 不变
+        while self._queue:
+            tag, _, waiter, tenant = heapq.heappop(self._queue)
+            if not waiter.done():
+                self._virtual_time = max(self._virtual_time, tag)
+                self._dequeued(tenant)
+                waiter.set_result(None)
+                return
+        self.in_flight = max(self.in_flight - 1, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        """准入统计信息"""
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": self._depth,
+            "queued_tenants": len(self._tenant_depth),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_wait_ms": round(self.total_wait / self.queued * 1000, 1) if self.queued else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "avg_service_ms": round(self._service_time * 1000, 1) if self._service_time is not None else None,
+        }
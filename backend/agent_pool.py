@@ -0,0 +1,150 @@
+"""
+AutoGen 代理池
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _PoolEntry:
+    """单个提示词键对应的池条目"""
+
+    __slots__ = ("idle", "in_use", "last_used")
+
+    def __init__(self):
+        # 空闲代理列表: (代理, 归还时间)
+        self.idle: List[Tuple[Any, float]] = []
+        self.in_use = 0
+        self.last_used = time.monotonic()
+
+
+class AgentPool:
+    """按 (代理名, 系统消息) 分组的代理池
+
+    - 每个键可以同时借出多个代理实例，并发流不会共享同一个有状态代理
+    - 键按 LRU 淘汰，数量受 max_keys 限制
+    - 空闲代理超过 ttl 秒后被回收
+    """
+
+    def __init__(self, max_keys: int = 32, max_idle_per_key: int = 4, ttl: float = 600.0):
+        self.max_keys = max_keys
+        self.max_idle_per_key = max_idle_per_key
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _PoolEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, key: str, factory: Callable[[], Any]) -> Any:
+        """借出一个代理，没有空闲实例时调用 factory 创建"""
+        with self._lock:
+            now = time.monotonic()
+            self._expire_idle(now)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _PoolEntry()
+                self._entries[key] = entry
+            self._entries.move_to_end(key)
+            entry.in_use += 1
+            entry.last_used = now
+
+            if entry.idle:
+                agent, _ = entry.idle.pop()
+                self.hits += 1
+                return agent
+
+            self.misses += 1
+            self._enforce_capacity()
+
+        try:
+            return factory()
+        except Exception:
+            self.release(key, None, reusable=False)
+            raise
+
+    def release(self, key: str, agent: Any, reusable: bool = True):
+        """归还代理，reusable 为 False 时直接丢弃"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                # 借出期间该键已被淘汰
+                if agent is not None:
+                    self.evictions += 1
+                return
+
+            entry.in_use = max(entry.in_use - 1, 0)
+            entry.last_used = time.monotonic()
+
+            if agent is None:
+                return
+            if reusable and len(entry.idle) < self.max_idle_per_key:
+                entry.idle.append((agent, entry.last_used))
+            else:
+                self.evictions += 1
+
+    def _expire_idle(self, now: float):
+        """回收超过 TTL 的空闲代理"""
+        if self.ttl <= 0:
+            return
+        deadline = now - self.ttl
+        for key in list(self._entries):
+            entry = self._entries[key]
+            if entry.idle and entry.idle[0][1] < deadline:
+                kept = [item for item in entry.idle if item[1] >= deadline]
+                self.evictions += len(entry.idle) - len(kept)
+                entry.idle = kept
+            if not entry.idle and entry.in_use == 0 and entry.last_used < deadline:
+                del self._entries[key]
+
+    def _enforce_capacity(self):
+        """按 LRU 顺序淘汰超出上限的键（跳过仍有代理借出的键）"""
+        if len(self._entries) <= self.max_keys:
+            return
+        for key in list(self._entries):
+            if len(self._entries) <= self.max_keys:
+                break
+            entry = self._entries[key]
+            if entry.in_use:
+                continue
+            self.evictions += len(entry.idle)
+            del self._entries[key]
+            logger.debug(f"Evicted agent pool key: {key}")
+
+    def clear(self):
+        """清空所有空闲代理"""
+        with self._lock:
+            for entry in self._entries.values():
+                self.evictions += len(entry.idle)
+            self._entries.clear()
+
+    def size(self) -> int:
+        """当前池中的代理总数（空闲 + 借出）"""
+        with self._lock:
+            return sum(len(e.idle) + e.in_use for e in self._entries.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """池统计信息"""
+        with self._lock:
+            idle = sum(len(e.idle) for e in self._entries.values())
+            in_use = sum(e.in_use for e in self._entries.values())
+            lookups = self.hits + self.misses
+            return {
+                "size": idle + in_use,
+                "keys": len(self._entries),
+                "idle": idle,
+                "in_use": in_use,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "max_keys": self.max_keys,
+                "max_idle_per_key": self.max_idle_per_key,
+                "ttl": self.ttl,
+            }
@@ -0,0 +1,210 @@
+"""
+自适应上游并发限制（AIMD：加性增、乘性减）
+"""
+
+import asyncio
+import logging
+import math
+import re
+import time
+from collections import deque
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Deque, Dict, Optional
+
+from upstream_router import get_status_code, is_rate_limited
+
+logger = logging.getLogger(__name__)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """解析秒数、HTTP 日期或 "1m30s"/"200ms" 形式的时长"""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and "".join(n + u for n, u in parts) == value:
+        return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    try:
+        return (parsedate_to_datetime(value) - datetime.now().astimezone()).total_seconds()
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_after(exc: BaseException) -> Optional[float]:
+    """从上游错误响应头中读取建议的等待秒数"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    for name in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens", "x-ratelimit-reset"):
+        if headers.get(name):
+            seconds = _parse_duration(headers[name])
+            if seconds is not None:
+                return max(seconds, 0.0)
+    return None
+
+
+def is_timeout(exc: BaseException) -> bool:
+    """超时类错误（asyncio / httpx / openai 的超时异常）"""
+    return isinstance(exc, asyncio.TimeoutError) or "timeout" in type(exc).__name__.lower() or get_status_code(exc) == 408
+
+
+class UpstreamBusy(Exception):
+    """等待上游并发名额超时（或上游要求暂停的时间超过剩余等待时间）"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AIMDLimiter:
+    """单个上游的自适应并发限制
+
+    - 成功且延迟健康（不超过同类请求基线的 tolerance 倍）时，每个限额窗口加 increase
+    - 429 或超时时乘以 decrease，cooldown 内只减一次，避免同一波错误把限额打到底
+    - 上游返回 Retry-After / 限流重置头时，在该时间内暂停放行新请求
+    - 等待名额超过 acquire_timeout 秒（或暂停时间超过剩余等待时间）时抛出 UpstreamBusy
+    """
+
+    def __init__(self,
+                 initial_limit: float = 8,
+                 min_limit: float = 1,
+                 max_limit: float = 128,
+                 increase: float = 1.0,
+                 decrease: float = 0.5,
+                 latency_tolerance: float = 2.0,
+                 decrease_cooldown: float = 2.0,
+                 max_retry_after: float = 60.0,
+                 acquire_timeout: Optional[float] = 10.0,
+                 history_size: int = 100):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.decrease_cooldown = decrease_cooldown
+        self.max_retry_after = max_retry_after
+        self.acquire_timeout = acquire_timeout
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._baselines: Dict[str, float] = {}
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=history_size)
+        self.increases = 0
+        self.decreases = 0
+        self.timeouts = 0
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit) and time.monotonic() >= self.blocked_until
+
+    def _timed_out(self, now: float) -> UpstreamBusy:
+        self.timeouts += 1
+        retry_after = max(1, math.ceil(self.blocked_until - now))
+        return UpstreamBusy("上游并发已满，请稍后重试", retry_after)
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """等待一个上游并发名额；timeout 为空时使用 acquire_timeout"""
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            remaining = None if deadline is None else deadline - now
+            if now < self.blocked_until:
+                if remaining is not None and self.blocked_until - now > remaining:
+                    raise self._timed_out(now)
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return
+            if remaining is not None and remaining <= 0:
+                raise self._timed_out(now)
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait((waiter,), timeout=remaining)
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # 已被唤醒但在占用名额前被取消：把名额转交给下一个等待者
+                    self._wake()
+                raise
+            finally:
+                waiter.cancel()
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            if waiter.cancelled():
+                # 超时前未被唤醒
+                raise self._timed_out(time.monotonic())
+
+    def _wake(self):
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _adjust(self, new_limit: float, reason: str):
+        new_limit = min(max(new_limit, self.min_limit), self.max_limit)
+        if int(new_limit) != int(self.limit):
+            self.history.append({
+                "time": datetime.now().isoformat(),
+                "from": int(self.limit),
+                "to": int(new_limit),
+                "reason": reason
+            })
+        self.limit = new_limit
+
+    def release(self,
+                latency: Optional[float] = None,
+                error: Optional[BaseException] = None,
+                kind: str = "call"):
+        """归还名额并根据结果调整限额；latency 与 error 都为空表示请求被取消"""
+        self.in_flight = max(self.in_flight - 1, 0)
+        now = time.monotonic()
+
+        if error is not None and (is_rate_limited(error) or is_timeout(error)):
+            retry_after = get_retry_after(error)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + min(retry_after, self.max_retry_after))
+            if now - self._last_decrease >= self.decrease_cooldown:
+                self._last_decrease = now
+                self.decreases += 1
+                reason = "rate_limited" if is_rate_limited(error) else "timeout"
+                self._adjust(self.limit * self.decrease, reason)
+                logger.warning(f"Upstream concurrency limit decreased to {int(self.limit)} ({reason})")
+        elif latency is not None:
+            baseline = self._baselines.get(kind)
+            self._baselines[kind] = latency if baseline is None else baseline + 0.1 * (latency - baseline)
+            if baseline is None or latency <= baseline * self.latency_tolerance:
+                # 加性增：每完成约 limit 个健康请求，限额加 increase
+                self.increases += 1
+                self._adjust(self.limit + self.increase / max(self.limit, 1.0), "healthy")
+
+        self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        """当前限额与调整历史"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "blocked_for": round(max(self.blocked_until - time.monotonic(), 0.0), 2),
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "timeouts": self.timeouts,
+            "history": list(self.history)[-20:],
+        }
@@ -4,15 +4,37 @@ AutoGen 代理管理器
 
 import asyncio
 import logging
-from typing import AsyncGenerator, Optional, Dict, Any
+import time
+from typing import TYPE_CHECKING, AsyncGenerator, Callable, Optional, Dict, Any, List, Tuple
 from datetime import datetime
 
-from autogen_core.models import UserMessage, SystemMessage
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.messages import ModelClientStreamingChunkEvent
-
+import tracing
 from config import Config
+from agent_pool import AgentPool
+from response_cache import ResponseCache
+from near_dup import NearKey, SimHashIndex
+from stream_broadcast import StreamBroadcaster
+from sessions import ASSISTANT, Session, SessionMessage, SessionNotFound, SessionStore
+from shared_state import SharedStore
+from health_probe import ReadinessProbe
+from upstream_pool import UpstreamConnectionPool
+from upstream_router import CircuitBreaker, UpstreamEndpoint, UpstreamRouter
+from hedging import Hedger
+from aimd import AIMDLimiter
+from deadlines import REASONS as DEADLINE_REASONS, TOTAL_TIMEOUT, DeadlineExceeded, Deadlines, enforce as enforce_deadlines
+from metrics import (
+    COMPLETION_DURATION, DEADLINE_EXCEEDED, ERRORS, IN_FLIGHT, STREAM_ABORTED, STREAM_CHARS, STREAM_CHARS_PER_SECOND,
+    STREAM_CHUNKS, STREAM_CHUNKS_PER_SECOND, STREAM_DURATION, STREAM_INTER_CHUNK, STREAM_TTFT,
+    TOKENS_SAVED, UPSTREAM_CANCELLED
+)
+from tokens import estimate_tokens
+
+# autogen 各包导入耗时较长，推迟到首次使用时导入：模型客户端在 startup() 中创建，
+# AssistantAgent 只在 STREAM_USE_AGENT 或代理池路径上才会加载
+if TYPE_CHECKING:
+    from autogen_agentchat.agents import AssistantAgent
+    from autogen_core.models import LLMMessage
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
 
 # 配置日志
 logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL), format=Config.LOG_FORMAT)
@@ -23,16 +45,61 @@ class AutoGenManager:
     
     def __init__(self):
         self.model_client = None
-        self.agents: Dict[str, AssistantAgent] = {}
-        self._initialize_model_client()
+        self.router = UpstreamRouter()
+        self.hedger = Hedger(**Config.get_hedge_config())
+        self.connection_pool = UpstreamConnectionPool(**Config.get_upstream_pool_config())
+        self.agent_pool = AgentPool(**Config.get_agent_pool_config())
+        # 多 worker 部署时跨进程共享的缓存与快照存储
+        self.shared_state: Optional[SharedStore] = None
+        if Config.SHARED_STATE_ENABLED:
+            self.shared_state = SharedStore(**Config.get_shared_state_config())
+        self.response_cache: Optional[ResponseCache] = None
+        if Config.RESPONSE_CACHE_ENABLED:
+            index = SimHashIndex(**Config.get_near_dup_config()) if Config.NEAR_DUP_CACHE_ENABLED else None
+            self.response_cache = ResponseCache(
+                **Config.get_response_cache_config(), index=index, shared=self.shared_state
+            )
+        self.broadcaster: Optional[StreamBroadcaster] = None
+        if Config.STREAM_BROADCAST_ENABLED or Config.STREAM_RESUME_ENABLED:
+            self.broadcaster = StreamBroadcaster(**Config.get_stream_broadcast_config())
+        self.sessions: Optional[SessionStore] = None
+        if Config.SESSIONS_ENABLED:
+            self.sessions = SessionStore(**Config.get_session_config())
+        self.readiness = ReadinessProbe(self._probe_upstream, **Config.get_health_probe_config())
+        # 客户端断开统计
+        self.aborted_streams = 0
+        self.cancelled_upstreams = 0
+        self.tokens_before_cancel = 0
+        self.tokens_saved = 0
+        self._avg_stream_tokens: Optional[float] = None
     
     def _initialize_model_client(self):
-        """初始化模型客户端"""
+        """为每个上游初始化模型客户端"""
+        from autogen_ext.models.openai import OpenAIChatCompletionClient
+        
         try:
-            self.model_client = OpenAIChatCompletionClient(
-                **Config.get_model_config()
-            )
-            logger.info(f"Model client initialized with model: {Config.MODEL_NAME}")
+            for endpoint_config in Config.get_upstream_endpoints():
+                model_client = OpenAIChatCompletionClient(
+                    **{
+                        **Config.get_model_config(),
+                        "model": endpoint_config["model"],
+                        "base_url": endpoint_config["base_url"],
+                        "api_key": endpoint_config["api_key"]
+                    },
+                    http_client=self.connection_pool.client,
+                    timeout=self.connection_pool.timeout
+                )
+                self.router.add_endpoint(UpstreamEndpoint(
+                    model_client=model_client,
+                    breaker=CircuitBreaker(**Config.get_circuit_breaker_config()),
+                    limiter=AIMDLimiter(**Config.get_aimd_config()) if Config.AIMD_ENABLED else None,
+                    **endpoint_config
+                ))
+                self.connection_pool.register_target(endpoint_config["base_url"], endpoint_config["api_key"])
+                logger.info(f"Model client initialized: {endpoint_config['name']} ({endpoint_config['model']})")
+            
+            # 兼容单客户端用法
+            self.model_client = self.router.endpoints[0].model_client
         except Exception as e:
             logger.error(f"Failed to initialize model client: {e}")
             raise
@@ -40,23 +107,22 @@ class AutoGenManager:
     def create_agent(self, 
                     name: str = "chat_assistant",
                     system_message: Optional[str] = None,
-                    enable_stream: bool = True) -> AssistantAgent:
+                    enable_stream: bool = True,
+                    model_client: Optional["OpenAIChatCompletionClient"] = None) -> "AssistantAgent":
         """创建AutoGen代理"""
+        from autogen_agentchat.agents import AssistantAgent
+        
         if not system_message:
             system_message = Config.DEFAULT_SYSTEM_MESSAGE
         
         try:
             agent = AssistantAgent(
                 name=name,
-                model_client=self.model_client,
+                model_client=model_client or self.model_client,
                 system_message=system_message,
                 model_client_stream=enable_stream
             )
             
-            # 缓存代理
-            agent_key = f"{name}_{hash(system_message)}"
-            self.agents[agent_key] = agent
-            
             logger.info(f"Created agent: {name}")
             return agent
             
@@ -64,62 +130,315 @@ class AutoGenManager:
             logger.error(f"Failed to create agent {name}: {e}")
             raise
     
-    def get_or_create_agent(self, 
-                           name: str = "chat_assistant",
-                           system_message: Optional[str] = None) -> AssistantAgent:
-        """获取或创建代理"""
+    @staticmethod
+    def _agent_key(name: str, system_message: str, endpoint_name: str = "") -> str:
+        """代理池键"""
+        return f"{endpoint_name}_{name}_{hash(system_message)}"
+    
+    def acquire_agent(self, 
+                      name: str = "chat_assistant",
+                      system_message: Optional[str] = None,
+                      endpoint: Optional[UpstreamEndpoint] = None) -> Tuple[str, "AssistantAgent"]:
+        """从代理池借出绑定到指定上游的代理，返回 (池键, 代理)"""
         if not system_message:
             system_message = Config.DEFAULT_SYSTEM_MESSAGE
-            
-        agent_key = f"{name}_{hash(system_message)}"
+        if endpoint is None:
+            endpoint = self.router.endpoints[0]
         
-        if agent_key in self.agents:
-            return self.agents[agent_key]
+        agent_key = self._agent_key(name, system_message, endpoint.name)
+        agent = self.agent_pool.acquire(
+            agent_key,
+            lambda: self.create_agent(name, system_message, model_client=endpoint.model_client)
+        )
+        return agent_key, agent
+    
+    async def release_agent(self, agent_key: str, agent: "AssistantAgent", reusable: bool = True):
+        """重置代理上下文后归还代理池"""
+        from autogen_core import CancellationToken
         
-        return self.create_agent(name, system_message)
+        if reusable:
+            try:
+                await agent.on_reset(CancellationToken())
+            except Exception as e:
+                logger.warning(f"Failed to reset agent, discarding it: {e}")
+                reusable = False
+        self.agent_pool.release(agent_key, agent, reusable)
+    
+    @staticmethod
+    def _build_messages(message: str, 
+                        system_message: Optional[str] = None,
+                        history: Optional[List["LLMMessage"]] = None) -> List["LLMMessage"]:
+        """构建模型消息列表：系统消息、会话历史（可选）、本轮消息"""
+        from autogen_core.models import SystemMessage, UserMessage
+        
+        if not system_message:
+            system_message = Config.DEFAULT_SYSTEM_MESSAGE
+        
+        return [
+            SystemMessage(content=system_message),
+            *(history or []),
+            UserMessage(content=message, source="user")
+        ]
+    
+    async def _session_context(self, 
+                               session_id: str, 
+                               message: str) -> Tuple[Session, str, List["LLMMessage"]]:
+        """加载会话并组装本轮上下文，返回 (会话, 会话的系统消息, 历史消息)
+        
+        会话的系统消息在创建时确定，之后的请求沿用它以保持上下文前缀稳定。
+        会话不存在时抛出 SessionNotFound（会话只能通过 POST /sessions 创建）。
+        """
+        from autogen_core.models import AssistantMessage, SystemMessage, UserMessage
+        
+        if self.sessions is None:
+            raise RuntimeError("会话功能未开启")
+        session = await self.sessions.get(session_id)
+        if session is None:
+            raise SessionNotFound(f"会话 {session_id} 不存在或已过期")
+        window = await self.sessions.fit_window(
+            session,
+            message,
+            Config.SESSION_CONTEXT_BUDGET,
+            Config.SESSION_TRIM_TARGET,
+            self._summarize if Config.SESSION_SUMMARIZE else None
+        )
+        history: List["LLMMessage"] = []
+        if session.summary:
+            history.append(SystemMessage(content=f"之前对话的摘要：{session.summary}"))
+        for item in window:
+            if item.role == ASSISTANT:
+                history.append(AssistantMessage(content=item.content, source="assistant"))
+            else:
+                history.append(UserMessage(content=item.content, source="user"))
+        return session, session.system_message, history
+    
+    async def _summarize(self, summary: str, dropped: List[SessionMessage]) -> str:
+        """把移出上下文窗口的消息并入摘要"""
+        transcript = "\n".join(f"{m.role}: {m.content}" for m in dropped)
+        prompt = (
+            f"已有摘要：{summary or '（无）'}\n\n新的对话内容：\n{transcript}\n\n"
+            f"请把新的对话内容并入摘要，保留事实、结论和用户偏好，不超过 {Config.SESSION_SUMMARY_MAX_TOKENS} 字。"
+        )
+        chunks = await self._complete(prompt, "你负责为对话生成简洁的摘要。")
+        return "".join(chunks).strip()
+    
+    @staticmethod
+    def _request_key(message: str, system_message: Optional[str]) -> str:
+        """请求键：用于响应缓存和流式广播"""
+        return ResponseCache.make_key(Config.MODEL_NAME, system_message or Config.DEFAULT_SYSTEM_MESSAGE, message)
+    
+    def _near_key(self, message: str, system_message: Optional[str]) -> Optional[NearKey]:
+        """近似匹配参数：同一模型和系统消息下才可复用，阈值按系统消息配置"""
+        if self.response_cache is None or self.response_cache.index is None:
+            return None
+        system_message = system_message or Config.DEFAULT_SYSTEM_MESSAGE
+        threshold = Config.get_near_dup_threshold(system_message)
+        if threshold >= 1.0:
+            return None
+        fingerprint = self.response_cache.index.fingerprint(message)
+        if fingerprint is None:
+            return None
+        namespace = ResponseCache.make_key(Config.MODEL_NAME, system_message, "")
+        return NearKey(namespace, fingerprint, threshold)
+    
+    async def _complete(self, 
+                        message: str, 
+                        system_message: Optional[str] = None,
+                        hedge: bool = False,
+                        history: Optional[List["LLMMessage"]] = None) -> List[str]:
+        """经路由调用上游完成一次非流式请求，失败时透明转移
+        
+        开启对冲时改用流式请求拼接结果，以便按首个 token 的到达时间对冲。
+        """
+        if hedge:
+            return [
+                chunk async for chunk in self._upstream_stream(message, system_message, hedge=True, history=history)
+            ]
+        
+        messages = self._build_messages(message, system_message, history)
+        
+        async def call(endpoint: UpstreamEndpoint) -> List[str]:
+            with tracing.span("upstream_call", endpoint=endpoint.name):
+                result = await endpoint.model_client.create(messages)
+            return [result.content]
+        
+        return await self.router.call(call)
+    
+    async def _complete_within(self, 
+                               message: str, 
+                               system_message: Optional[str],
+                               hedge: bool,
+                               timeout: float,
+                               history: Optional[List["LLMMessage"]] = None) -> List[str]:
+        """在整体预算内完成请求，超时取消上游调用"""
+        try:
+            return await asyncio.wait_for(self._complete(message, system_message, hedge, history), timeout=timeout)
+        except asyncio.TimeoutError:
+            DEADLINE_EXCEEDED.inc(1, TOTAL_TIMEOUT)
+            raise DeadlineExceeded(TOTAL_TIMEOUT, timeout) from None
+    
+    @staticmethod
+    def resolve_deadlines(first_token: Optional[float] = None,
+                          idle: Optional[float] = None,
+                          total: Optional[float] = None) -> Deadlines:
+        """请求指定的截止时间，缺省使用 Config.STREAM_TIMEOUT / STREAM_TOTAL_TIMEOUT"""
+        return Deadlines.resolve(Config.get_deadline_config(), Config.STREAM_MAX_TIMEOUT, first_token, idle, total)
     
     async def chat_completion(self, 
                              message: str, 
-                             system_message: Optional[str] = None) -> str:
-        """非流式聊天完成"""
+                             system_message: Optional[str] = None,
+                             use_cache: bool = True,
+                             hedge: Optional[bool] = None,
+                             deadlines: Optional[Deadlines] = None,
+                             session_id: Optional[str] = None) -> str:
+        """非流式聊天完成，超过整体预算时抛出 DeadlineExceeded
+        
+        指定 session_id 时带上服务端保存的会话历史，完成后把本轮问答追加到会话；
+        会话请求的上下文各不相同，不使用响应缓存。
+        """
+        if hedge is None:
+            hedge = Config.HEDGE_ENABLED
+        if deadlines is None:
+            deadlines = self.resolve_deadlines()
+        
+        started = time.perf_counter()
+        IN_FLIGHT.inc(1, "completion")
         try:
-            if not system_message:
-                system_message = Config.DEFAULT_SYSTEM_MESSAGE
+            if session_id is not None:
+                session, system_message, history = await self._session_context(session_id, message)
+                chunks = await self._complete_within(message, system_message, hedge, deadlines.total, history)
+                await self.sessions.append_turn(session, message, "".join(chunks))
+            elif use_cache and self.response_cache is not None:
+                chunks = await self.response_cache.get_or_compute(
+                    self._request_key(message, system_message),
+                    lambda: self._complete_within(message, system_message, hedge, deadlines.total),
+                    self._near_key(message, system_message)
+                )
+            else:
+                chunks = await self._complete_within(message, system_message, hedge, deadlines.total)
             
-            messages = [
-                SystemMessage(content=system_message),
-                UserMessage(content=message, source="user")
-            ]
-            
-            result = await self.model_client.create(messages)
             logger.info(f"Chat completion successful for message: {message[:50]}...")
-            return result.content
+            return "".join(chunks)
             
         except Exception as e:
+            ERRORS.inc(1, "completion", type(e).__name__)
             logger.error(f"Chat completion failed: {e}")
             raise
+        finally:
+            IN_FLIGHT.dec(1, "completion")
+            COMPLETION_DURATION.observe(time.perf_counter() - started)
     
-    async def chat_stream(self, 
+    async def _model_stream(self, 
+                            endpoint: UpstreamEndpoint,
+                            message: str, 
+                            system_message: Optional[str] = None,
+                            history: Optional[List["LLMMessage"]] = None) -> AsyncGenerator[str, None]:
+        """无状态流式：每次请求使用全新的消息列表，会话历史由调用方显式传入"""
+        messages = self._build_messages(message, system_message, history)
+        tracing.event("upstream_request", endpoint=endpoint.name)
+        
+        stream = endpoint.model_client.create_stream(messages)
+        try:
+            async for item in stream:
+                # create_stream 先产出文本片段，最后产出一个 CreateResult
+                if isinstance(item, str) and item:
+                    yield item
+        finally:
+            # 提前关闭时立即关闭上游 HTTP 响应
+            await stream.aclose()
+    
+    async def _agent_stream(self, 
+                            endpoint: UpstreamEndpoint,
+                            message: str, 
+                            system_message: Optional[str] = None,
+                            agent_name: str = "chat_assistant") -> AsyncGenerator[str, None]:
+        """通过代理池中的 AssistantAgent 流式生成"""
+        from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+        
+        with tracing.span("agent_acquire", endpoint=endpoint.name):
+            agent_key, agent = self.acquire_agent(agent_name, system_message, endpoint)
+        reusable = False
+        stream = agent.run_stream(task=message)
+        try:
+            async for chunk in stream:
+                if isinstance(chunk, ModelClientStreamingChunkEvent) and chunk.content:
+                    yield chunk.content
+            
+            # 上游已完整结束，代理可以重置后复用
+            reusable = True
+        finally:
+            await stream.aclose()
+            await self.release_agent(agent_key, agent, reusable)
+    
+    def _upstream_stream(self, 
                          message: str, 
                          system_message: Optional[str] = None,
-                         agent_name: str = "chat_assistant") -> AsyncGenerator[Dict[str, Any], None]:
-        """流式聊天"""
+                         agent_name: str = "chat_assistant",
+                         use_agent: bool = False,
+                         hedge: bool = False,
+                         history: Optional[List["LLMMessage"]] = None) -> AsyncGenerator[str, None]:
+        """上游文本流：经路由选择上游（首个片段前失败可转移），可选对冲
+        
+        带会话历史时总是走 model_client 路径（AssistantAgent 维护自己的上下文）。
+        """
+        def open_stream() -> AsyncGenerator[str, None]:
+            if use_agent and history is None:
+                return self.router.stream(
+                    lambda endpoint: self._agent_stream(endpoint, message, system_message, agent_name)
+                )
+            return self.router.stream(
+                lambda endpoint: self._model_stream(endpoint, message, system_message, history)
+            )
+        
+        return self.hedger.stream(open_stream, enabled=hedge)
+    
+    @staticmethod
+    async def _replay(chunks: List[str]) -> AsyncGenerator[Dict[str, Any], None]:
+        """回放缓存的响应片段"""
+        for chunk in chunks:
+            yield {
+                "type": "content",
+                "content": chunk
+            }
+        yield {
+            "type": "end",
+            "content": "",
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def _produce_stream(self, 
+                              message: str, 
+                              system_message: Optional[str],
+                              agent_name: str,
+                              use_agent: bool,
+                              hedge: bool,
+                              cache_key: Optional[str],
+                              near: Optional[NearKey] = None,
+                              session: Optional[Session] = None,
+                              history: Optional[List["LLMMessage"]] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """调用上游生成事件流，完整结束后写入响应缓存或追加到会话"""
+        collected: List[str] = []
+        result_stream = None
+        completed = False
         try:
-            agent = self.get_or_create_agent(agent_name, system_message)
-            
-            logger.info(f"Starting stream chat for message: {message[:50]}...")
+            logger.info(f"Starting stream chat for message: {message[:50]}... (agent={use_agent})")
             
             # 获取流式结果
-            result_stream = agent.run_stream(task=message)
+            result_stream = self._upstream_stream(message, system_message, agent_name, use_agent, hedge, history)
+            
+            async for content in result_stream:
+                collected.append(content)
+                yield {
+                    "type": "content",
+                    "content": content
+                }
             
-            async for chunk in result_stream:
-                if isinstance(chunk, ModelClientStreamingChunkEvent):
-                    if chunk.content:
-                        yield {
-                            "type": "content",
-                            "content": chunk.content,
-                            "timestamp": datetime.now().isoformat()
-                        }
+            if cache_key is not None:
+                self.response_cache.put(cache_key, collected, near)
+            if session is not None:
+                await self.sessions.append_turn(session, message, "".join(collected))
+            self._record_stream_tokens(collected)
+            completed = True
             
             # 发送结束信号
             yield {
@@ -130,20 +449,204 @@ class AutoGenManager:
             
             logger.info("Stream chat completed successfully")
             
+        except (asyncio.CancelledError, GeneratorExit):
+            # 所有订阅者都已断开：上游生成随之取消
+            if not completed:
+                self._record_upstream_cancelled(collected)
+            raise
         except Exception as e:
+            ERRORS.inc(1, "stream", type(e).__name__)
             logger.error(f"Stream chat failed: {e}")
             yield {
                 "type": "error",
                 "content": f"流式聊天出错: {str(e)}",
                 "timestamp": datetime.now().isoformat()
             }
+        finally:
+            if result_stream is not None:
+                await result_stream.aclose()
+    
+    def _record_stream_tokens(self, collected: List[str]):
+        """记录完整生成的流的 token 数，用于估算取消节省的 token"""
+        tokens = estimate_tokens("".join(collected))
+        if self._avg_stream_tokens is None:
+            self._avg_stream_tokens = float(tokens)
+        else:
+            self._avg_stream_tokens += 0.1 * (tokens - self._avg_stream_tokens)
+    
+    def _record_upstream_cancelled(self, collected: List[str]):
+        """上游生成被取消：按完整流的平均长度估算节省的 token"""
+        produced = estimate_tokens("".join(collected))
+        saved = max(int(self._avg_stream_tokens or 0) - produced, 0)
+        self.cancelled_upstreams += 1
+        self.tokens_before_cancel += produced
+        self.tokens_saved += saved
+        UPSTREAM_CANCELLED.inc()
+        TOKENS_SAVED.inc(saved)
+        logger.info(f"Upstream stream cancelled after ~{produced} tokens, ~{saved} tokens saved")
+    
+    async def chat_stream(self, 
+                         message: str, 
+                         system_message: Optional[str] = None,
+                         agent_name: str = "chat_assistant",
+                         use_agent: Optional[bool] = None,
+                         use_cache: bool = True,
+                         hedge: Optional[bool] = None,
+                         deadlines: Optional[Deadlines] = None,
+                         session_id: Optional[str] = None,
+                         hold: Optional[Callable[[], Callable[[], None]]] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """流式聊天
+        
+        默认走无状态的 model_client.create_stream 快速路径；
+        use_agent=True 时改用 AssistantAgent.run_stream。
+        命中响应缓存（含开启时的近似重复命中）时直接回放缓存的片段；相同请求并发时共享同一个上游流。
+        hedge=True 时首个 token 超过对冲延迟仍未到达会再发一个相同请求。
+        超过首个片段、片段间隔或整体截止时间时取消上游并以带 reason 的 error 事件结束。
+        指定 session_id 时带上会话历史，完整结束后追加到会话（不使用响应缓存，也不与其他请求共享上游）。
+        hold 为准入凭证的 hold：本请求创建的广播上游在客户端断开后继续生成时，仍占用其准入名额。
+        """
+        if use_agent is None:
+            use_agent = Config.STREAM_USE_AGENT
+        if hedge is None:
+            hedge = Config.HEDGE_ENABLED
+        if deadlines is None:
+            deadlines = self.resolve_deadlines()
+        
+        session = None
+        history = None
+        if session_id is not None:
+            session, system_message, history = await self._session_context(session_id, message)
+            use_cache = False
+        
+        request_key = self._request_key(message, system_message)
+        cache_key = None
+        near = None
+        if use_cache and self.response_cache is not None:
+            near = self._near_key(message, system_message)
+            cached = await self.response_cache.get(request_key, near)
+            if cached is not None:
+                logger.info(f"Replaying cached stream for message: {message[:50]}...")
+                tracing.event("cache_hit")
+                async for event in self._replay(cached):
+                    yield event
+                return
+            cache_key = request_key
+        
+        def source() -> AsyncGenerator[Dict[str, Any], None]:
+            return self._produce_stream(
+                message, system_message, agent_name, use_agent, hedge, cache_key, near, session, history
+            )
+        
+        if self.broadcaster is not None:
+            # 经广播器的流带事件 ID，可续传；只有允许缓存时才与相同请求共享上游，
+            # 代理路径与快速路径生成方式不同，不互相加入
+            shared = use_cache and Config.STREAM_BROADCAST_ENABLED
+            broadcast_key = f"{request_key}:{'agent' if use_agent else 'direct'}"
+            events = self.broadcaster.subscribe(broadcast_key if shared else None, source, hold)
+        else:
+            events = source()
+        
+        async for event in self._deliver(events, deadlines):
+            yield event
+    
+    def resume_stream(self, 
+                      last_event_id: str,
+                      deadlines: Optional[Deadlines] = None) -> Optional[AsyncGenerator[Dict[str, Any], None]]:
+        """按 Last-Event-ID 续传仍在生成或刚结束的流，不再调用上游；无法续传时返回 None"""
+        if self.broadcaster is None or not Config.STREAM_RESUME_ENABLED:
+            return None
+        events = self.broadcaster.resume(last_event_id)
+        if events is None:
+            return None
+        return self._deliver(events, deadlines or self.resolve_deadlines())
+    
+    async def _deliver(self, 
+                       events: AsyncGenerator[Dict[str, Any], None],
+                       deadlines: Deadlines) -> AsyncGenerator[Dict[str, Any], None]:
+        """施加截止时间并记录指标"""
+        # 截止时间按订阅者各自计算：超时只断开本请求，共享上游的其他订阅者不受影响
+        observed = self._observe_stream(enforce_deadlines(events, deadlines))
+        deadline_exceeded = False
+        try:
+            async for event in observed:
+                if event["type"] == "error" and event.get("reason") in DEADLINE_REASONS:
+                    deadline_exceeded = True
+                yield event
+        finally:
+            await observed.aclose()
+            if deadline_exceeded and self.broadcaster is not None:
+                # 超时不是断线，不会续传：不等续传窗口，立即取消上游并释放并发名额与连接
+                self.broadcaster.abandon(events)
+    
+    async def _observe_stream(self, events: AsyncGenerator[Dict[str, Any], None]) -> AsyncGenerator[Dict[str, Any], None]:
+        """记录流式延迟指标：每个片段只做几次浮点运算和一次直方图 observe"""
+        started = time.perf_counter()
+        last = 0.0
+        chunks = 0
+        chars = 0
+        finished = False
+        IN_FLIGHT.inc(1, "stream")
+        try:
+            async for event in events:
+                if event["type"] != "content":
+                    finished = True
+                else:
+                    now = time.perf_counter()
+                    if chunks:
+                        STREAM_INTER_CHUNK.observe(now - last)
+                    else:
+                        STREAM_TTFT.observe(now - started)
+                        tracing.event("first_chunk")
+                    last = now
+                    chunks += 1
+                    chars += len(event["content"])
+                yield event
+        finally:
+            await events.aclose()
+            IN_FLIGHT.dec(1, "stream")
+            if not finished:
+                # 没收到 end/error 就被关闭：客户端已断开
+                self.aborted_streams += 1
+                STREAM_ABORTED.inc()
+            elapsed = time.perf_counter() - started
+            STREAM_DURATION.observe(elapsed)
+            if chunks:
+                STREAM_CHUNKS.inc(chunks)
+                STREAM_CHARS.inc(chars)
+                if elapsed > 0:
+                    STREAM_CHUNKS_PER_SECOND.observe(chunks / elapsed)
+                    STREAM_CHARS_PER_SECOND.observe(chars / elapsed)
+    
+    async def startup(self):
+        """应用启动时调用：创建模型客户端，启动连接预热与其他后台任务"""
+        if self.model_client is None:
+            self._initialize_model_client()
+        await self.connection_pool.start()
+        self.readiness.start()
+        if self.sessions is not None:
+            self.sessions.start()
+    
+    async def shutdown(self):
+        """应用关闭时调用：停止后台任务并关闭上游连接"""
+        await self.readiness.stop()
+        await self.connection_pool.close()
+        if self.sessions is not None:
+            await self.sessions.stop()
+        if self.shared_state is not None:
+            self.shared_state.close()
+    
+    async def _probe_upstream(self):
+        """就绪探测：经连接池请求各上游的 GET /models，不调用模型、不消耗 token"""
+        await self.connection_pool.check()
     
     async def health_check(self) -> Dict[str, Any]:
-        """健康检查"""
+        """深度健康检查：每次调用都会请求模型"""
         try:
             # 简单的健康检查 - 发送一个测试消息
             test_message = "Hello"
-            result = await self.chat_completion(test_message, "You are a helpful assistant. Reply with 'OK'.")
+            result = await self.chat_completion(
+                test_message, "You are a helpful assistant. Reply with 'OK'.", use_cache=False
+            )
             
             return {
                 "status": "healthy",
@@ -162,12 +665,51 @@ class AutoGenManager:
     
     def clear_agents_cache(self):
         """清空代理缓存"""
-        self.agents.clear()
+        self.agent_pool.clear()
         logger.info("Agents cache cleared")
     
-    def get_agent_count(self) -> int:
-        """获取缓存的代理数量"""
-        return len(self.agents)
+    def get_agent_pool_stats(self) -> Dict[str, Any]:
+        """获取代理池统计信息"""
+        return self.agent_pool.stats()
+    
+    def get_router_stats(self) -> Dict[str, Any]:
+        """获取上游路由统计信息"""
+        return self.router.stats()
+    
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """获取对冲统计信息"""
+        return {"enabled": Config.HEDGE_ENABLED, **self.hedger.stats()}
+    
+    def get_upstream_pool_stats(self) -> Dict[str, Any]:
+        """获取上游连接池统计信息"""
+        return self.connection_pool.stats()
+    
+    def get_broadcast_stats(self) -> Dict[str, Any]:
+        """获取流式广播统计信息"""
+        if self.broadcaster is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.broadcaster.stats()}
+    
+    def get_abort_stats(self) -> Dict[str, Any]:
+        """客户端断开与上游取消统计"""
+        return {
+            "aborted_streams": self.aborted_streams,
+            "cancelled_upstreams": self.cancelled_upstreams,
+            "tokens_before_cancel": self.tokens_before_cancel,
+            "estimated_tokens_saved": self.tokens_saved,
+        }
+    
+    def get_session_stats(self) -> Dict[str, Any]:
+        """获取会话统计信息"""
+        if self.sessions is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.sessions.stats()}
+    
+    def get_response_cache_stats(self) -> Dict[str, Any]:
+        """获取响应缓存统计信息"""
+        if self.response_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.response_cache.stats()}
 
 # 全局AutoGen管理器实例
 autogen_manager = AutoGenManager()
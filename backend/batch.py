@@ -0,0 +1,333 @@
+"""
+批量聊天：增量解析请求体、有界并行执行、按完成顺序输出 NDJSON
+"""
+
+import asyncio
+import codecs
+import json
+import logging
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+import anyio
+from starlette.requests import ClientDisconnect, Request
+from starlette.types import Receive, Scope, Send
+
+import sse
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = " \t\r\n"
+
+
+class BatchParseError(ValueError):
+    """请求体不是合法的 JSON 数组或 NDJSON"""
+
+
+class IncrementalItemParser:
+    """请求体增量解析器
+
+    根据第一个非空白字符判断格式：`[` 为 JSON 数组，否则按 NDJSON（每行一个 JSON 值）解析。
+    每次 feed 返回已完整到达的元素，单个元素超过 max_item_bytes 时报错，
+    因此内存占用只与单个元素大小有关，与请求体总大小无关。
+    """
+
+    def __init__(self, max_item_bytes: int = 1024 * 1024):
+        self.max_item_bytes = max_item_bytes
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._mode: Optional[str] = None
+        # 数组模式的状态：value_or_end（刚读到 `[`）、value（刚读到 `,`）、sep_or_end、done
+        self._state = "value_or_end"
+        self._line = 0
+        # 解析出错前已完整到达的元素照常返回，错误记录在这里
+        self.error: Optional[BatchParseError] = None
+
+    def feed(self, data: bytes, final: bool = False) -> List[Any]:
+        """追加数据，返回新解析出的元素；final=True 表示请求体已结束"""
+        items: List[Any] = []
+        if self.error is not None:
+            return items
+        try:
+            self._buffer += self._text.decode(data, final)
+            while self._parse_one(items, final):
+                pass
+            if final and self._mode == "array" and self._state != "done":
+                raise BatchParseError("JSON 数组不完整")
+        except UnicodeDecodeError as e:
+            self.error = BatchParseError(f"请求体不是合法的 UTF-8: {e}")
+        except BatchParseError as e:
+            self.error = e
+        # 丢弃已消费的部分
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        return items
+
+    def _skip_whitespace(self):
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+
+    def _check_item_size(self):
+        if len(self._buffer) - self._pos > self.max_item_bytes:
+            raise BatchParseError(f"单个元素超过 {self.max_item_bytes} 字节")
+
+    def _parse_one(self, items: List[Any], final: bool) -> bool:
+        """尝试解析下一个元素或分隔符，数据不足时返回 False"""
+        if self._mode != "ndjson":
+            self._skip_whitespace()
+        if self._pos >= len(self._buffer):
+            return False
+
+        if self._mode is None:
+            if self._buffer[self._pos] == "[":
+                self._mode = "array"
+                self._pos += 1
+            else:
+                self._mode = "ndjson"
+            return True
+
+        if self._mode == "ndjson":
+            end = self._buffer.find("\n", self._pos)
+            if end < 0:
+                if not final:
+                    self._check_item_size()
+                    return False
+                end = len(self._buffer)
+            line = self._buffer[self._pos:end].strip()
+            self._pos = end + 1
+            self._line += 1
+            if line:
+                try:
+                    items.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise BatchParseError(f"第 {self._line} 行不是合法的 JSON: {e}") from None
+            return True
+
+        char = self._buffer[self._pos]
+        if self._state == "done":
+            raise BatchParseError("JSON 数组之后有多余内容")
+        if self._state in ("value_or_end", "sep_or_end") and char == "]":
+            self._pos += 1
+            self._state = "done"
+            return True
+        if self._state == "sep_or_end":
+            if char != ",":
+                raise BatchParseError(f"JSON 数组元素之间缺少逗号（位置 {self._pos}）")
+            self._pos += 1
+            self._state = "value"
+            return True
+        try:
+            item, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise BatchParseError(f"JSON 数组元素不合法: {e}") from None
+            self._check_item_size()
+            return False
+        if end == len(self._buffer) and not final:
+            # 末尾的数字等可能被截断，等后续数据确认元素已结束
+            return False
+        items.append(item)
+        self._pos = end
+        self._state = "sep_or_end"
+        return True
+
+
+async def read_body(request: Request, body_done: asyncio.Event) -> AsyncGenerator[bytes, None]:
+    """逐块读取请求体
+
+    收到最后一块时立即置位 body_done（而不是等它被解析完），以便尽早开始监听客户端断开。
+    """
+    try:
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                raise ClientDisconnect()
+            more_body = message.get("more_body", False)
+            if not more_body:
+                body_done.set()
+            if message.get("body"):
+                yield message["body"]
+            if not more_body:
+                break
+    finally:
+        body_done.set()
+
+
+async def iter_items(chunks: AsyncIterator[bytes],
+                     max_items: int,
+                     max_item_bytes: int) -> AsyncGenerator[Any, None]:
+    """边读请求体边产出元素"""
+    parser = IncrementalItemParser(max_item_bytes)
+    count = 0
+    final = False
+    iterator = chunks.__aiter__()
+    try:
+        while not final:
+            try:
+                data = await iterator.__anext__()
+            except StopAsyncIteration:
+                data, final = b"", True
+            for item in parser.feed(data, final):
+                count += 1
+                if count > max_items:
+                    raise BatchParseError(f"批量请求最多 {max_items} 项")
+                yield item
+            if parser.error is not None:
+                raise parser.error
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class BatchRunner:
+    """批量任务执行器
+
+    - 每个批次最多 concurrency 项同时执行，读取请求体也随之受背压控制
+    - 结果按完成顺序产出并带上元素序号，单项失败只影响该项
+    - 结果发送后才释放并行名额，客户端读得慢时不会无限堆积结果
+    - 请求体解析失败时，已开始的项仍会返回结果，最后输出一行 `{"error": ...}`
+    """
+
+    def __init__(self, default_concurrency: int = 4, max_concurrency: int = 16):
+        self.default_concurrency = default_concurrency
+        self.max_concurrency = max_concurrency
+        self.active = 0
+        self.batches = 0
+        self.items = 0
+        self.failed_items = 0
+        self.parse_errors = 0
+
+    def resolve_concurrency(self, concurrency: Optional[int]) -> int:
+        """请求指定的并行度，限制在 [1, max_concurrency] 内"""
+        if concurrency is None or concurrency <= 0:
+            concurrency = self.default_concurrency
+        return min(concurrency, self.max_concurrency)
+
+    async def run(self,
+                  items: AsyncIterator[Any],
+                  handle: Callable[[Any], Awaitable[Any]],
+                  concurrency: int) -> AsyncGenerator[Dict[str, Any], None]:
+        """执行批次，产出 {"index", "status", "response"} 或 {"index", "status", "error"}
+
+        handle 抛出的异常可带 status_code 属性（默认 500）和 detail 属性（默认异常消息）。
+        """
+        results: "asyncio.Queue[Any]" = asyncio.Queue()
+        slots = asyncio.Semaphore(concurrency)
+        tasks: Set["asyncio.Task[None]"] = set()
+        done_marker = object()
+        summary: Dict[str, Any] = {"total": None, "error": None}
+
+        async def run_item(index: int, item: Any):
+            try:
+                result = {"index": index, "status": 200, "response": await handle(item)}
+            except Exception as e:
+                self.failed_items += 1
+                result = {
+                    "index": index,
+                    "status": getattr(e, "status_code", 500),
+                    "error": getattr(e, "detail", None) or str(e) or type(e).__name__
+                }
+            await results.put(result)
+
+        async def feed():
+            count = 0
+            iterator = items.__aiter__()
+            try:
+                async for item in iterator:
+                    await slots.acquire()
+                    task = asyncio.ensure_future(run_item(count, item))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    count += 1
+                    self.items += 1
+            except BatchParseError as e:
+                self.parse_errors += 1
+                summary["error"] = str(e)
+            finally:
+                summary["total"] = count
+                results.put_nowait(done_marker)
+                aclose = getattr(iterator, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+
+        self.batches += 1
+        self.active += 1
+        feeder = asyncio.ensure_future(feed())
+        sent = 0
+        try:
+            while summary["total"] is None or sent < summary["total"]:
+                result = await results.get()
+                if result is done_marker:
+                    continue
+                yield result
+                sent += 1
+                slots.release()
+            # 请求体读取失败（如客户端断开）时把异常抛给调用方
+            await feeder
+            if summary["error"] is not None:
+                yield {"error": summary["error"], "completed": sent}
+        finally:
+            self.active -= 1
+            pending = [feeder, *tasks]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """批量统计信息"""
+        return {
+            "active": self.active,
+            "batches": self.batches,
+            "items": self.items,
+            "failed_items": self.failed_items,
+            "parse_errors": self.parse_errors,
+            "default_concurrency": self.default_concurrency,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+async def encode_ndjson(results: AsyncIterator[Dict[str, Any]]) -> AsyncGenerator[bytes, None]:
+    """每个结果编码为一行 JSON"""
+    iterator = results.__aiter__()
+    try:
+        async for result in iterator:
+            yield sse.dumps(result) + b"\n"
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class NDJSONResponse(sse.SSEResponse):
+    """边读请求体边输出的 NDJSON 响应
+
+    StreamingResponse 会在发送的同时调用 receive() 监听断开，这会吞掉尚未读取的请求体；
+    这里等请求体读完（body_done 被置位）后才开始监听断开，读取期间的断开由 request.stream() 报告。
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, content: AsyncIterator[bytes], body_done: asyncio.Event, **kwargs):
+        super().__init__(content, **kwargs)
+        self.body_done = body_done
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async with anyio.create_task_group() as task_group:
+            async def stream():
+                await self.stream_response(send)
+                task_group.cancel_scope.cancel()
+
+            async def watch_disconnect():
+                await self.body_done.wait()
+                await self.listen_for_disconnect(receive)
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(stream)
+            task_group.start_soon(watch_disconnect)
+
+        if self.background is not None:
+            await self.background()
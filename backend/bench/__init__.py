@@ -0,0 +1,3 @@
+"""
+性能测试工具：本地模拟上游（mock_upstream）与异步压测（loadgen）
+"""
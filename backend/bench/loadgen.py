@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+异步压测：按阶梯并发驱动 /chat 与 /chat/stream，输出吞吐、延迟分位数与服务端资源占用
+
+    python -m bench.loadgen --url http://127.0.0.1:8000 --concurrency 1,8,32,64 --duration 20 \\
+        --output results.json --compare previous.json
+
+每个并发等级持续 --duration 秒，期间每个虚拟用户循环发送请求（默认 use_cache=false，避免命中响应缓存）。
+服务端 CPU 与 RSS 从 /proc 读取（仅 Linux）：进程号取 --server-pid，未指定时取 /stats 返回的 worker 进程号；
+进程的直接子进程（uvicorn 多 worker）一并计入。
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """线性插值分位数，输入需已排序"""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    """毫秒为单位的分布摘要"""
+    values = sorted(v * 1000 for v in values)
+    summary: Dict[str, Optional[float]] = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    summary["mean"] = sum(values) / len(values) if values else None
+    summary["max"] = values[-1] if values else None
+    return {k: round(v, 2) if v is not None else None for k, v in summary.items()}
+
+
+class ProcessSampler:
+    """周期读取 /proc 中的 CPU 时间与 RSS"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.available = os.path.exists(f"/proc/{pid}/stat")
+        self._ticks = os.sysconf("SC_CLK_TCK") if self.available else 100
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._cpu_start = 0.0
+        self._wall_start = 0.0
+        self.rss_samples: List[int] = []
+
+    def _pids(self) -> List[int]:
+        pids = [self.pid]
+        try:
+            with open(f"/proc/{self.pid}/task/{self.pid}/children") as f:
+                pids.extend(int(pid) for pid in f.read().split())
+        except OSError:
+            pass
+        return pids
+
+    def _cpu_seconds(self) -> float:
+        total = 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    # comm 字段可能含空格，从最后一个 ')' 之后开始按字段解析
+                    fields = f.read().rsplit(")", 1)[1].split()
+                total += int(fields[11]) + int(fields[12])  # utime + stime
+            except (OSError, IndexError, ValueError):
+                pass
+        return total / self._ticks
+
+    def _rss_bytes(self) -> int:
+        total = 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1]) * 1024
+                            break
+            except (OSError, ValueError):
+                pass
+        return total
+
+    async def _run(self):
+        while True:
+            self.rss_samples.append(self._rss_bytes())
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if not self.available:
+            return
+        self.rss_samples = []
+        self._cpu_start = self._cpu_seconds()
+        self._wall_start = time.perf_counter()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        if not self.available or self._task is None:
+            return {"available": False}
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        wall = time.perf_counter() - self._wall_start
+        cpu = self._cpu_seconds() - self._cpu_start
+        return {
+            "available": True,
+            "processes": len(self._pids()),
+            "cpu_percent": round(cpu / wall * 100, 1) if wall > 0 else None,
+            "rss_peak_mb": round(max(self.rss_samples, default=0) / 1024 / 1024, 1),
+            "rss_mean_mb": round(sum(self.rss_samples) / max(len(self.rss_samples), 1) / 1024 / 1024, 1),
+        }
+
+
+class StepResult:
+    """一个并发等级内所有请求的记录"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfts: List[float] = []
+        self.gaps: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.bytes = 0
+        self.chunks = 0
+
+    def record_status(self, status: Any):
+        key = str(status)
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+
+
+async def run_chat(client: httpx.AsyncClient, url: str, body: Dict[str, Any], result: StepResult):
+    started = time.perf_counter()
+    try:
+        response = await client.post(f"{url}/chat", json=body)
+    except httpx.HTTPError as e:
+        result.record_status(type(e).__name__)
+        return
+    result.record_status(response.status_code)
+    if response.status_code == 200:
+        result.latencies.append(time.perf_counter() - started)
+        result.bytes += len(response.content)
+
+
+async def run_stream(client: httpx.AsyncClient, url: str, body: Dict[str, Any], result: StepResult):
+    started = time.perf_counter()
+    first: Optional[float] = None
+    last: Optional[float] = None
+    status: Any = None
+    try:
+        async with client.stream("POST", f"{url}/chat/stream", json=body) as response:
+            status = response.status_code
+            if status != 200:
+                await response.aread()
+            else:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    now = time.perf_counter()
+                    event = json.loads(line[6:])
+                    if event.get("type") == "content":
+                        result.chunks += 1
+                        result.bytes += len(line)
+                        if first is None:
+                            first = now
+                            result.ttfts.append(now - started)
+                        else:
+                            result.gaps.append(now - last)
+                        last = now
+                    elif event.get("type") == "error":
+                        status = f"error:{event.get('reason') or 'stream'}"
+                    elif event.get("type") == "end":
+                        break
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    result.record_status(status)
+    if status == 200:
+        result.latencies.append(time.perf_counter() - started)
+
+
+async def run_step(url: str,
+                   endpoint: str,
+                   concurrency: int,
+                   duration: float,
+                   body: Dict[str, Any],
+                   timeout: float) -> StepResult:
+    """concurrency 个虚拟用户循环发送请求，持续 duration 秒"""
+    result = StepResult()
+    request = run_stream if endpoint == "stream" else run_chat
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def user(index: int):
+            sequence = 0
+            while time.perf_counter() < deadline:
+                # 每个请求的消息不同，避免被响应缓存或流式广播合并
+                message = f"{body['message']} [{index}-{sequence}]"
+                await request(client, url, {**body, "message": message}, result)
+                sequence += 1
+
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+    return result
+
+
+def summarize_step(endpoint: str, concurrency: int, wall: float, result: StepResult,
+                   server: Dict[str, Any]) -> Dict[str, Any]:
+    completed = len(result.latencies)
+    total = sum(result.statuses.values())
+    summary = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "duration_s": round(wall, 2),
+        "requests": total,
+        "completed": completed,
+        "error_rate": round(1 - completed / total, 4) if total else None,
+        "statuses": result.statuses,
+        "throughput_rps": round(completed / wall, 2) if wall > 0 else None,
+        "latency_ms": distribution(result.latencies),
+        "server": server,
+    }
+    if endpoint == "stream":
+        summary["ttft_ms"] = distribution(result.ttfts)
+        summary["inter_chunk_ms"] = distribution(result.gaps)
+        summary["chunks_per_second"] = round(result.chunks / wall, 1) if wall > 0 else None
+    return summary
+
+
+def print_step(step: Dict[str, Any]):
+    latency = step["latency_ms"]
+    line = (f"{step['endpoint']:<7}c={step['concurrency']:<5}{step['throughput_rps'] or 0:>9.1f} req/s"
+            f"  err {step['error_rate'] or 0:>6.1%}"
+            f"  p50 {latency['p50'] or 0:>8.1f}  p95 {latency['p95'] or 0:>8.1f}  p99 {latency['p99'] or 0:>8.1f} ms")
+    if step["endpoint"] == "stream":
+        ttft, gaps = step["ttft_ms"], step["inter_chunk_ms"]
+        line += (f"  TTFT p50/p95/p99 {ttft['p50'] or 0:.1f}/{ttft['p95'] or 0:.1f}/{ttft['p99'] or 0:.1f}"
+                 f"  gap p95 {gaps['p95'] or 0:.1f} ms")
+    server = step["server"]
+    if server.get("available"):
+        line += f"  CPU {server['cpu_percent']}%  RSS {server['rss_peak_mb']} MB"
+    print(line)
+
+
+def compare(current: List[Dict[str, Any]], previous_path: str):
+    """与之前的结果按 (endpoint, concurrency) 对比吞吐与 p95"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {(s["endpoint"], s["concurrency"]): s for s in json.load(f)["steps"]}
+    print(f"\n📊 对比 {previous_path}")
+    for step in current:
+        old = previous.get((step["endpoint"], step["concurrency"]))
+        if old is None:
+            continue
+        changes = []
+        for label, new_value, old_value in (
+            ("req/s", step["throughput_rps"], old["throughput_rps"]),
+            ("p95", step["latency_ms"]["p95"], old["latency_ms"]["p95"]),
+            ("TTFT p95", step.get("ttft_ms", {}).get("p95"), old.get("ttft_ms", {}).get("p95")),
+        ):
+            if new_value is not None and old_value:
+                changes.append(f"{label} {(new_value - old_value) / old_value:+.1%}")
+        print(f"{step['endpoint']:<7}c={step['concurrency']:<5}" + "  ".join(changes))
+
+
+async def discover_server_pid(url: str) -> Optional[int]:
+    try:
+        async with httpx.AsyncClient(timeout=5) as client:
+            return (await client.get(f"{url}/stats")).json().get("worker")
+    except (httpx.HTTPError, ValueError):
+        return None
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="AutoGen Chat 异步压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", choices=["chat", "stream", "both"], default="both")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="逗号分隔的并发等级")
+    parser.add_argument("--duration", type=float, default=15.0, help="每个并发等级的持续秒数")
+    parser.add_argument("--message", default="请用三句话介绍一下你自己")
+    parser.add_argument("--use-cache", action="store_true", help="允许命中响应缓存")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--server-pid", type=int, help="服务端进程号（默认取 /stats 的 worker）")
+    parser.add_argument("--output", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    endpoints = ["chat", "stream"] if args.endpoint == "both" else [args.endpoint]
+    body = {"message": args.message, "use_cache": args.use_cache}
+    pid = args.server_pid or await discover_server_pid(url)
+    sampler = ProcessSampler(pid) if pid else None
+    if sampler is None or not sampler.available:
+        print("⚠️  无法读取服务端进程（需 Linux 且与服务端在同一主机），不统计 CPU/RSS")
+
+    print(f"🚀 压测 {url}: {', '.join(endpoints)} × 并发 {levels}，每级 {args.duration:.0f}s")
+    steps = []
+    for endpoint in endpoints:
+        for concurrency in levels:
+            if sampler is not None:
+                sampler.start()
+            started = time.perf_counter()
+            result = await run_step(url, endpoint, concurrency, args.duration, body, args.timeout)
+            wall = time.perf_counter() - started
+            server = await sampler.stop() if sampler is not None else {"available": False}
+            step = summarize_step(endpoint, concurrency, wall, result, server)
+            print_step(step)
+            steps.append(step)
+
+    if args.output:
+        report = {
+            "meta": {
+                "url": url,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "duration_per_step_s": args.duration,
+                "message": args.message,
+                "use_cache": args.use_cache,
+                "server_pid": pid,
+                "client_host": platform.node(),
+                "python": sys.version.split()[0],
+            },
+            "steps": steps,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 结果已写入 {args.output}")
+    if args.compare:
+        compare(steps, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+流式编码热路径的进程内微基准，与已提交的基线对比
+
+    python -m bench.microbench                       # 运行并与 bench/microbench_baseline.json 对比
+    python -m bench.microbench --update-baseline     # 在当前机器上重新生成基线
+    python -m bench.microbench --threshold 0.15 --filter sse_encode
+
+合成的片段流经过三层被测代码：
+- sse_encode：sse.encode_stream（片段合并、JSON 编码、SSE 分帧）
+- chat_stream：AutoGenManager.chat_stream（事件字典、截止时间、指标），上游替换为内存中的合成模型客户端
+- stream_response：main.generate_stream_response，即 /chat/stream 的完整生成器
+
+每项先预热一轮，再运行 --rounds 轮，按最快一轮（受系统噪声影响最小）报告 chunks/s、输出 bytes/s，
+另用 tracemalloc 单独运行一轮，按运行前后快照的差值（statistics('lineno') 的 count/size 增量）
+报告每个片段留存的内存块数与字节数，用于发现热路径中随片段数增长的分配。
+吞吐低于基线 (1 - threshold) 倍时返回非零状态。基线与机器相关，更换机器后需用 --update-baseline 重新生成，
+生成基线的机器记录在基线文件的 meta 中（--machine-note 可附加说明）。
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, AsyncGenerator, Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+# 被测路径不需要会话存储，避免在工作目录创建数据库
+os.environ.setdefault("SESSIONS_ENABLED", "false")
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "microbench_baseline.json")
+# 不统计 tracemalloc 自身的分配
+_TRACE_FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+def _ascii_tokens(count: int) -> List[str]:
+    words = ["the", "model", "is", "streaming", "a", "short", "token", "and", "then", "next"]
+    return [words[i % len(words)] + " " for i in range(count)]
+
+
+def _cjk_long(count: int) -> List[str]:
+    text = "流式输出的每个片段都会经过合并、JSON 编码和 SSE 分帧，长段中文会放大编码开销。"
+    return [text * 4 for _ in range(count)]
+
+
+def _reasoning(count: int) -> List[str]:
+    # 推理模型输出：<think> 块中含换行、引号与反斜杠，JSON 编码需要转义
+    parts = ["<think>\n", '先分析 "问题" 的约束：\\n 不是换行。\n', "step 1: 计算 x = 3 * 7\n",
+             "所以答案是 21。\n", "</think>\n", "答案：21。"]
+    return [parts[i % len(parts)] for i in range(count)]
+
+
+SCENARIOS: Dict[str, Callable[[int], List[str]]] = {
+    "ascii_tokens": _ascii_tokens,
+    "cjk_long": _cjk_long,
+    "reasoning": _reasoning,
+}
+
+
+class SyntheticModelClient:
+    """内存中的模型客户端：create_stream 立即产出预先生成的片段"""
+
+    def __init__(self, chunks: List[str]):
+        self.chunks = chunks
+
+    async def create_stream(self, messages: Any) -> AsyncGenerator[Any, None]:
+        for chunk in self.chunks:
+            yield chunk
+        # 真实客户端最后产出 CreateResult，被测代码只转发 str
+        yield None
+
+
+async def _content_events(chunks: List[str]) -> AsyncGenerator[Dict[str, Any], None]:
+    for chunk in chunks:
+        yield {"type": "content", "content": chunk}
+    yield {"type": "end", "content": "", "timestamp": "2024-01-01T00:00:00"}
+
+
+class Harness:
+    """被测函数的装配：每次调用 run(chunks) 完整消费一个流，返回输出字节数"""
+
+    def __init__(self):
+        logging.disable(logging.INFO)
+        import sse
+        import main
+        from config import Config
+        from upstream_router import CircuitBreaker, UpstreamEndpoint
+
+        self.sse = sse
+        self.main = main
+        self.config = Config
+        self.manager = main.autogen_manager
+        # 只保留合成上游，不创建真实模型客户端
+        self.endpoint = UpstreamEndpoint(
+            name="synthetic", base_url="memory://", api_key="", model="synthetic", weight=1.0,
+            model_client=SyntheticModelClient([]), breaker=CircuitBreaker(**Config.get_circuit_breaker_config())
+        )
+        self.manager.router.endpoints = [self.endpoint]
+        self.manager.model_client = self.endpoint.model_client
+
+    async def sse_encode(self, chunks: List[str]) -> int:
+        size = 0
+        async for frame in self.sse.encode_stream(
+            _content_events(chunks), self.config.STREAM_CHUNK_SIZE, self.config.STREAM_FLUSH_INTERVAL
+        ):
+            size += len(frame)
+        return size
+
+    async def chat_stream(self, chunks: List[str]) -> int:
+        self.endpoint.model_client.chunks = chunks
+        size = 0
+        async for event in self.manager.chat_stream("bench", use_cache=False, hedge=False):
+            size += len(event.get("content", ""))
+        return size
+
+    async def stream_response(self, chunks: List[str]) -> int:
+        self.endpoint.model_client.chunks = chunks
+        request = self.main.ChatRequest(message="bench", use_cache=False, hedge=False)
+        size = 0
+        async for frame in self.main.generate_stream_response(request):
+            size += len(frame)
+        return size
+
+
+BENCHMARKS = ("sse_encode", "chat_stream", "stream_response")
+
+
+async def measure(func: Callable[[List[str]], Any], chunks: List[str], rounds: int) -> Dict[str, float]:
+    """预热一轮后运行 rounds 轮，吞吐按最快一轮计算"""
+    await func(chunks)
+    durations = []
+    size = 0
+    for _ in range(rounds):
+        gc.collect()
+        started = time.perf_counter()
+        size = await func(chunks)
+        durations.append(time.perf_counter() - started)
+    best = min(durations)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+    await func(chunks)
+    after = tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+    tracemalloc.stop()
+    diff = after.compare_to(before, "lineno")
+    blocks = sum(stat.count_diff for stat in diff)
+    allocated = sum(stat.size_diff for stat in diff)
+    return {
+        "chunks_per_sec": round(len(chunks) / best, 1),
+        "bytes_per_sec": round(size / best, 1),
+        "min_ms": round(best * 1000, 3),
+        "median_ms": round(statistics.median(durations) * 1000, 3),
+        "alloc_blocks_per_chunk": round(blocks / len(chunks), 3),
+        "alloc_bytes_per_chunk": round(allocated / len(chunks), 1),
+    }
+
+
+def check(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """返回吞吐低于基线 (1 - threshold) 倍的项"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get("results", {}).get(name)
+        if expected is None:
+            continue
+        ratio = result["chunks_per_sec"] / expected["chunks_per_sec"]
+        result["vs_baseline"] = round(ratio - 1, 4)
+        if ratio < 1 - threshold:
+            regressions.append(f"{name}: {result['chunks_per_sec']:.0f} chunks/s，"
+                               f"基线 {expected['chunks_per_sec']:.0f}（{ratio - 1:+.1%}）")
+    return regressions
+
+
+async def run(args) -> int:
+    harness = Harness()
+    results: Dict[str, Dict[str, float]] = {}
+    print(f"{'benchmark':<34}{'chunks/s':>12}{'MB/s':>9}{'min ms':>11}{'blocks/chunk':>14}{'B/chunk':>10}")
+    for bench in BENCHMARKS:
+        for scenario, make_chunks in SCENARIOS.items():
+            name = f"{bench}/{scenario}"
+            if args.filter and args.filter not in name:
+                continue
+            result = await measure(getattr(harness, bench), make_chunks(args.chunks), args.rounds)
+            results[name] = result
+            print(f"{name:<34}{result['chunks_per_sec']:>12.0f}{result['bytes_per_sec'] / 1e6:>9.1f}"
+                  f"{result['min_ms']:>11.2f}{result['alloc_blocks_per_chunk']:>14.2f}"
+                  f"{result['alloc_bytes_per_chunk']:>10.0f}")
+
+    meta = {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "note": args.machine_note,
+        "chunks": args.chunks,
+        "rounds": args.rounds,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\n💾 基线已写入 {args.baseline}")
+        return 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    if not os.path.exists(args.baseline):
+        print(f"\n⚠️  没有基线文件 {args.baseline}，先运行 --update-baseline")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = check(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ 吞吐回退超过 {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"\n✅ 与基线相比无超过 {args.threshold:.0%} 的回退")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="流式编码路径微基准")
+    parser.add_argument("--chunks", type=int, default=2000, help="每个流的片段数")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--filter", help="只运行名称包含该字符串的项")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的吞吐回退比例")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="用本次结果覆盖基线")
+    parser.add_argument("--output", help="另存本次结果 JSON")
+    parser.add_argument("--machine-note", default="", help="写入结果 meta 的机器说明（如 CI 机型）")
+    args = parser.parse_args()
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
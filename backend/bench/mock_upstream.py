@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+OpenAI 兼容的本地模拟上游：代替 dashscope 进行压测
+
+    python -m bench.mock_upstream --port 9000 --ttft 0.3 --tokens-per-second 50 --rate-limit-rate 0.02
+    AUTOGEN_BASE_URL=http://127.0.0.1:9000/v1 python start.py --prod
+
+支持 POST /v1/chat/completions（stream 与非 stream）和 GET /v1/models（连接池保活请求）。
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORDS = ("the quick brown fox jumps over a lazy dog while 模型 正在 生成 一段 用于 压测 的 回复 文本").split()
+
+
+class MockSettings:
+    """模拟上游的行为参数"""
+
+    def __init__(self,
+                 ttft: float = 0.2,
+                 tokens_per_second: float = 50.0,
+                 jitter: float = 0.2,
+                 response_tokens: int = 100,
+                 error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0,
+                 seed: int = 0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        # 每次等待在 [1 - jitter, 1 + jitter] 倍之间随机
+        self.jitter = jitter
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.streams = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def delay(self, seconds: float) -> float:
+        if self.jitter <= 0:
+            return seconds
+        return max(0.0, seconds * self.random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def tokens(self, count: int) -> List[str]:
+        return [self.random.choice(_WORDS) + " " for _ in range(count)]
+
+
+def create_app(settings: MockSettings) -> FastAPI:
+    """创建模拟上游应用"""
+    app = FastAPI(title="Mock OpenAI upstream")
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock-model", "object": "model", "owned_by": "bench"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "requests": settings.requests,
+            "streams": settings.streams,
+            "errors": settings.errors,
+            "rate_limited": settings.rate_limited,
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        settings.requests += 1
+        roll = settings.random.random()
+        if roll < settings.rate_limit_rate:
+            settings.rate_limited += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error", "code": "429"}},
+                status_code=429,
+                headers={"Retry-After": str(settings.retry_after)}
+            )
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            settings.errors += 1
+            return JSONResponse(
+                {"error": {"message": "Internal error (mock)", "type": "server_error", "code": "500"}},
+                status_code=500
+            )
+
+        model = body.get("model", "mock-model")
+        count = min(int(body.get("max_tokens") or settings.response_tokens), settings.response_tokens)
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": count, "total_tokens": prompt_tokens + count}
+        if not body.get("stream"):
+            await asyncio.sleep(settings.delay(settings.ttft) + count / settings.tokens_per_second)
+            return {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(settings.tokens(count))},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            }
+
+        settings.streams += 1
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+        return StreamingResponse(
+            stream_chunks(settings, model, count, usage if include_usage else None),
+            media_type="text/event-stream"
+        )
+
+    return app
+
+
+async def stream_chunks(settings: MockSettings,
+                        model: str,
+                        count: int,
+                        usage: Optional[Dict[str, Any]] = None) -> AsyncGenerator[bytes, None]:
+    """按 TTFT 与 token 速率输出 chat.completion.chunk 事件"""
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def chunk(delta: Optional[Dict[str, Any]], finish_reason: Optional[str] = None, **extra) -> bytes:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+            **extra
+        }
+        return b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+    await asyncio.sleep(settings.delay(settings.ttft))
+    yield chunk({"role": "assistant", "content": ""})
+    interval = 1.0 / settings.tokens_per_second
+    for i, token in enumerate(settings.tokens(count)):
+        if i:
+            await asyncio.sleep(settings.delay(interval))
+        yield chunk({"content": token})
+    yield chunk({}, "stop")
+    if usage is not None:
+        yield chunk(None, usage=usage)
+    yield b"data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的模拟上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首个 token 延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机抖动比例（0~1）")
+    parser.add_argument("--response-tokens", type=int, default=100, help="每个回复的 token 数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的请求比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    settings = MockSettings(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        jitter=args.jitter,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+    print(f"🧪 模拟上游: http://{args.host}:{args.port}/v1 "
+          f"(TTFT {args.ttft}s, {args.tokens_per_second} tokens/s, 429 {args.rate_limit_rate:.0%}, "
+          f"500 {args.error_rate:.0%})")
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@
 AutoGen Chat 配置文件
 """
 
+import importlib.util
+import json
 import os
-from typing import Dict, Any
-from autogen_core.models import ModelFamily
+from typing import Dict, Any, List, Optional
 
 class Config:
     """应用配置类"""
@@ -14,12 +15,116 @@ class Config:
     BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
     MODEL_NAME = "deepseek-r1"
     
+    # 多上游配置：为空时只使用上面的 BASE_URL/API_KEY/MODEL_NAME
+    # 每项: {"name": ..., "base_url": ..., "api_key": ..., "model": ..., "weight": 1.0}
+    UPSTREAM_ENDPOINTS: List[Dict[str, Any]] = []
+    
+    # 熔断配置
+    CIRCUIT_FAILURE_THRESHOLD = 5   # 连续失败次数达到该值时熔断（429 立即熔断）
+    CIRCUIT_COOLDOWN = 30           # 熔断后多少秒进入半开状态
+    
+    # 自适应上游并发配置（每个上游独立）
+    # 默认关闭：开启后每个上游从 AIMD_INITIAL_LIMIT 个并发起步，低于准入并发上限时会成为实际瓶颈，
+    # 适用于上游配额明确偏小、需要按 429/超时自动收缩的场景
+    AIMD_ENABLED = False
+    AIMD_INITIAL_LIMIT = 8
+    AIMD_MIN_LIMIT = 1
+    AIMD_MAX_LIMIT = 128
+    AIMD_INCREASE = 1.0              # 每个限额窗口的加性增量
+    AIMD_DECREASE = 0.5              # 429/超时时的乘性系数
+    AIMD_LATENCY_TOLERANCE = 2.0     # 延迟不超过基线的倍数视为健康
+    AIMD_DECREASE_COOLDOWN = 2.0     # 两次减小之间的最短间隔（秒）
+    AIMD_MAX_RETRY_AFTER = 60        # 遵循上游 Retry-After 的最长暂停时间（秒）
+    AIMD_ACQUIRE_TIMEOUT = 10        # 等待上游并发名额的最长时间（秒），超时返回 503
+    
+    # 对冲请求配置
+    HEDGE_ENABLED = False        # 请求可通过 hedge 字段单独开启/关闭
+    HEDGE_DELAY = 0              # 固定对冲延迟（秒）；0 表示按 TTFT 分位数自适应
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MIN_DELAY = 0.5
+    HEDGE_MAX_DELAY = 10         # 自适应样本不足时也使用该值
+    HEDGE_WINDOW = 500           # TTFT 滚动样本数
+    HEDGE_MIN_SAMPLES = 20
+    
+    # 准入控制配置（流式与非流式分别限制）
+    ADMISSION_CHAT_MAX_IN_FLIGHT = 32
+    ADMISSION_CHAT_MAX_QUEUE = 64
+    ADMISSION_STREAM_MAX_IN_FLIGHT = 64
+    ADMISSION_STREAM_MAX_QUEUE = 128
+    ADMISSION_QUEUE_TIMEOUT = 10       # 默认排队截止时间（秒）
+    ADMISSION_MAX_QUEUE_TIMEOUT = 30   # 请求可指定的最长排队时间
+    
+    # 租户配置：按 API Key / X-Client-ID 区分调用方，排队时按权重公平分配名额
+    # 限额为 0 表示不限制；token 用量按提示词估算值加 TENANT_COMPLETION_TOKEN_ESTIMATE 预扣
+    # 限额按进程计算：多 worker 部署时每个 worker 各有一组令牌桶，实际限额约为配置值乘以 worker 数
+    TENANTS_DEFAULT = {
+        "weight": 1.0,
+        "requests_per_second": 0,
+        "request_burst": 0,          # 0 表示等于 requests_per_second
+        "tokens_per_minute": 0,
+        "token_burst": 0,            # 0 表示等于 tokens_per_minute
+        "max_queue": 32              # 该租户在每个准入队列中最多排队的请求数
+    }
+    # 按租户名覆盖默认值，如 {"team-a": {"weight": 3, "tokens_per_minute": 200000}}；
+    # 客户端 ID 只有配置为 "client:<id>" 时才作为独立租户
+    TENANTS: Dict[str, Dict[str, Any]] = {}
+    # API Key 到租户名的映射；未登记的 Key 归入 anonymous 租户
+    TENANT_API_KEYS: Dict[str, str] = {}
+    TENANT_MAX_TRACKED = 10000
+    TENANT_COMPLETION_TOKEN_ESTIMATE = 256
+    
+    # 批量聊天配置（/chat/batch 每项单独占用 chat 准入名额）
+    BATCH_DEFAULT_CONCURRENCY = 4      # 每批同时执行的项数，请求可用 ?concurrency= 指定
+    BATCH_MAX_CONCURRENCY = 16
+    BATCH_MAX_ITEMS = 10000
+    BATCH_MAX_ITEM_BYTES = 1024 * 1024 # 单项 JSON 的最大字节数
+    
+    # 会话配置：ChatRequest 带 session_id 时使用服务端保存的多轮历史
+    SESSIONS_ENABLED = True
+    SESSION_DB_PATH = "sessions.db"    # SQLite（WAL）文件，为空时只保存在内存中
+    SESSION_MAX_CACHED = 1024          # 内存中保留的最近使用会话数
+    SESSION_TTL = 7 * 24 * 3600        # 超过此时长（秒）未更新的会话视为不存在
+    SESSION_PURGE_INTERVAL = 3600      # 从数据库中删除过期会话的间隔（秒）
+    SESSION_CONTEXT_BUDGET = 6000      # 每轮上下文（系统消息 + 摘要 + 历史 + 本轮消息）的 token 预算
+    SESSION_TRIM_TARGET = 0.5          # 超出预算时一次裁剪到预算的该比例以内，使上下文前缀在多轮间保持稳定
+    SESSION_SUMMARIZE = False          # 裁剪出窗口的历史是否调用模型合并为摘要
+    SESSION_SUMMARY_MAX_TOKENS = 300
+    
+    # WebSocket 多路复用配置（/ws 上的每个流占用一个 stream 准入名额）
+    WS_MAX_STREAMS = 16                # 单个连接上的最大并发流数
+    WS_SEND_WINDOW = 64                # 已入队未写出的数据消息上限，超过时暂停读取上游
+    
+    # 上游连接池配置
+    UPSTREAM_MAX_CONNECTIONS = 100
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = 20
+    UPSTREAM_KEEPALIVE_EXPIRY = 60         # 空闲连接保活秒数
+    UPSTREAM_HTTP2 = True                  # 需要 h2 包，未安装时自动退回 HTTP/1.1
+    UPSTREAM_CONNECT_TIMEOUT = 5
+    UPSTREAM_READ_TIMEOUT = 120
+    UPSTREAM_POOL_TIMEOUT = 10             # 等待空闲连接的超时
+    UPSTREAM_PREWARM_CONNECTIONS = 2       # 启动时预热的连接数
+    UPSTREAM_PING_INTERVAL = 45            # 保活请求间隔，应小于保活过期时间；0 表示关闭
+    UPSTREAM_PING_TIMEOUT = 5              # 预热/保活请求的超时，避免缓慢的上游拖住后台任务
+    
     # 服务器配置
     HOST = "0.0.0.0"
     PORT = 8000
     DEBUG = True
     RELOAD = True
     
+    # 生产部署配置（start.py --prod / run_server.py）：多 worker、关闭热重载
+    WORKERS = 0                        # worker 进程数，0 表示 CPU 核数
+    SERVER_BACKLOG = 2048              # 监听队列长度，突发连接时避免 SYN 被丢弃
+    SERVER_KEEPALIVE_TIMEOUT = 75      # 空闲 keep-alive 连接保持秒数，应大于前置负载均衡的空闲超时
+    SERVER_ACCESS_LOG = False          # 访问日志在高并发下开销明显，请求指标见 /metrics
+    
+    # 多进程共享状态：响应缓存二级存储与各 worker 的指标/统计快照（SQLite，WAL）
+    SHARED_STATE_ENABLED = False       # 生产模式启动时自动开启
+    SHARED_STATE_PATH = "shared_state.db"
+    SHARED_STATE_SYNC_INTERVAL = 5     # 各 worker 发布快照、清理过期缓存的间隔（秒）
+    SHARED_STATE_STALE_AFTER = 30      # 超过此时长未发布快照的 worker 视为已退出
+    SHARED_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    
     # CORS 配置
     CORS_ORIGINS = ["*"]
     CORS_CREDENTIALS = True
@@ -31,7 +136,7 @@ class Config:
         "vision": True,
         "function_calling": True,
         "json_output": True,
-        "family": ModelFamily.UNKNOWN,
+        "family": "unknown",  # 即 autogen_core.models.ModelFamily.UNKNOWN，配置模块不导入 autogen
         "structured_output": False,
         "multiple_system_messages": False,
     }
@@ -47,8 +152,54 @@ class Config:
 6. 对于复杂问题，分步骤解释"""
     
     # 流式输出配置
-    STREAM_CHUNK_SIZE = 1024
-    STREAM_TIMEOUT = 30
+    STREAM_CHUNK_SIZE = 1024         # SSE 合并帧的字节阈值
+    STREAM_FLUSH_INTERVAL = 0.01     # 内容片段最多缓冲多久就发送（秒）
+    STREAM_TIMEOUT = 30              # 首个片段与相邻片段间隔的默认截止时间（秒）
+    STREAM_TOTAL_TIMEOUT = 300       # 整体墙钟预算（秒），/chat 同样适用
+    STREAM_MAX_TIMEOUT = 600         # 请求可指定的截止时间上限（秒）
+    STREAM_USE_AGENT = False  # False: 无状态 create_stream 快速路径; True: AssistantAgent.run_stream
+    STREAM_BROADCAST_ENABLED = True  # 相同请求的并发流共享一个上游流
+    
+    # 断线续传配置（Last-Event-ID）
+    STREAM_RESUME_ENABLED = True
+    STREAM_RESUME_GRACE = 15                        # 客户端全部断开后上游继续生成的秒数（期间仍占用创建者的准入名额）
+    STREAM_RESUME_TTL = 300                         # 已结束的流保留秒数
+    STREAM_RESUME_MAX_STREAMS = 256                 # 最多保留的已结束流数量
+    STREAM_RESUME_MAX_BYTES = 32 * 1024 * 1024      # 保留流的内容总字节上限，也是单个进行中的流的缓冲上限
+    
+    # 代理池配置
+    AGENT_POOL_MAX_KEYS = 32          # 最多缓存的 (代理名, 系统消息) 组合数
+    AGENT_POOL_MAX_IDLE_PER_KEY = 4   # 每个组合保留的空闲代理实例数
+    AGENT_POOL_TTL = 600              # 空闲代理存活秒数
+    
+    # 响应缓存配置
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_TTL = 3600                      # 秒
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024    # 缓存内容总字节上限
+    
+    # 近似重复提示缓存：精确未命中时按 SimHash 相似度复用缓存的响应（需开启响应缓存）
+    NEAR_DUP_CACHE_ENABLED = False
+    NEAR_DUP_THRESHOLD = 0.95      # 相似度阈值 = 1 - 汉明距离/64；1.0 表示只做精确匹配
+    # 按系统消息覆盖阈值，键为系统消息全文，例如 {"你是一个翻译助手": 0.98}
+    NEAR_DUP_THRESHOLDS: Dict[str, float] = {}
+    # 索引分段数：汉明距离 < 分段数的近似项保证能找到；None 表示按最低阈值自动选取（0.95 时为 4），
+    # 指定的值不足以覆盖最低阈值时启动失败
+    NEAR_DUP_BANDS: Optional[int] = None
+    NEAR_DUP_MIN_SHINGLES = 6      # 特征数少于此值的短提示只做精确匹配
+    
+    # 健康检查配置
+    HEALTH_PROBE_INTERVAL = 30     # 后台就绪探测间隔（秒）
+    HEALTH_PROBE_JITTER = 0.2      # 间隔随机抖动比例
+    HEALTH_PROBE_TIMEOUT = 5       # 单次探测超时（秒），探测只请求各上游的 GET /models
+    
+    # 追踪配置
+    TRACING_ENABLED = True
+    TRACE_MAX_TRACES = 500            # 内存中保留的最近请求数
+    TRACE_JSONL_PATH = ""             # 非空时同时追加写入该 JSONL 文件
+    TRACE_PROFILE_SAMPLE_RATE = 0.0   # 开启栈采样的请求比例（0~1）
+    TRACE_PROFILE_INTERVAL = 0.005    # 栈采样间隔（秒）
+    TRACE_PROFILE_DIR = "profiles"    # 栈采样结果目录（collapsed stack 格式）
     
     # 日志配置
     LOG_LEVEL = "INFO"
@@ -64,6 +215,204 @@ class Config:
             "model_info": cls.MODEL_INFO
         }
     
+    @classmethod
+    def get_upstream_endpoints(cls) -> List[Dict[str, Any]]:
+        """获取上游列表，缺省字段使用单上游配置补齐"""
+        endpoints = cls.UPSTREAM_ENDPOINTS or [{}]
+        return [
+            {
+                "name": endpoint.get("name", f"upstream{index}"),
+                "base_url": endpoint.get("base_url", cls.BASE_URL),
+                "api_key": endpoint.get("api_key", cls.API_KEY),
+                "model": endpoint.get("model", cls.MODEL_NAME),
+                "weight": float(endpoint.get("weight", 1.0))
+            }
+            for index, endpoint in enumerate(endpoints)
+        ]
+    
+    @classmethod
+    def get_circuit_breaker_config(cls) -> Dict[str, Any]:
+        """获取熔断配置"""
+        return {
+            "failure_threshold": cls.CIRCUIT_FAILURE_THRESHOLD,
+            "cooldown": cls.CIRCUIT_COOLDOWN
+        }
+    
+    @classmethod
+    def get_aimd_config(cls) -> Dict[str, Any]:
+        """获取自适应并发配置"""
+        return {
+            "initial_limit": cls.AIMD_INITIAL_LIMIT,
+            "min_limit": cls.AIMD_MIN_LIMIT,
+            "max_limit": cls.AIMD_MAX_LIMIT,
+            "increase": cls.AIMD_INCREASE,
+            "decrease": cls.AIMD_DECREASE,
+            "latency_tolerance": cls.AIMD_LATENCY_TOLERANCE,
+            "decrease_cooldown": cls.AIMD_DECREASE_COOLDOWN,
+            "max_retry_after": cls.AIMD_MAX_RETRY_AFTER,
+            "acquire_timeout": cls.AIMD_ACQUIRE_TIMEOUT
+        }
+    
+    @classmethod
+    def get_hedge_config(cls) -> Dict[str, Any]:
+        """获取对冲请求配置"""
+        return {
+            "delay": cls.HEDGE_DELAY,
+            "percentile": cls.HEDGE_PERCENTILE,
+            "min_delay": cls.HEDGE_MIN_DELAY,
+            "max_delay": cls.HEDGE_MAX_DELAY,
+            "window": cls.HEDGE_WINDOW,
+            "min_samples": cls.HEDGE_MIN_SAMPLES
+        }
+    
+    @classmethod
+    def get_admission_config(cls, kind: str) -> Dict[str, Any]:
+        """获取准入控制配置，kind 为 chat 或 stream"""
+        prefix = f"ADMISSION_{kind.upper()}_"
+        return {
+            "max_in_flight": getattr(cls, prefix + "MAX_IN_FLIGHT"),
+            "max_queue": getattr(cls, prefix + "MAX_QUEUE"),
+            "queue_timeout": cls.ADMISSION_QUEUE_TIMEOUT,
+            "max_queue_timeout": cls.ADMISSION_MAX_QUEUE_TIMEOUT
+        }
+    
+    @classmethod
+    def get_tenant_config(cls) -> Dict[str, Any]:
+        """获取租户识别与限流配置"""
+        return {
+            "defaults": cls.TENANTS_DEFAULT,
+            "tenants": cls.TENANTS,
+            "api_keys": cls.TENANT_API_KEYS,
+            "max_tenants": cls.TENANT_MAX_TRACKED,
+            "completion_token_estimate": cls.TENANT_COMPLETION_TOKEN_ESTIMATE
+        }
+    
+    @classmethod
+    def get_stream_broadcast_config(cls) -> Dict[str, Any]:
+        """获取流式广播与续传配置"""
+        resume = cls.STREAM_RESUME_ENABLED
+        return {
+            "grace": cls.STREAM_RESUME_GRACE if resume else 0,
+            "retention_ttl": cls.STREAM_RESUME_TTL if resume else 0,
+            "max_retained": cls.STREAM_RESUME_MAX_STREAMS,
+            "max_retained_bytes": cls.STREAM_RESUME_MAX_BYTES
+        }
+    
+    @classmethod
+    def get_deadline_config(cls) -> Dict[str, float]:
+        """获取默认截止时间配置"""
+        return {
+            "first_token": cls.STREAM_TIMEOUT,
+            "idle": cls.STREAM_TIMEOUT,
+            "total": cls.STREAM_TOTAL_TIMEOUT
+        }
+    
+    @classmethod
+    def get_upstream_pool_config(cls) -> Dict[str, Any]:
+        """获取上游连接池配置"""
+        return {
+            "max_connections": cls.UPSTREAM_MAX_CONNECTIONS,
+            "max_keepalive_connections": cls.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            "keepalive_expiry": cls.UPSTREAM_KEEPALIVE_EXPIRY,
+            "http2": cls.UPSTREAM_HTTP2,
+            "connect_timeout": cls.UPSTREAM_CONNECT_TIMEOUT,
+            "read_timeout": cls.UPSTREAM_READ_TIMEOUT,
+            "pool_timeout": cls.UPSTREAM_POOL_TIMEOUT,
+            "prewarm_connections": cls.UPSTREAM_PREWARM_CONNECTIONS,
+            "ping_interval": cls.UPSTREAM_PING_INTERVAL,
+            "ping_timeout": cls.UPSTREAM_PING_TIMEOUT
+        }
+    
+    @classmethod
+    def get_agent_pool_config(cls) -> Dict[str, Any]:
+        """获取代理池配置"""
+        return {
+            "max_keys": cls.AGENT_POOL_MAX_KEYS,
+            "max_idle_per_key": cls.AGENT_POOL_MAX_IDLE_PER_KEY,
+            "ttl": cls.AGENT_POOL_TTL
+        }
+    
+    @classmethod
+    def get_response_cache_config(cls) -> Dict[str, Any]:
+        """获取响应缓存配置"""
+        return {
+            "max_entries": cls.RESPONSE_CACHE_MAX_ENTRIES,
+            "ttl": cls.RESPONSE_CACHE_TTL,
+            "max_bytes": cls.RESPONSE_CACHE_MAX_BYTES
+        }
+    
+    @classmethod
+    def get_batch_config(cls) -> Dict[str, Any]:
+        """获取批量执行配置"""
+        return {
+            "default_concurrency": cls.BATCH_DEFAULT_CONCURRENCY,
+            "max_concurrency": cls.BATCH_MAX_CONCURRENCY
+        }
+    
+    @classmethod
+    def get_session_config(cls) -> Dict[str, Any]:
+        """获取会话存储配置"""
+        return {
+            "db_path": cls.SESSION_DB_PATH,
+            "max_cached": cls.SESSION_MAX_CACHED,
+            "ttl": cls.SESSION_TTL,
+            "purge_interval": cls.SESSION_PURGE_INTERVAL,
+            "shared": cls.SHARED_STATE_ENABLED
+        }
+    
+    @classmethod
+    def get_shared_state_config(cls) -> Dict[str, Any]:
+        """获取多进程共享状态配置"""
+        return {
+            "path": cls.SHARED_STATE_PATH,
+            "stale_after": cls.SHARED_STATE_STALE_AFTER,
+            "max_cache_bytes": cls.SHARED_CACHE_MAX_BYTES
+        }
+    
+    @classmethod
+    def get_websocket_config(cls) -> Dict[str, Any]:
+        """获取 WebSocket 会话配置"""
+        return {
+            "max_streams": cls.WS_MAX_STREAMS,
+            "send_window": cls.WS_SEND_WINDOW,
+            "chunk_size": cls.STREAM_CHUNK_SIZE,
+            "flush_interval": cls.STREAM_FLUSH_INTERVAL
+        }
+    
+    @classmethod
+    def get_near_dup_config(cls) -> Dict[str, Any]:
+        """获取近似重复索引配置"""
+        return {
+            "bands": cls.NEAR_DUP_BANDS,
+            "min_shingles": cls.NEAR_DUP_MIN_SHINGLES,
+            "min_threshold": min([cls.NEAR_DUP_THRESHOLD, *cls.NEAR_DUP_THRESHOLDS.values()])
+        }
+    
+    @classmethod
+    def get_near_dup_threshold(cls, system_message: str) -> float:
+        """系统消息对应的近似匹配阈值"""
+        return cls.NEAR_DUP_THRESHOLDS.get(system_message, cls.NEAR_DUP_THRESHOLD)
+    
+    @classmethod
+    def get_health_probe_config(cls) -> Dict[str, Any]:
+        """获取就绪探测配置"""
+        return {
+            "interval": cls.HEALTH_PROBE_INTERVAL,
+            "jitter": cls.HEALTH_PROBE_JITTER,
+            "timeout": cls.HEALTH_PROBE_TIMEOUT
+        }
+    
+    @classmethod
+    def get_tracing_config(cls) -> Dict[str, Any]:
+        """获取追踪配置"""
+        return {
+            "max_traces": cls.TRACE_MAX_TRACES,
+            "jsonl_path": cls.TRACE_JSONL_PATH,
+            "profile_sample_rate": cls.TRACE_PROFILE_SAMPLE_RATE,
+            "profile_interval": cls.TRACE_PROFILE_INTERVAL,
+            "profile_dir": cls.TRACE_PROFILE_DIR
+        }
+    
     @classmethod
     def get_server_config(cls) -> Dict[str, Any]:
         """获取服务器配置"""
@@ -75,6 +424,22 @@ class Config:
             "log_level": cls.LOG_LEVEL
         }
     
+    @classmethod
+    def get_production_server_config(cls) -> Dict[str, Any]:
+        """获取生产部署的 uvicorn 参数：多 worker，uvloop/httptools 已安装时使用"""
+        return {
+            "host": cls.HOST,
+            "port": cls.PORT,
+            "reload": False,
+            "workers": cls.WORKERS or os.cpu_count() or 1,
+            "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+            "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+            "backlog": cls.SERVER_BACKLOG,
+            "timeout_keep_alive": cls.SERVER_KEEPALIVE_TIMEOUT,
+            "access_log": cls.SERVER_ACCESS_LOG,
+            "log_level": cls.LOG_LEVEL.lower()
+        }
+    
     @classmethod
     def get_cors_config(cls) -> Dict[str, Any]:
         """获取CORS配置"""
@@ -91,9 +456,74 @@ def load_env_config():
     Config.API_KEY = os.getenv("AUTOGEN_API_KEY", Config.API_KEY)
     Config.BASE_URL = os.getenv("AUTOGEN_BASE_URL", Config.BASE_URL)
     Config.MODEL_NAME = os.getenv("AUTOGEN_MODEL_NAME", Config.MODEL_NAME)
+    if os.getenv("AUTOGEN_UPSTREAMS"):
+        # JSON 数组，格式同 Config.UPSTREAM_ENDPOINTS
+        Config.UPSTREAM_ENDPOINTS = json.loads(os.getenv("AUTOGEN_UPSTREAMS"))
     Config.HOST = os.getenv("SERVER_HOST", Config.HOST)
     Config.PORT = int(os.getenv("SERVER_PORT", Config.PORT))
     Config.DEBUG = os.getenv("DEBUG", "true").lower() == "true"
+    Config.WORKERS = int(os.getenv("SERVER_WORKERS", Config.WORKERS))
+    Config.SERVER_BACKLOG = int(os.getenv("SERVER_BACKLOG", Config.SERVER_BACKLOG))
+    Config.SERVER_KEEPALIVE_TIMEOUT = int(os.getenv("SERVER_KEEPALIVE_TIMEOUT", Config.SERVER_KEEPALIVE_TIMEOUT))
+    Config.SERVER_ACCESS_LOG = os.getenv("SERVER_ACCESS_LOG", str(Config.SERVER_ACCESS_LOG)).lower() == "true"
+    Config.SHARED_STATE_ENABLED = os.getenv("SHARED_STATE_ENABLED", str(Config.SHARED_STATE_ENABLED)).lower() == "true"
+    Config.SHARED_STATE_PATH = os.getenv("SHARED_STATE_PATH", Config.SHARED_STATE_PATH)
+    Config.SHARED_STATE_SYNC_INTERVAL = float(os.getenv("SHARED_STATE_SYNC_INTERVAL", Config.SHARED_STATE_SYNC_INTERVAL))
+    Config.SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", Config.SHARED_CACHE_MAX_BYTES))
+    Config.AIMD_ENABLED = os.getenv("AIMD_ENABLED", str(Config.AIMD_ENABLED)).lower() == "true"
+    Config.AIMD_MAX_LIMIT = int(os.getenv("AIMD_MAX_LIMIT", Config.AIMD_MAX_LIMIT))
+    Config.HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", str(Config.HEDGE_ENABLED)).lower() == "true"
+    Config.HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", Config.HEDGE_DELAY))
+    Config.ADMISSION_CHAT_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_CHAT_MAX_IN_FLIGHT", Config.ADMISSION_CHAT_MAX_IN_FLIGHT))
+    Config.ADMISSION_STREAM_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_STREAM_MAX_IN_FLIGHT", Config.ADMISSION_STREAM_MAX_IN_FLIGHT))
+    if os.getenv("TENANTS_DEFAULT"):
+        # JSON 对象，只需给出要覆盖的字段
+        Config.TENANTS_DEFAULT = {**Config.TENANTS_DEFAULT, **json.loads(os.getenv("TENANTS_DEFAULT"))}
+    if os.getenv("TENANTS"):
+        # JSON 对象：{"租户名": {"weight": 3, ...}}
+        Config.TENANTS = json.loads(os.getenv("TENANTS"))
+    if os.getenv("TENANT_API_KEYS"):
+        # JSON 对象：{"API Key": "租户名"}
+        Config.TENANT_API_KEYS = json.loads(os.getenv("TENANT_API_KEYS"))
+    Config.BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", Config.BATCH_DEFAULT_CONCURRENCY))
+    Config.BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", Config.BATCH_MAX_CONCURRENCY))
+    Config.BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", Config.BATCH_MAX_ITEMS))
+    Config.SESSIONS_ENABLED = os.getenv("SESSIONS_ENABLED", str(Config.SESSIONS_ENABLED)).lower() == "true"
+    Config.SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", Config.SESSION_DB_PATH)
+    Config.SESSION_CONTEXT_BUDGET = int(os.getenv("SESSION_CONTEXT_BUDGET", Config.SESSION_CONTEXT_BUDGET))
+    Config.SESSION_SUMMARIZE = os.getenv("SESSION_SUMMARIZE", str(Config.SESSION_SUMMARIZE)).lower() == "true"
+    Config.WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", Config.WS_MAX_STREAMS))
+    Config.UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", Config.UPSTREAM_MAX_CONNECTIONS))
+    Config.UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", str(Config.UPSTREAM_HTTP2)).lower() == "true"
+    Config.UPSTREAM_PREWARM_CONNECTIONS = int(os.getenv("UPSTREAM_PREWARM_CONNECTIONS", Config.UPSTREAM_PREWARM_CONNECTIONS))
+    Config.STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", Config.STREAM_CHUNK_SIZE))
+    Config.STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", Config.STREAM_FLUSH_INTERVAL))
+    Config.STREAM_TIMEOUT = float(os.getenv("STREAM_TIMEOUT", Config.STREAM_TIMEOUT))
+    Config.STREAM_TOTAL_TIMEOUT = float(os.getenv("STREAM_TOTAL_TIMEOUT", Config.STREAM_TOTAL_TIMEOUT))
+    Config.STREAM_MAX_TIMEOUT = float(os.getenv("STREAM_MAX_TIMEOUT", Config.STREAM_MAX_TIMEOUT))
+    Config.STREAM_USE_AGENT = os.getenv("STREAM_USE_AGENT", str(Config.STREAM_USE_AGENT)).lower() == "true"
+    Config.STREAM_BROADCAST_ENABLED = os.getenv("STREAM_BROADCAST_ENABLED", str(Config.STREAM_BROADCAST_ENABLED)).lower() == "true"
+    Config.STREAM_RESUME_ENABLED = os.getenv("STREAM_RESUME_ENABLED", str(Config.STREAM_RESUME_ENABLED)).lower() == "true"
+    Config.STREAM_RESUME_GRACE = float(os.getenv("STREAM_RESUME_GRACE", Config.STREAM_RESUME_GRACE))
+    Config.STREAM_RESUME_TTL = float(os.getenv("STREAM_RESUME_TTL", Config.STREAM_RESUME_TTL))
+    Config.STREAM_RESUME_MAX_BYTES = int(os.getenv("STREAM_RESUME_MAX_BYTES", Config.STREAM_RESUME_MAX_BYTES))
+    Config.AGENT_POOL_MAX_KEYS = int(os.getenv("AGENT_POOL_MAX_KEYS", Config.AGENT_POOL_MAX_KEYS))
+    Config.AGENT_POOL_MAX_IDLE_PER_KEY = int(os.getenv("AGENT_POOL_MAX_IDLE_PER_KEY", Config.AGENT_POOL_MAX_IDLE_PER_KEY))
+    Config.AGENT_POOL_TTL = float(os.getenv("AGENT_POOL_TTL", Config.AGENT_POOL_TTL))
+    Config.HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", Config.HEALTH_PROBE_INTERVAL))
+    Config.RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", str(Config.RESPONSE_CACHE_ENABLED)).lower() == "true"
+    Config.RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", Config.RESPONSE_CACHE_MAX_ENTRIES))
+    Config.RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", Config.RESPONSE_CACHE_TTL))
+    Config.RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", Config.RESPONSE_CACHE_MAX_BYTES))
+    Config.NEAR_DUP_CACHE_ENABLED = os.getenv("NEAR_DUP_CACHE_ENABLED", str(Config.NEAR_DUP_CACHE_ENABLED)).lower() == "true"
+    Config.NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", Config.NEAR_DUP_THRESHOLD))
+    if os.getenv("NEAR_DUP_THRESHOLDS"):
+        # JSON 对象：{"系统消息": 阈值}
+        Config.NEAR_DUP_THRESHOLDS = json.loads(os.getenv("NEAR_DUP_THRESHOLDS"))
+    Config.TRACING_ENABLED = os.getenv("TRACING_ENABLED", str(Config.TRACING_ENABLED)).lower() == "true"
+    Config.TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", Config.TRACE_JSONL_PATH)
+    Config.TRACE_PROFILE_SAMPLE_RATE = float(os.getenv("TRACE_PROFILE_SAMPLE_RATE", Config.TRACE_PROFILE_SAMPLE_RATE))
+    Config.TRACE_PROFILE_DIR = os.getenv("TRACE_PROFILE_DIR", Config.TRACE_PROFILE_DIR)
 
 # 加载环境变量配置
 load_env_config()
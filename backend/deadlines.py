@@ -0,0 +1,111 @@
+"""
+流式截止时间：首个片段、片段间隔与整体墙钟预算
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, Optional
+
+from metrics import DEADLINE_EXCEEDED
+
+logger = logging.getLogger(__name__)
+
+FIRST_TOKEN_TIMEOUT = "first_token_timeout"
+IDLE_TIMEOUT = "idle_timeout"
+TOTAL_TIMEOUT = "total_timeout"
+REASONS = (FIRST_TOKEN_TIMEOUT, IDLE_TIMEOUT, TOTAL_TIMEOUT)
+
+_MESSAGES = {
+    FIRST_TOKEN_TIMEOUT: "首个片段超过 {:g} 秒未到达",
+    IDLE_TIMEOUT: "超过 {:g} 秒没有收到新的片段",
+    TOTAL_TIMEOUT: "响应总时长超过 {:g} 秒",
+}
+
+
+class DeadlineExceeded(Exception):
+    """请求超过截止时间，reason 为 first_token_timeout / idle_timeout / total_timeout"""
+
+    def __init__(self, reason: str, limit: float):
+        super().__init__(_MESSAGES[reason].format(limit))
+        self.reason = reason
+        self.limit = limit
+
+
+class Deadlines:
+    """单个请求的截止时间；请求指定的值受服务端上限约束"""
+
+    __slots__ = ("first_token", "idle", "total")
+
+    def __init__(self, first_token: float, idle: float, total: float):
+        self.first_token = first_token
+        self.idle = idle
+        self.total = total
+
+    @classmethod
+    def resolve(cls,
+                defaults: Dict[str, float],
+                max_timeout: float,
+                first_token: Optional[float] = None,
+                idle: Optional[float] = None,
+                total: Optional[float] = None) -> "Deadlines":
+        """合并请求覆盖值与默认值，并限制在 (0, max_timeout] 内"""
+        def clamp(value: Optional[float], default: float) -> float:
+            if value is None or value <= 0:
+                value = default
+            return min(value, max_timeout)
+
+        return cls(
+            clamp(first_token, defaults["first_token"]),
+            clamp(idle, defaults["idle"]),
+            clamp(total, defaults["total"])
+        )
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"first_token": self.first_token, "idle": self.idle, "total": self.total}
+
+
+async def enforce(events: AsyncIterator[Dict[str, Any]],
+                  deadlines: Deadlines) -> AsyncGenerator[Dict[str, Any], None]:
+    """对事件流施加截止时间
+
+    超时时取消正在等待的上游读取并关闭事件流（进而取消上游请求），
+    然后产出一个带 reason 的 error 事件并结束。
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    total_deadline = started + deadlines.total
+    got_content = False
+    iterator = events.__aiter__()
+    try:
+        while True:
+            if got_content:
+                reason, limit = IDLE_TIMEOUT, deadlines.idle
+            else:
+                reason, limit = FIRST_TOKEN_TIMEOUT, deadlines.first_token
+            timeout = limit
+            remaining = total_deadline - loop.time()
+            if remaining <= timeout:
+                reason, limit, timeout = TOTAL_TIMEOUT, deadlines.total, remaining
+            try:
+                event = await asyncio.wait_for(iterator.__anext__(), timeout=max(timeout, 0.0))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                error = DeadlineExceeded(reason, limit)
+                DEADLINE_EXCEEDED.inc(1, reason)
+                logger.warning(f"Stream deadline exceeded: {error}")
+                yield {
+                    "type": "error",
+                    "content": f"流式响应超时: {error}",
+                    "reason": reason,
+                    "timestamp": datetime.now().isoformat()
+                }
+                return
+            if event.get("type") == "content":
+                got_content = True
+            yield event
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
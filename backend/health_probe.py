@@ -0,0 +1,104 @@
+"""
+后台就绪探测
+"""
+
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ReadinessProbe:
+    """周期性探测上游并缓存结果
+
+    /health/ready 只读取最近一次探测结果，不会为每次请求调用模型。
+    探测间隔带随机抖动，避免多个实例同时探测上游。
+    """
+
+    def __init__(self,
+                 probe: Callable[[], Awaitable[Any]],
+                 interval: float = 30.0,
+                 jitter: float = 0.2,
+                 timeout: float = 15.0):
+        self._probe = probe
+        self.interval = interval
+        self.jitter = jitter
+        self.timeout = timeout
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.last_error: Optional[str] = None
+        self.last_latency_ms: Optional[float] = None
+        self.last_probe_at: Optional[str] = None
+        self.probes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+
+    def start(self):
+        """启动后台探测任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """停止后台探测任务"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _next_delay(self) -> float:
+        spread = self.interval * self.jitter
+        return max(self.interval + random.uniform(-spread, spread), 1.0)
+
+    async def _run(self):
+        while True:
+            await self.probe_once()
+            await asyncio.sleep(self._next_delay())
+
+    async def probe_once(self):
+        """执行一次探测并记录结果与耗时"""
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._probe(), timeout=self.timeout)
+            self.ready = True
+            self.last_error = None
+            self.consecutive_failures = 0
+        except Exception as e:
+            self.ready = False
+            self.last_error = str(e) or type(e).__name__
+            self.failures += 1
+            self.consecutive_failures += 1
+            logger.warning(f"Readiness probe failed: {self.last_error}")
+        finally:
+            self.probes += 1
+            self.last_latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            self.last_probe_at = datetime.now().isoformat()
+
+    def uptime(self) -> float:
+        """进程运行秒数"""
+        return round(time.monotonic() - self.started_at, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """最近一次探测结果"""
+        if self.last_probe_at is None:
+            status = "starting"
+        else:
+            status = "ready" if self.ready else "unready"
+        return {
+            "status": status,
+            "ready": self.ready,
+            "last_probe_at": self.last_probe_at,
+            "probe_latency_ms": self.last_latency_ms,
+            "last_error": self.last_error,
+            "probes": self.probes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "interval": self.interval,
+        }
@@ -0,0 +1,147 @@
+"""
+对冲请求：首个 token 迟迟未到时再发一个相同请求，先出 token 者胜出
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Hedger:
+    """对冲策略与执行
+
+    - delay > 0 时使用固定对冲延迟；否则使用滚动 TTFT 样本的分位数（自适应）
+    - 样本不足时退回 max_delay
+    - 每个流都会记录 TTFT，未开启对冲时也保持样本是热的
+    """
+
+    def __init__(self,
+                 delay: float = 0.0,
+                 percentile: float = 0.95,
+                 min_delay: float = 0.5,
+                 max_delay: float = 10.0,
+                 window: int = 500,
+                 min_samples: int = 20):
+        self.fixed_delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self._ttft: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedged_requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def record_ttft(self, seconds: float):
+        self._ttft.append(seconds)
+
+    def ttft_percentile(self) -> Optional[float]:
+        """滚动窗口内的 TTFT 分位数"""
+        if len(self._ttft) < self.min_samples:
+            return None
+        samples = sorted(self._ttft)
+        index = min(int(len(samples) * self.percentile), len(samples) - 1)
+        return samples[index]
+
+    def delay(self) -> float:
+        """当前对冲延迟（秒）"""
+        if self.fixed_delay > 0:
+            return self.fixed_delay
+        estimate = self.ttft_percentile()
+        if estimate is None:
+            return self.max_delay
+        return min(max(estimate, self.min_delay), self.max_delay)
+
+    @staticmethod
+    async def _discard(task: "asyncio.Future[Any]", stream: AsyncIterator[Any]):
+        """取消落败的请求并释放其资源"""
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+        try:
+            await stream.aclose()
+        except Exception:
+            pass
+
+    async def stream(self,
+                     open_stream: Callable[[], AsyncIterator[T]],
+                     enabled: bool = True) -> AsyncGenerator[T, None]:
+        """对冲流式调用；open_stream 每次调用都会发起一个新的上游请求"""
+        self.requests += 1
+        if enabled:
+            self.hedged_requests += 1
+        started = time.perf_counter()
+
+        primary = open_stream()
+        primary_task = asyncio.ensure_future(primary.__anext__())
+        tasks = {primary_task: primary}
+        winner: Optional[AsyncIterator[T]] = None
+        first: Any = None
+        finished = False
+        try:
+            if enabled:
+                await asyncio.wait({primary_task}, timeout=self.delay())
+                if not primary_task.done():
+                    self.hedges += 1
+                    logger.info(f"Hedging stream after {time.perf_counter() - started:.2f}s without first token")
+                    secondary = open_stream()
+                    tasks[asyncio.ensure_future(secondary.__anext__())] = secondary
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None or isinstance(exc, StopAsyncIteration):
+                        winner = tasks[task]
+                        finished = exc is not None
+                        first = None if finished else task.result()
+                        if task is not primary_task:
+                            self.hedge_wins += 1
+                        break
+                    error = error or exc
+
+            # 取消所有落败者
+            for task, stream in tasks.items():
+                if stream is not winner:
+                    await self._discard(task, stream)
+            if winner is None:
+                raise error
+
+            self.record_ttft(time.perf_counter() - started)
+            if finished:
+                return
+            yield first
+            async for item in winner:
+                yield item
+        finally:
+            for task, stream in tasks.items():
+                if not task.done():
+                    await self._discard(task, stream)
+            if winner is not None:
+                await winner.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """对冲统计信息"""
+        p = self.ttft_percentile()
+        return {
+            "requests": self.requests,
+            "hedged_requests": self.hedged_requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.hedged_requests, 4) if self.hedged_requests else 0.0,
+            "hedge_win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            "delay": round(self.delay(), 3),
+            "ttft_percentile": round(p, 3) if p is not None else None,
+            "ttft_samples": len(self._ttft),
+        }
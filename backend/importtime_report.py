@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+导入耗时报告：用 `python -X importtime` 导入应用模块，按顶层包汇总启动耗时
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# -X importtime 的输出格式：import time: <self us> | <cumulative us> | <缩进的模块名>
+_PREFIX = "import time:"
+
+
+def measure(module: str) -> List[Tuple[str, int, int, int]]:
+    """在新进程中导入 module，返回 [(模块名, 自身微秒, 累计微秒, 嵌套深度)]"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=backend_dir, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith(_PREFIX) or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len(_PREFIX):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def summarize(rows: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """按顶层包汇总自身耗时（微秒）"""
+    packages: Dict[str, int] = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".", 1)[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return packages
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="应用模块导入耗时报告")
+    parser.add_argument("module", nargs="?", default="main", help="要导入的模块（默认 main）")
+    parser.add_argument("--top", type=int, default=15, help="显示耗时最多的前 N 项")
+    parser.add_argument("--budget", type=float, default=0, help="总导入耗时预算（毫秒），超出时返回非零状态")
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+    packages = summarize(rows)
+
+    print(f"📦 import {args.module}: 共 {total_us / 1000:.1f} ms，{len(rows)} 个模块")
+    print()
+    print(f"{'顶层包':<32}{'自身耗时 ms':>12}{'占比':>8}")
+    for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<32}{self_us / 1000:>12.1f}{self_us / total_us:>8.1%}")
+    print()
+    print(f"{args.module + ' 直接导入的模块':<48}{'累计耗时 ms':>12}")
+    direct = [row for row in rows if row[3] == 1]
+    for name, _, cumulative_us, _ in sorted(direct, key=lambda row: -row[2])[:args.top]:
+        print(f"{name:<48}{cumulative_us / 1000:>12.1f}")
+
+    if args.budget and total_us / 1000 > args.budget:
+        print(f"\n❌ 超出启动预算 {args.budget:.0f} ms")
+        return 1
+    if args.budget:
+        print(f"\n✅ 在启动预算 {args.budget:.0f} ms 以内")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
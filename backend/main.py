@@ -1,24 +1,67 @@
 import asyncio
-import json
 import logging
-from typing import AsyncGenerator
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime
+from functools import partial
+from typing import AsyncGenerator, Mapping, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError
+from starlette.background import BackgroundTask
 
 from config import Config
 from autogen_manager import autogen_manager
+from admission import AdmissionController, AdmissionRejected, AdmissionTicket
+from aimd import UpstreamBusy
+from metrics import REGISTRY
+from tenants import Tenant, TenantRegistry
+from tokens import estimate_tokens
+from deadlines import DeadlineExceeded
+from sessions import SessionNotFound
+import batch
+import sse
+import tracing
+from profiler import StackSampler
+from ws_chat import WebSocketChatSession
 
 # 配置日志
 logging.basicConfig(level=getattr(logging, Config.LOG_LEVEL), format=Config.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
+async def sync_shared_state(shared):
+    """定期发布本进程的指标与统计快照，并清理共享存储中的过期数据（数据库操作在线程池中执行）"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, shared.publish, "metrics", REGISTRY.snapshot())
+            await loop.run_in_executor(None, shared.publish, "stats", collect_stats())
+            await loop.run_in_executor(None, shared.purge)
+        except Exception as e:
+            logger.warning(f"Shared state sync failed: {e}")
+        await asyncio.sleep(Config.SHARED_STATE_SYNC_INTERVAL)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动/停止后台任务"""
+    await autogen_manager.startup()
+    sync_task = None
+    if autogen_manager.shared_state is not None:
+        sync_task = asyncio.create_task(sync_shared_state(autogen_manager.shared_state))
+    yield
+    if sync_task is not None:
+        sync_task.cancel()
+    await autogen_manager.shutdown()
+    trace_store.close()
+
 app = FastAPI(
     title="AutoGen Chat API",
     version="1.0.0",
-    description="基于AutoGen 0.5.7的智能对话API"
+    description="基于AutoGen 0.5.7的智能对话API",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -27,28 +70,195 @@ app.add_middleware(
     **Config.get_cors_config()
 )
 
+# 请求追踪：请求 ID 写入 X-Request-ID 响应头，最近请求的 span 见 /debug/traces
+tracing_config = Config.get_tracing_config()
+trace_store = tracing.TraceStore(tracing_config["max_traces"], tracing_config["jsonl_path"])
+if Config.TRACING_ENABLED:
+    app.add_middleware(
+        tracing.TracingMiddleware,
+        store=trace_store,
+        sampler=StackSampler(tracing_config["profile_dir"], tracing_config["profile_interval"]),
+        profile_sample_rate=tracing_config["profile_sample_rate"]
+    )
+
+# 准入控制：流式与非流式请求分别限流
+chat_admission = AdmissionController("chat", **Config.get_admission_config("chat"))
+stream_admission = AdmissionController("stream", **Config.get_admission_config("stream"))
+batch_runner = batch.BatchRunner(**Config.get_batch_config())
+# 租户：按 API Key / X-Client-ID 限流，排队时按权重公平分配名额
+tenant_registry = TenantRegistry(**Config.get_tenant_config())
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """未准入的请求快速返回 429/503"""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 class ChatRequest(BaseModel):
     message: str
     system_message: str = Config.DEFAULT_SYSTEM_MESSAGE
+    # 仅对 /chat/stream 生效：为空时使用 Config.STREAM_USE_AGENT
+    use_agent: Optional[bool] = None
+    # 为 False 时跳过响应缓存
+    use_cache: bool = True
+    # 为空时使用 Config.HEDGE_ENABLED
+    hedge: Optional[bool] = None
+    # 排队截止时间（秒），为空时使用 Config.ADMISSION_QUEUE_TIMEOUT
+    queue_timeout: Optional[float] = None
+    # 响应截止时间（秒），为空时使用 Config.STREAM_TIMEOUT / STREAM_TOTAL_TIMEOUT，受 STREAM_MAX_TIMEOUT 限制
+    first_token_timeout: Optional[float] = None
+    idle_timeout: Optional[float] = None
+    total_timeout: Optional[float] = None
+    # 会话 ID（由 POST /sessions 生成）：带上服务端保存的历史并追加本轮问答，不存在时返回 404
+    session_id: Optional[str] = Field(None, pattern=r"^[A-Za-z0-9_\-]{1,64}$")
 
 class ChatResponse(BaseModel):
     response: str
 
-async def generate_stream_response(message: str, system_message: str) -> AsyncGenerator[str, None]:
-    """生成流式响应"""
+class SessionCreateRequest(BaseModel):
+    system_message: str = Config.DEFAULT_SYSTEM_MESSAGE
+
+async def admit(controller: AdmissionController,
+                tenant: Tenant,
+                request: Optional["ChatRequest"] = None) -> AdmissionTicket:
+    """扣除租户的请求与预计 token 额度后排队等待准入；request 为空时只计请求数"""
+    tokens = 0
+    timeout = None
+    if request is not None:
+        prompt_tokens = estimate_tokens(request.message) + estimate_tokens(request.system_message)
+        tokens = tenant_registry.estimate_tokens(prompt_tokens)
+        timeout = request.queue_timeout
+    tenant_registry.throttle(tenant, tokens)
+    try:
+        return await controller.acquire(timeout, tenant)
+    except BaseException:
+        # 队列已满、排队超时或客户端断开：请求没有到达上游，退回额度
+        tenant_registry.refund(tenant, tokens)
+        raise
+
+def upstream_busy(e: UpstreamBusy) -> AdmissionRejected:
+    """上游并发名额等待超时：与排队超时一样返回 503 + Retry-After"""
+    return AdmissionRejected(503, str(e), e.retry_after)
+
+def require_sessions():
+    """会话功能未开启时返回 404"""
+    if autogen_manager.sessions is None:
+        raise HTTPException(status_code=404, detail="会话功能未开启")
+    return autogen_manager.sessions
+
+async def require_session(session_id: Optional[str]):
+    """请求带 session_id 时确认会话存在，不存在或已过期时返回 404"""
+    if session_id is not None and await require_sessions().get(session_id) is None:
+        raise HTTPException(status_code=404, detail="会话不存在或已过期")
+
+async def open_chat_events(request: ChatRequest,
+                           last_event_id: Optional[str] = None,
+                           ticket: Optional[AdmissionTicket] = None) -> AsyncGenerator[dict, None]:
+    """chat_stream 事件流（/chat/stream 与 /ws 共用）
+
+    带 Last-Event-ID 时从断点续传；流已过期时先产出 restart 事件，再重新生成完整回复。
+    本请求创建的上游在客户端断开后的续传窗口内继续占用 ticket 的名额，直到上游停止。
+    """
+    deadlines = autogen_manager.resolve_deadlines(
+        request.first_token_timeout, request.idle_timeout, request.total_timeout
+    )
+    events = None
+    if last_event_id:
+        events = autogen_manager.resume_stream(last_event_id, deadlines)
+        if events is None:
+            logger.info(f"Cannot resume from {last_event_id}, regenerating")
+            yield {"type": "restart", "content": "", "reason": "resume_expired"}
+    if events is None:
+        events = autogen_manager.chat_stream(
+            request.message,
+            request.system_message,
+            use_agent=request.use_agent,
+            use_cache=request.use_cache,
+            hedge=request.hedge,
+            deadlines=deadlines,
+            session_id=request.session_id,
+            hold=ticket.hold if ticket is not None else None
+        )
     try:
-        logger.info(f"Starting stream response for message: {message[:50]}...")
+        async for event in events:
+            yield event
+    finally:
+        await events.aclose()
 
-        async for chunk in autogen_manager.chat_stream(message, system_message):
-            # 格式化为SSE格式
-            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+async def generate_stream_response(request: ChatRequest,
+                                   ticket: Optional[AdmissionTicket] = None,
+                                   last_event_id: Optional[str] = None) -> AsyncGenerator[bytes, None]:
+    """生成流式响应，结束时释放准入名额"""
+    # 格式化为SSE格式：相邻内容片段合并为一帧
+    frames = sse.encode_stream(
+        open_chat_events(request, last_event_id, ticket),
+        max_bytes=Config.STREAM_CHUNK_SIZE,
+        flush_interval=Config.STREAM_FLUSH_INTERVAL
+    )
+    try:
+        logger.info(f"Starting stream response for message: {request.message[:50]}...")
+
+        async for frame in frames:
+            yield frame
 
         logger.info("Stream response completed")
 
     except Exception as e:
         logger.error(f"Stream response error: {e}")
-        error_data = {"type": "error", "content": f"错误: {str(e)}"}
-        yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+        yield sse.encode_event({"type": "error", "content": f"错误: {str(e)}"})
+    finally:
+        # 客户端断开时 SSEResponse 会关闭本生成器，这里逐层关闭以立即取消上游
+        await frames.aclose()
+        if ticket is not None:
+            ticket.release()
+
+async def generate_batch_response(request: Request,
+                                  concurrency: int,
+                                  tenant: Tenant,
+                                  body_done: asyncio.Event) -> AsyncGenerator[bytes, None]:
+    """边读请求体边执行批量请求，每项单独占用 chat 准入名额"""
+    async def handle(item) -> str:
+        try:
+            chat_request = ChatRequest.model_validate(item)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors(include_url=False))) from None
+        await require_session(chat_request.session_id)
+        # 与 /chat 相同：排队、限流与拒绝按项生效，未准入的项以 429/503 结果返回
+        ticket = await admit(chat_admission, tenant, chat_request)
+        async with ticket:
+            try:
+                return await autogen_manager.chat_completion(
+                    chat_request.message,
+                    chat_request.system_message,
+                    use_cache=chat_request.use_cache,
+                    hedge=chat_request.hedge,
+                    deadlines=autogen_manager.resolve_deadlines(total=chat_request.total_timeout),
+                    session_id=chat_request.session_id
+                )
+            except UpstreamBusy as e:
+                raise upstream_busy(e) from None
+            except SessionNotFound as e:
+                raise HTTPException(status_code=404, detail=str(e)) from None
+            except DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail={"reason": e.reason, "message": str(e)}) from None
+
+    items = batch.iter_items(
+        batch.read_body(request, body_done),
+        Config.BATCH_MAX_ITEMS,
+        Config.BATCH_MAX_ITEM_BYTES
+    )
+    lines = batch.encode_ndjson(batch_runner.run(items, handle, concurrency))
+    try:
+        async for line in lines:
+            yield line
+    except Exception as e:
+        logger.error(f"Batch response error: {e}")
+        yield sse.dumps({"error": f"错误: {str(e)}"}) + b"\n"
+    finally:
+        await lines.aclose()
 
 @app.get("/")
 async def root():
@@ -61,33 +271,143 @@ async def root():
     }
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """非流式聊天接口"""
-    try:
-        logger.info(f"Chat request: {request.message[:50]}...")
-        result = await autogen_manager.chat_completion(request.message, request.system_message)
-        return ChatResponse(response=result)
-    except Exception as e:
-        logger.error(f"Chat endpoint error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    tracing.event("handler_start")
+    await require_session(request.session_id)
+    with tracing.span("admission"):
+        ticket = await admit(chat_admission, tenant_registry.resolve(http_request.headers), request)
+    async with ticket:
+        try:
+            logger.info(f"Chat request: {request.message[:50]}...")
+            result = await autogen_manager.chat_completion(
+                request.message,
+                request.system_message,
+                use_cache=request.use_cache,
+                hedge=request.hedge,
+                deadlines=autogen_manager.resolve_deadlines(total=request.total_timeout),
+                session_id=request.session_id
+            )
+            return ChatResponse(response=result)
+        except UpstreamBusy as e:
+            raise upstream_busy(e) from None
+        except SessionNotFound as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except DeadlineExceeded as e:
+            logger.warning(f"Chat deadline exceeded: {e}")
+            raise HTTPException(status_code=504, detail={"reason": e.reason, "message": str(e)})
+        except Exception as e:
+            logger.error(f"Chat endpoint error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/chat/stream")
-async def chat_stream_endpoint(request: ChatRequest):
-    """流式聊天接口"""
+async def chat_stream_endpoint(request: ChatRequest,
+                               http_request: Request,
+                               last_event_id: Optional[str] = Header(None)):
+    """流式聊天接口，支持 Last-Event-ID 断线续传"""
     logger.info(f"Stream chat request: {request.message[:50]}...")
-    return StreamingResponse(
-        generate_stream_response(request.message, request.system_message),
+    await require_session(request.session_id)
+    tracing.event("handler_start")
+    with tracing.span("admission"):
+        ticket = await admit(stream_admission, tenant_registry.resolve(http_request.headers), request)
+    return sse.SSEResponse(
+        generate_stream_response(request, ticket, last_event_id),
         media_type="text/plain",
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
             "Content-Type": "text/event-stream",
-        }
+        },
+        # 生成器未被迭代（如客户端提前断开）时兜底释放名额
+        background=BackgroundTask(ticket.release)
     )
 
+@app.post("/chat/batch")
+async def chat_batch_endpoint(request: Request, concurrency: Optional[int] = None):
+    """批量聊天接口
+
+    请求体为 ChatRequest 的 JSON 数组或 NDJSON，边读边执行；
+    结果按完成顺序以 NDJSON 返回，每行带 index，单项失败不影响其他项。
+    """
+    tracing.event("handler_start")
+    tenant = tenant_registry.resolve(request.headers)
+    body_done = asyncio.Event()
+    return batch.NDJSONResponse(
+        generate_batch_response(request, batch_runner.resolve_concurrency(concurrency), tenant, body_done),
+        body_done
+    )
+
+async def open_ws_stream(headers: Mapping[str, str], message: dict):
+    """/ws 上打开一个聊天流：校验请求并占用 stream 准入名额，租户按连接的握手请求头识别"""
+    try:
+        request = ChatRequest.model_validate(message)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=jsonable_encoder(e.errors(include_url=False))) from None
+    await require_session(request.session_id)
+    ticket = await admit(stream_admission, tenant_registry.resolve(headers), request)
+    logger.info(f"WebSocket stream request: {request.message[:50]}...")
+    return open_chat_events(request, message.get("last_event_id"), ticket), ticket.release
+
+@app.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """多路复用聊天接口：一条连接上按 stream 字段区分多个并发流"""
+    await websocket.accept()
+    session = WebSocketChatSession(websocket, partial(open_ws_stream, websocket.headers), **Config.get_websocket_config())
+    await session.run()
+
+@app.post("/sessions")
+async def create_session(request: SessionCreateRequest):
+    """创建会话"""
+    session = await require_sessions().create(request.system_message)
+    return session.to_dict()
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str, limit: int = 100):
+    """会话信息与最近 limit 条消息"""
+    sessions = require_sessions()
+    session = await sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    messages = await sessions.history(session_id, max(1, min(limit, 1000)))
+    return {**session.to_dict(), "messages": [m.to_dict() for m in messages]}
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    """删除会话"""
+    if not await require_sessions().delete(session_id):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    return {"deleted": session_id}
+
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
+    """健康检查接口：返回后台探测缓存的就绪状态，不调用模型"""
+    return {
+        **autogen_manager.readiness.snapshot(),
+        "model": Config.MODEL_NAME,
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/health/live")
+async def liveness_check():
+    """存活探测：不访问网络"""
+    return {
+        "status": "alive",
+        "uptime": autogen_manager.readiness.uptime(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+@app.get("/health/ready")
+async def readiness_check():
+    """就绪探测：未就绪时返回 503"""
+    snapshot = autogen_manager.readiness.snapshot()
+    return JSONResponse(
+        content={**snapshot, "timestamp": datetime.now().isoformat()},
+        status_code=200 if snapshot["ready"] else 503
+    )
+
+@app.get("/health/deep")
+async def deep_health_check():
+    """深度健康检查：实时调用一次模型"""
     try:
         health_info = await autogen_manager.health_check()
         return health_info
@@ -95,15 +415,76 @@ async def health_check():
         logger.error(f"Health check error: {e}")
         return {"status": "unhealthy", "error": str(e)}
 
-@app.get("/stats")
-async def get_stats():
-    """获取统计信息"""
+def collect_stats():
+    """本进程的统计信息"""
     return {
-        "agent_count": autogen_manager.get_agent_count(),
+        "worker": os.getpid(),
+        "agent_pool": autogen_manager.get_agent_pool_stats(),
+        "response_cache": autogen_manager.get_response_cache_stats(),
+        "sessions": autogen_manager.get_session_stats(),
+        "stream_broadcast": autogen_manager.get_broadcast_stats(),
+        "stream_aborts": autogen_manager.get_abort_stats(),
+        "upstream_pool": autogen_manager.get_upstream_pool_stats(),
+        "upstreams": autogen_manager.get_router_stats(),
+        "hedging": autogen_manager.get_hedge_stats(),
+        "batch": batch_runner.stats(),
+        "admission": {
+            "chat": chat_admission.stats(),
+            "stream": stream_admission.stats()
+        },
+        "tenants": tenant_registry.stats(),
         "model": Config.MODEL_NAME,
         "base_url": Config.BASE_URL
     }
 
+@app.get("/stats")
+async def get_stats(scope: str = "worker"):
+    """获取统计信息；scope=cluster 时返回所有 worker 最近发布的统计"""
+    stats = collect_stats()
+    shared = autogen_manager.shared_state
+    if scope != "cluster" or shared is None:
+        return stats
+    workers = await asyncio.get_running_loop().run_in_executor(None, shared.collect, "stats")
+    workers[os.getpid()] = stats
+    return {"workers": [workers[pid] for pid in sorted(workers)]}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式指标；多 worker 部署时为所有 worker 之和"""
+    shared = autogen_manager.shared_state
+    if shared is None:
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+    # 先发布本进程的最新快照，保证本进程的数据不滞后
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, shared.publish, "metrics", REGISTRY.snapshot())
+    workers = await loop.run_in_executor(None, shared.collect, "metrics")
+    snapshots = list(workers.values()) or [REGISTRY.snapshot()]
+    return PlainTextResponse(REGISTRY.render(snapshots), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/traces")
+async def list_traces(limit: int = 50,
+                      min_duration_ms: float = 0.0,
+                      path: Optional[str] = None,
+                      client_request_id: Optional[str] = None):
+    """最近请求的 span 追踪，按时间倒序；client_request_id 按客户端传入的 X-Request-ID 过滤"""
+    return {"traces": trace_store.recent(min(limit, 500), min_duration_ms, path, client_request_id)}
+
+@app.get("/debug/traces/{request_id}")
+async def get_trace(request_id: str):
+    """单个请求的 span 追踪"""
+    record = trace_store.get(request_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="trace not found")
+    return record
+
+@app.get("/debug/traces/{request_id}/profile")
+async def get_trace_profile(request_id: str):
+    """被采样请求的栈分析结果（collapsed stack 文本）"""
+    record = trace_store.get(request_id)
+    if record is None or not record["profile"] or not os.path.exists(record["profile"]):
+        raise HTTPException(status_code=404, detail="profile not found")
+    return FileResponse(record["profile"], media_type="text/plain")
+
 if __name__ == "__main__":
     import uvicorn
     logger.info("Starting AutoGen Chat API server...")
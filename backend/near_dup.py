@@ -0,0 +1,237 @@
+"""
+近似重复提示检索：SimHash 指纹 + 分段 LSH 索引（纯本地计算，不依赖向量服务）
+"""
+
+import hashlib
+import itertools
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+_LANE_BITS = 16
+
+# 中日韩字符按字切分，其余按词切分
+_CJK_CHARS = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+_TOKEN = re.compile(f"[{_CJK_CHARS}]+|[^\\W_{_CJK_CHARS}]+")
+_CJK = re.compile(f"[{_CJK_CHARS}]")
+
+# SimHash 按位计数用的查表：把 8 位展开到 8 个 16 位计数槽，
+# 指纹逐字节查表后相加即可一次完成 64 个位置的计数（大整数加法在 C 中完成）
+# 首次计算指纹时才构建，不计入启动耗时
+_SPREAD_TABLES: List[List[int]] = []
+
+
+def _spread_tables() -> List[List[int]]:
+    if not _SPREAD_TABLES:
+        _SPREAD_TABLES.extend(
+            [sum(((value >> bit) & 1) << ((byte * 8 + bit) * _LANE_BITS) for bit in range(8)) for value in range(256)]
+            for byte in range(FINGERPRINT_BITS // 8)
+        )
+    return _SPREAD_TABLES
+
+
+_LANE_MASK = (1 << _LANE_BITS) - 1
+# 每个计数槽最多计到 _LANE_MASK，超过会进位到相邻槽，因此只取前这么多个特征
+MAX_FEATURES = _LANE_MASK
+
+
+if hasattr(int, "bit_count"):  # Python 3.10+
+    _popcount = int.bit_count
+else:
+    def _popcount(value: int) -> int:
+        return bin(value).count("1")
+
+
+def normalize(text: str) -> str:
+    """全角转半角、统一大小写、去掉标点符号并合并空白"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(" " if unicodedata.category(ch)[0] in "PSZC" else ch for ch in text)
+    return " ".join(text.split())
+
+
+def shingles(text: str) -> List[str]:
+    """中文按相邻两字、英文按单词和相邻两词切分，按首次出现的顺序去重后返回"""
+    # dict 保持插入顺序，截断特征时结果与进程的哈希种子无关
+    result: Dict[str, None] = {}
+    previous_word: Optional[str] = None
+    for token in _TOKEN.findall(normalize(text)):
+        if _CJK.match(token):
+            previous_word = None
+            if len(token) == 1:
+                result[token] = None
+            else:
+                result.update(dict.fromkeys(token[i:i + 2] for i in range(len(token) - 1)))
+        else:
+            result[token] = None
+            if previous_word is not None:
+                result[f"{previous_word} {token}"] = None
+            previous_word = token
+    return list(result)
+
+
+def simhash(features: List[str]) -> int:
+    """64 位 SimHash：每一位取多数特征哈希在该位的取值；只使用前 MAX_FEATURES 个特征"""
+    features = features[:MAX_FEATURES]
+    tables = _spread_tables()
+    counts = 0
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        counts += sum(table[b] for table, b in zip(tables, digest))
+    total = len(features)
+    fingerprint = 0
+    for position in range(FINGERPRINT_BITS):
+        if ((counts >> (position * _LANE_BITS)) & _LANE_MASK) * 2 > total:
+            fingerprint |= 1 << position
+    return fingerprint
+
+
+def similarity(a: int, b: int) -> float:
+    """两个指纹的相似度：1 - 汉明距离 / 64"""
+    return 1.0 - _popcount(a ^ b) / FINGERPRINT_BITS
+
+
+def bands_for(threshold: float) -> int:
+    """保证找出相似度 ≥ threshold 的全部近似项所需的最少分段数（64 的约数）"""
+    max_distance = int((1.0 - threshold) * FINGERPRINT_BITS + 1e-9)
+    return next(b for b in (1, 2, 4, 8, 16, 32, 64) if b > max_distance)
+
+
+class NearKey:
+    """一次请求的近似查询参数"""
+
+    __slots__ = ("namespace", "fingerprint", "threshold")
+
+    def __init__(self, namespace: str, fingerprint: int, threshold: float):
+        self.namespace = namespace
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+
+
+class SimHashIndex:
+    """SimHash 分段索引
+
+    64 位指纹分成 bands 段，任意一段相同即为候选，再按汉明距离精确比较。
+    汉明距离不超过 bands - 1 的指纹必然至少有一段相同（鸽巢原理），
+    因此 4 段可保证找出相似度 ≥ 0.953 的全部近似项；每段 16 位，
+    数十万条目时每段桶内平均只有个位数候选，查询在微秒级完成。
+    bands 为空时按 min_threshold 取所需的最少段数；指定的段数不足以覆盖 min_threshold 时抛出 ValueError。
+    不同命名空间（模型 + 系统消息）互不匹配。
+    """
+
+    def __init__(self, bands: Optional[int] = None, min_shingles: int = 6, min_threshold: float = 0.95):
+        required = bands_for(min_threshold)
+        if bands is None:
+            bands = required
+        if FINGERPRINT_BITS % bands:
+            raise ValueError("bands must divide 64")
+        if bands < required:
+            raise ValueError(
+                f"bands={bands} cannot find all matches at threshold {min_threshold}; need at least {required}"
+            )
+        self.bands = bands
+        self.band_bits = FINGERPRINT_BITS // bands
+        self.min_shingles = min_shingles
+        # 命名空间 -> 编号；命名空间的最后一个条目被移除时一并删除
+        self._namespaces: Dict[str, int] = {}
+        self._namespace_names: Dict[int, str] = {}
+        self._namespace_sizes: Dict[int, int] = {}
+        self._namespace_ids = itertools.count()
+        # key -> (命名空间编号, 指纹)
+        self._entries: Dict[str, Tuple[int, int]] = {}
+        # (命名空间编号, 段号, 段值) 编码为整数 -> 缓存键列表
+        self._buckets: Dict[int, List[str]] = {}
+        self.lookups = 0
+        self.candidates = 0
+        self.matches = 0
+
+    def fingerprint(self, text: str) -> Optional[int]:
+        """计算指纹；特征过少（过短的提示）时返回 None，只做精确匹配"""
+        features = shingles(text)
+        if len(features) < self.min_shingles:
+            return None
+        return simhash(features)
+
+    def _bucket_ids(self, namespace_id: int, fingerprint: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [
+            (((namespace_id * self.bands) + band) << self.band_bits) | ((fingerprint >> (band * self.band_bits)) & mask)
+            for band in range(self.bands)
+        ]
+
+    def add(self, namespace: str, fingerprint: int, key: str):
+        """登记缓存键的指纹"""
+        self.remove(key)
+        namespace_id = self._namespaces.get(namespace)
+        if namespace_id is None:
+            namespace_id = next(self._namespace_ids)
+            self._namespaces[namespace] = namespace_id
+            self._namespace_names[namespace_id] = namespace
+        self._namespace_sizes[namespace_id] = self._namespace_sizes.get(namespace_id, 0) + 1
+        self._entries[key] = (namespace_id, fingerprint)
+        for bucket_id in self._bucket_ids(namespace_id, fingerprint):
+            self._buckets.setdefault(bucket_id, []).append(key)
+
+    def remove(self, key: str):
+        """缓存条目被淘汰时移除"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for bucket_id in self._bucket_ids(*entry):
+            bucket = self._buckets.get(bucket_id)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(key)
+            except ValueError:
+                pass
+            if not bucket:
+                del self._buckets[bucket_id]
+        namespace_id = entry[0]
+        size = self._namespace_sizes[namespace_id] - 1
+        if size:
+            self._namespace_sizes[namespace_id] = size
+        else:
+            del self._namespace_sizes[namespace_id]
+            del self._namespaces[self._namespace_names.pop(namespace_id)]
+
+    def lookup(self, namespace: str, fingerprint: int, threshold: float) -> Optional[Tuple[str, float]]:
+        """返回相似度不低于阈值的最相似缓存键及其相似度"""
+        self.lookups += 1
+        namespace_id = self._namespaces.get(namespace)
+        if namespace_id is None:
+            return None
+        best: Optional[Tuple[str, float]] = None
+        seen = set()
+        for bucket_id in self._bucket_ids(namespace_id, fingerprint):
+            for key in self._buckets.get(bucket_id, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = similarity(fingerprint, self._entries[key][1])
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (key, score)
+        self.candidates += len(seen)
+        if best is not None:
+            self.matches += 1
+        return best
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+        self._namespaces.clear()
+        self._namespace_names.clear()
+        self._namespace_sizes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "namespaces": len(self._namespaces),
+            "buckets": len(self._buckets),
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "avg_candidates": round(self.candidates / self.lookups, 2) if self.lookups else 0.0,
+        }
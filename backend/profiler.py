@@ -0,0 +1,89 @@
+"""
+采样式栈分析器（输出 collapsed stack，可直接用 flamegraph.pl / speedscope 查看）
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _collapse(frame) -> str:
+    """把栈帧转换为 "文件:函数;文件:函数" 形式，根在前"""
+    parts: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    parts.reverse()
+    return ";".join(parts)
+
+
+class StackSampler:
+    """后台线程周期性读取事件循环线程的栈
+
+    只在有被采样的请求时运行；同一时刻事件循环上可能交错执行多个请求，
+    因此每份结果反映的是该请求存续期间整个事件循环线程的热点。
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.005):
+        self.output_dir = output_dir
+        self.interval = interval
+        self._sessions: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._target_thread: Optional[int] = None
+        self.profiles = 0
+
+    def begin(self, session_id: str):
+        """开始采样，需在事件循环线程中调用"""
+        with self._lock:
+            self._sessions[session_id] = Counter()
+            self._target_thread = threading.get_ident()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def end(self, session_id: str) -> Optional[str]:
+        """结束采样并写出结果，返回文件路径"""
+        with self._lock:
+            stacks = self._sessions.pop(session_id, None)
+        if not stacks:
+            return None
+        self.profiles += 1
+        path = os.path.join(self.output_dir, f"{session_id}.collapsed")
+        try:
+            # 写文件放到线程池，避免阻塞事件循环
+            asyncio.get_running_loop().run_in_executor(None, self._write, path, stacks)
+        except RuntimeError:
+            self._write(path, stacks)
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._target_thread)
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+                if frame is None:
+                    continue
+                stack = _collapse(frame)
+                for stacks in self._sessions.values():
+                    stacks[stack] += 1
+
+    def _write(self, path: str, stacks: Counter):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning(f"Failed to write profile {path}: {e}")
@@ -0,0 +1,226 @@
+"""
+响应缓存（LRU + TTL + 内存上限）与单飞去重
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from near_dup import NearKey, SimHashIndex
+from shared_state import SharedStore
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    """缓存条目：按顺序保存的响应片段"""
+
+    __slots__ = ("chunks", "size", "expires_at")
+
+    def __init__(self, chunks: List[str], size: int, expires_at: float):
+        self.chunks = chunks
+        self.size = size
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """进程内响应缓存
+
+    以 (model, system_message, message) 为键保存完整响应的片段列表：
+    /chat 直接拼接返回，/chat/stream 按原片段回放。
+    同一个键的并发未命中请求只触发一次上游调用，其余请求共享结果。
+    提供 index 时，精确未命中的请求还会按 SimHash 查找同一命名空间内的近似重复提示。
+    提供 shared 时作为多进程共享的二级存储：本进程未命中时查共享存储，写入时同时写入共享存储；
+    共享存储的读写在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 ttl: float = 3600.0,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 index: Optional[SimHashIndex] = None,
+                 shared: Optional[SharedStore] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.index = index
+        self.shared = shared
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[List[str]]"] = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.near_hits = 0
+        self.shared_hits = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def make_key(model: str, system_message: str, message: str) -> str:
+        """生成缓存键"""
+        raw = json.dumps([model, system_message, message], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _chunks_size(chunks: List[str]) -> int:
+        return sum(len(c.encode("utf-8")) for c in chunks)
+
+    def _lookup(self, key: str) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at < time.monotonic():
+            self._remove(key)
+            entry = None
+        return entry
+
+    async def get(self, key: str, near: Optional[NearKey] = None) -> Optional[List[str]]:
+        """查询缓存，命中返回片段列表；精确未命中时按 near 查找近似重复，再查共享存储"""
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None and near is not None and self.index is not None:
+                match = self.index.lookup(near.namespace, near.fingerprint, near.threshold)
+                if match is not None:
+                    entry = self._lookup(match[0])
+                    if entry is not None:
+                        key = match[0]
+                        self.near_hits += 1
+                        logger.info(f"Near-duplicate cache hit (similarity {match[1]:.3f})")
+            if entry is not None:
+                return self._hit(key, entry)
+
+        shared = None
+        if self.shared is not None:
+            shared = await asyncio.get_running_loop().run_in_executor(None, self.shared.cache_get, key)
+        with self._lock:
+            if shared is None:
+                self.misses += 1
+                return None
+            chunks, expires_at = shared
+            size = self._chunks_size(chunks)
+            self.hits += 1
+            self.shared_hits += 1
+            self.bytes_saved += size
+            if size <= self.max_bytes:
+                # 共享存储使用墙上时钟，换算为本进程的单调时钟
+                self._insert(key, chunks, size, time.monotonic() + expires_at - time.time(), near)
+            return chunks
+
+    def _hit(self, key: str, entry: _CacheEntry) -> List[str]:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_saved += entry.size
+        return entry.chunks
+
+    def put(self, key: str, chunks: List[str], near: Optional[NearKey] = None):
+        """写入缓存，超过单条上限的响应不缓存；带 near 时同时登记指纹"""
+        size = self._chunks_size(chunks)
+        if not chunks or size > self.max_bytes:
+            return
+        with self._lock:
+            self._insert(key, list(chunks), size, time.monotonic() + self.ttl, near)
+        if self.shared is not None:
+            # 不等待共享写入完成：写入失败只影响其他 worker 的命中率
+            asyncio.get_running_loop().run_in_executor(
+                None, self.shared.cache_put, key, list(chunks), size, time.time() + self.ttl
+            )
+
+    def _insert(self, key: str, chunks: List[str], size: int, expires_at: float,
+                near: Optional[NearKey]):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = _CacheEntry(chunks, size, expires_at)
+        self._bytes += size
+        if near is not None and self.index is not None:
+            self.index.add(near.namespace, near.fingerprint, key)
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+        if self.index is not None:
+            self.index.remove(key)
+
+    async def get_or_compute(self,
+                             key: str,
+                             compute: Callable[[], Awaitable[List[str]]],
+                             near: Optional[NearKey] = None) -> List[str]:
+        """查询缓存；未命中时调用 compute，并发的相同请求合并为一次上游调用"""
+        task = self._inflight.get(key)
+        if task is None:
+            cached = await self.get(key, near)
+            if cached is not None:
+                return cached
+            # 查询共享存储期间可能已有其他调用方开始计算；get() 已记为未命中，合并时改记为命中
+            task = self._inflight.get(key)
+            if task is not None:
+                with self._lock:
+                    self.misses -= 1
+
+        if task is not None:
+            with self._lock:
+                self.hits += 1
+                self.coalesced += 1
+            chunks = await asyncio.shield(task)
+            with self._lock:
+                self.bytes_saved += self._chunks_size(chunks)
+            return chunks
+
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._on_computed(key, t, near))
+        # shield: 单个调用方被取消时，上游调用仍为其他等待者继续
+        return await asyncio.shield(task)
+
+    def _on_computed(self, key: str, task: "asyncio.Task[List[str]]", near: Optional[NearKey] = None):
+        """单飞任务完成回调：清理进行中记录并写入缓存"""
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            return
+        self.put(key, task.result(), near)
+
+    def clear(self):
+        """清空缓存（包括共享存储）"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self.index is not None:
+                self.index.clear()
+        if self.shared is not None:
+            self.shared.cache_clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "inflight": len(self._inflight),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "near_hits": self.near_hits,
+                "shared_hits": self.shared_hits,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+            if self.index is not None:
+                stats["near_dup"] = self.index.stats()
+        if self.shared is not None:
+            stats["shared"] = self.shared.stats()
+        return stats
@@ -0,0 +1,417 @@
+"""
+会话存储：内存 LRU + SQLite（WAL）持久化，按 token 预算裁剪上下文
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+ASSISTANT = "assistant"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    system_message TEXT NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    summary_tokens INTEGER NOT NULL DEFAULT 0,
+    window_start INTEGER NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+"""
+
+
+class SessionNotFound(LookupError):
+    """会话不存在或已过期"""
+
+
+class SessionMessage:
+    """会话中的一条消息，token 数在写入时计算并随消息保存"""
+
+    __slots__ = ("seq", "role", "content", "tokens")
+
+    def __init__(self, seq: int, role: str, content: str, tokens: Optional[int] = None):
+        self.seq = seq
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content) if tokens is None else tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"seq": self.seq, "role": self.role, "content": self.content, "tokens": self.tokens}
+
+
+class Session:
+    """一个会话
+
+    window 只保存上下文窗口内（序号 ≥ window_start）的消息；更早的消息只在数据库中，
+    其内容（开启摘要时）浓缩在 summary 里。
+    """
+
+    __slots__ = ("id", "system_message", "summary", "summary_tokens", "window_start",
+                 "message_count", "window", "created_at", "updated_at")
+
+    def __init__(self, session_id: str, system_message: str, created_at: float):
+        self.id = session_id
+        self.system_message = system_message
+        self.summary = ""
+        self.summary_tokens = 0
+        self.window_start = 0
+        self.message_count = 0
+        self.window: List[SessionMessage] = []
+        self.created_at = created_at
+        self.updated_at = created_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.id,
+            "system_message": self.system_message,
+            "summary": self.summary,
+            "message_count": self.message_count,
+            "window_start": self.window_start,
+            "window_tokens": sum(m.tokens for m in self.window),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+# 摘要函数：(已有摘要, 被移出窗口的消息) -> 新摘要
+Summarizer = Callable[[str, List[SessionMessage]], Awaitable[str]]
+
+
+class SessionStore:
+    """会话存储
+
+    - 最近使用的 max_cached 个会话保存在内存中，其余按需从 SQLite 加载
+    - db_path 为空时只保存在内存中，进程重启后丢失
+    - SQLite 使用 WAL 模式，读写在线程池中执行，不阻塞事件循环
+    - 超过 ttl 秒未更新的会话视为不存在，start() 后每 purge_interval 秒从内存与数据库中删除
+    - 数据库在第一次读写时才打开（按进程），创建实例不会产生文件
+    - shared=True 时数据库由多个进程共用：内存命中后仍核对数据库中的 updated_at，
+      其他进程更新过的会话重新加载，已删除的会话从内存移除
+    - 会话 ID 只由 create() 随机生成，持有 ID 即可访问会话，客户端不能指定 ID
+    - 消息序号在写入事务内按数据库中的最大序号分配，并发写入同一会话（含多个进程）不会互相覆盖
+    """
+
+    def __init__(self, db_path: str = "", max_cached: int = 1024, ttl: float = 7 * 24 * 3600,
+                 shared: bool = False, purge_interval: float = 3600.0):
+        self.db_path = db_path
+        self.max_cached = max_cached
+        self.ttl = ttl
+        self.shared = shared and bool(db_path)
+        self.purge_interval = purge_interval
+        self._cache: "OrderedDict[str, Session]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._pid = os.getpid()
+        self._db_lock = threading.Lock()
+        self._purge_task: Optional["asyncio.Task[None]"] = None
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.misses = 0
+        self.created = 0
+        self.appended = 0
+        self.trims = 0
+        self.summaries = 0
+        self.summary_failures = 0
+        self.purged = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """按进程懒连接：SQLite 连接不能跨 fork 使用"""
+        if self._db is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    async def _run(self, func: Callable[..., Any], *args) -> Any:
+        """在线程池中执行数据库操作（持锁期间 self._db 已连接）"""
+        def call():
+            with self._db_lock:
+                self._connection()
+                return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, call)
+
+    def _cache_put(self, session: Session):
+        self._cache[session.id] = session
+        self._cache.move_to_end(session.id)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def _expired(self, session: Session) -> bool:
+        return self.ttl > 0 and time.time() - session.updated_at > self.ttl
+
+    async def get(self, session_id: str) -> Optional[Session]:
+        """查询会话，内存未命中时从数据库加载"""
+        session = self._cache.get(session_id)
+        if session is not None and self.shared:
+            updated_at = await self._run(self._updated_at, session_id)
+            if updated_at != session.updated_at:
+                self._cache.pop(session_id, None)
+                self.reloads += 1
+                session = None
+        if session is not None:
+            self._cache.move_to_end(session_id)
+            self.hits += 1
+        elif self.db_path:
+            session = await self._run(self._load, session_id)
+            if session is not None:
+                self.loads += 1
+                self._cache_put(session)
+        if session is not None and self._expired(session):
+            await self.delete(session_id)
+            session = None
+        if session is None:
+            self.misses += 1
+        return session
+
+    def _updated_at(self, session_id: str) -> Optional[float]:
+        row = self._db.execute("SELECT updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        row = self._db.execute(
+            "SELECT system_message, summary, summary_tokens, window_start, message_count, created_at, updated_at "
+            "FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        session = Session(session_id, row[0], row[5])
+        session.summary, session.summary_tokens, session.window_start, session.message_count = row[1:5]
+        session.updated_at = row[6]
+        session.window = [
+            SessionMessage(seq, role, content, tokens)
+            for seq, role, content, tokens in self._db.execute(
+                "SELECT seq, role, content, tokens FROM session_messages "
+                "WHERE session_id = ? AND seq >= ? ORDER BY seq", (session_id, session.window_start)
+            )
+        ]
+        return session
+
+    async def create(self, system_message: str) -> Session:
+        """创建会话，ID 随机生成"""
+        session = Session(uuid.uuid4().hex, system_message, time.time())
+        if self.db_path:
+            await self._run(self._insert, session)
+        self._cache_put(session)
+        self.created += 1
+        return session
+
+    def _insert(self, session: Session):
+        self._db.execute(
+            "INSERT INTO sessions (id, system_message, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (session.id, session.system_message, session.created_at, session.updated_at)
+        )
+
+    async def append_turn(self, session: Session, user_message: str, assistant_message: str):
+        """追加一轮问答"""
+        messages = [SessionMessage(0, USER, user_message), SessionMessage(0, ASSISTANT, assistant_message)]
+        updated_at = time.time()
+        if self.db_path:
+            first_seq = await self._run(self._insert_messages, session.id, messages, updated_at)
+        else:
+            first_seq = session.message_count
+        for offset, m in enumerate(messages):
+            m.seq = first_seq + offset
+        if session.window and session.window[-1].seq > first_seq:
+            # 与并发写入交错完成：按序号插回
+            session.window = sorted(session.window + messages, key=lambda m: m.seq)
+        else:
+            session.window.extend(messages)
+        session.message_count = max(session.message_count, first_seq + len(messages))
+        session.updated_at = updated_at
+        self.appended += len(messages)
+
+    def _insert_messages(self, session_id: str, messages: List[SessionMessage], updated_at: float) -> int:
+        """在写事务内分配序号并写入，返回第一条消息的序号"""
+        with self._db:
+            # IMMEDIATE 在读取最大序号前就取得写锁，其他连接的并发写入排在后面
+            self._db.execute("BEGIN IMMEDIATE")
+            first_seq = self._db.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM session_messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._db.executemany(
+                "INSERT INTO session_messages (session_id, seq, role, content, tokens, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(session_id, first_seq + i, m.role, m.content, m.tokens, updated_at) for i, m in enumerate(messages)]
+            )
+            self._db.execute(
+                "UPDATE sessions SET message_count = ?, updated_at = ? WHERE id = ?",
+                (first_seq + len(messages), updated_at, session_id)
+            )
+        return first_seq
+
+    def _save_state(self, session: Session):
+        # message_count 只由 _insert_messages 在写事务内更新
+        self._db.execute(
+            "UPDATE sessions SET summary = ?, summary_tokens = ?, window_start = ?, updated_at = ? WHERE id = ?",
+            (session.summary, session.summary_tokens, session.window_start, session.updated_at, session.id)
+        )
+
+    async def fit_window(self,
+                         session: Session,
+                         message: str,
+                         budget: int,
+                         trim_target: float = 0.5,
+                         summarize: Optional[Summarizer] = None) -> List[SessionMessage]:
+        """返回放入本轮上下文的历史消息，必要时先裁剪窗口
+
+        上下文按固定顺序组装：系统消息、摘要、窗口内消息、本轮消息。窗口只在超出预算时才整段前移
+        （一次裁剪到 budget * trim_target 以内），两次裁剪之间上下文前缀只增不变，
+        上游的前缀缓存因此可以持续命中。移出窗口的消息在提供 summarize 时并入摘要。
+        """
+        fixed = estimate_tokens(session.system_message) + session.summary_tokens + estimate_tokens(message)
+        window_tokens = sum(m.tokens for m in session.window)
+        if fixed + window_tokens <= budget:
+            return session.window
+
+        target = int(budget * trim_target)
+        cut = 0
+        while cut < len(session.window) and fixed + window_tokens > target:
+            window_tokens -= session.window[cut].tokens
+            cut += 1
+        # 窗口总是从一轮问答的开头开始
+        while cut < len(session.window) and session.window[cut].role != USER:
+            window_tokens -= session.window[cut].tokens
+            cut += 1
+        dropped, session.window = session.window[:cut], session.window[cut:]
+        session.window_start = session.window[0].seq if session.window else session.message_count
+        self.trims += 1
+        logger.info(f"Session {session.id}: moved {len(dropped)} messages out of the context window")
+
+        if summarize is not None and dropped:
+            try:
+                session.summary = await summarize(session.summary, dropped)
+                session.summary_tokens = estimate_tokens(session.summary)
+                self.summaries += 1
+            except Exception as e:
+                self.summary_failures += 1
+                logger.warning(f"Session {session.id}: summarization failed, history trimmed only: {e}")
+        session.updated_at = time.time()
+        if self.db_path:
+            await self._run(self._save_state, session)
+        return session.window
+
+    async def history(self, session_id: str, limit: int = 100) -> List[SessionMessage]:
+        """完整历史中的最近 limit 条消息（含已移出上下文窗口的）"""
+        session = await self.get(session_id)
+        if session is None:
+            return []
+        if not self.db_path:
+            return session.window[-limit:]
+        rows = await self._run(
+            lambda: self._db.execute(
+                "SELECT seq, role, content, tokens FROM session_messages WHERE session_id = ? "
+                "ORDER BY seq DESC LIMIT ?", (session_id, limit)
+            ).fetchall()
+        )
+        return [SessionMessage(*row) for row in reversed(rows)]
+
+    async def delete(self, session_id: str) -> bool:
+        """删除会话，返回是否存在"""
+        existed = self._cache.pop(session_id, None) is not None
+        if self.db_path:
+            existed = await self._run(self._delete, session_id) or existed
+        return existed
+
+    def _delete(self, session_id: str) -> bool:
+        with self._db:
+            self._db.execute("BEGIN")
+            deleted = self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            self._db.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+        return deleted > 0
+
+    async def purge(self) -> int:
+        """删除超过 ttl 未更新的会话，返回删除数"""
+        if self.ttl <= 0:
+            return 0
+        expired = [session_id for session_id, session in self._cache.items() if self._expired(session)]
+        for session_id in expired:
+            del self._cache[session_id]
+        count = len(expired)
+        if self.db_path:
+            count = await self._run(self._purge, time.time() - self.ttl)
+        self.purged += count
+        if count:
+            logger.info(f"Purged {count} expired sessions")
+        return count
+
+    def _purge(self, cutoff: float) -> int:
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "DELETE FROM session_messages WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)",
+                (cutoff,)
+            )
+            return self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+
+    async def _purge_loop(self):
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await self.purge()
+            except Exception as e:
+                logger.warning(f"Session purge failed: {e}")
+
+    def start(self):
+        """启动定期清理过期会话的后台任务"""
+        if self.ttl > 0 and self.purge_interval > 0 and (self._purge_task is None or self._purge_task.done()):
+            self._purge_task = asyncio.ensure_future(self._purge_loop())
+
+    async def stop(self):
+        """停止后台任务并关闭数据库"""
+        if self._purge_task is not None:
+            self._purge_task.cancel()
+            try:
+                await self._purge_task
+            except asyncio.CancelledError:
+                pass
+            self._purge_task = None
+        self.close()
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """会话统计信息"""
+        return {
+            "cached": len(self._cache),
+            "max_cached": self.max_cached,
+            "persistent": bool(self.db_path),
+            "shared": self.shared,
+            "hits": self.hits,
+            "loads": self.loads,
+            "reloads": self.reloads,
+            "misses": self.misses,
+            "created": self.created,
+            "appended_messages": self.appended,
+            "trims": self.trims,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+            "purged": self.purged,
+        }
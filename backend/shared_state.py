@@ -0,0 +1,152 @@
+"""
+多进程共享状态：SQLite（WAL）保存跨 worker 的响应缓存与各进程的指标/统计快照
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS worker_state (
+    kind TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (kind, pid)
+);
+CREATE TABLE IF NOT EXISTS response_cache (
+    key TEXT PRIMARY KEY,
+    chunks TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS response_cache_expires ON response_cache (expires_at);
+"""
+
+
+class SharedStore:
+    """跨进程共享存储
+
+    - 响应缓存二级存储：各 worker 的内存缓存未命中时查这里，写入时同时写这里，
+      多 worker 部署时命中率不会因为请求被分散到不同进程而下降
+    - worker 快照：各进程定期发布指标与统计快照，任一进程都能汇总全部进程的数据
+
+    所有方法都是同步的数据库操作，调用方（ResponseCache、main 中的同步任务与 /stats、/metrics）
+    通过 run_in_executor 在线程池中调用，不在事件循环上执行；stats() 例外，只返回 purge() 时记录的缓存总量。
+    busy_timeout 很短，锁竞争时放弃本次读写；共享存储出错只记录日志，不影响请求。
+    """
+
+    def __init__(self,
+                 path: str,
+                 stale_after: float = 30.0,
+                 max_cache_bytes: int = 256 * 1024 * 1024,
+                 busy_timeout: float = 0.05):
+        self.path = path
+        self.stale_after = stale_after
+        self.max_cache_bytes = max_cache_bytes
+        self.busy_timeout = busy_timeout
+        self._pid = os.getpid()
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.errors = 0
+        # purge() 时统计的缓存条目数与总字节数
+        self._cache_entries = 0
+        self._cache_bytes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        """按进程懒连接：SQLite 连接不能跨 fork 使用"""
+        if self._db is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._db = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def _execute(self, sql: str, params: Tuple[Any, ...] = ()) -> Optional[List[Tuple[Any, ...]]]:
+        with self._lock:
+            try:
+                return self._connection().execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                self.errors += 1
+                logger.warning(f"Shared state error: {e}")
+                return None
+
+    # 响应缓存
+
+    def cache_get(self, key: str) -> Optional[Tuple[List[str], float]]:
+        """返回 (片段列表, 过期时间)；过期时间为 time.time() 时钟"""
+        rows = self._execute(
+            "SELECT chunks, expires_at FROM response_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        )
+        if not rows:
+            return None
+        return json.loads(rows[0][0]), rows[0][1]
+
+    def cache_put(self, key: str, chunks: List[str], size: int, expires_at: float):
+        self._execute(
+            "INSERT OR REPLACE INTO response_cache (key, chunks, size, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(chunks, ensure_ascii=False), size, expires_at)
+        )
+
+    def cache_clear(self):
+        self._execute("DELETE FROM response_cache")
+
+    def purge(self):
+        """删除过期条目与失联进程的快照，缓存总量超过上限时删除最早过期的条目"""
+        now = time.time()
+        self._execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+        self._execute("DELETE FROM worker_state WHERE updated_at < ?", (now - self.stale_after,))
+        rows = self._execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM response_cache")
+        if rows:
+            self._cache_entries, self._cache_bytes = rows[0]
+        excess = rows[0][1] - self.max_cache_bytes if rows else 0
+        if excess > 0:
+            # 按过期时间从早到晚累计，删除到总量回到上限以内
+            self._execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "  SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY expires_at) - size AS before FROM response_cache)"
+                "  WHERE before < ?"
+                ")", (excess,)
+            )
+
+    # worker 快照
+
+    def publish(self, kind: str, payload: Dict[str, Any]):
+        """发布当前进程的快照"""
+        self._execute(
+            "INSERT OR REPLACE INTO worker_state (kind, pid, payload, updated_at) VALUES (?, ?, ?, ?)",
+            (kind, os.getpid(), json.dumps(payload, ensure_ascii=False, default=str), time.time())
+        )
+
+    def collect(self, kind: str) -> Dict[int, Dict[str, Any]]:
+        """所有仍在更新的进程的快照，按 pid 索引"""
+        rows = self._execute(
+            "SELECT pid, payload FROM worker_state WHERE kind = ? AND updated_at >= ?",
+            (kind, time.time() - self.stale_after)
+        )
+        return {pid: json.loads(payload) for pid, payload in rows or []}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, Any]:
+        """不访问数据库：缓存总量为最近一次 purge() 时的值"""
+        return {
+            "path": self.path,
+            "cache_entries": self._cache_entries,
+            "cache_bytes": self._cache_bytes,
+            "max_cache_bytes": self.max_cache_bytes,
+            "errors": self.errors,
+        }
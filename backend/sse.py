@@ -0,0 +1,251 @@
+"""
+SSE 编码：合并内容片段以减少帧数和写入次数
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Tuple
+
+import anyio
+from starlette.responses import StreamingResponse
+from starlette.types import Send
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# orjson 可选：比标准库 json 快数倍，输出 UTF-8 且不转义非 ASCII 字符
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_event(event: Dict[str, Any]) -> bytes:
+    """编码为一帧 `data: {...}\\n\\n`；带 id 的事件额外输出 `id:` 行供断线续传"""
+    event_id = event.get("id")
+    if event_id is None:
+        return b"data: " + dumps(event) + b"\n\n"
+    data = {k: v for k, v in event.items() if k != "id"}
+    return b"id: " + event_id.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class _Coalescer:
+    """内容片段缓冲：非内容事件原样透传"""
+
+    __slots__ = ("parts", "size", "last_id")
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.size = 0
+        self.last_id: Optional[str] = None
+
+    def add(self, content: str, event_id: Optional[str]):
+        self.parts.append(content)
+        self.size += len(content.encode("utf-8"))
+        self.last_id = event_id
+
+    def take(self) -> Tuple[str, Optional[str]]:
+        content = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        return content, self.last_id
+
+
+_EMPTY = object()
+_DONE = object()
+
+
+class _Reader:
+    """在单个后台任务中读取上游事件，最多预读一个
+
+    整个流只创建一个任务；get() 在事件到达、流结束或 wake() 被调用时返回，
+    冲刷定时器通过 wake() 让等待中的 get() 提前返回 _EMPTY。
+    """
+
+    __slots__ = ("_iterator", "_loop", "_item", "_error", "_waiter", "_space", "_task")
+
+    def __init__(self, iterator: AsyncIterator[Dict[str, Any]]):
+        self._iterator = iterator
+        self._loop = asyncio.get_running_loop()
+        self._item: Any = _EMPTY
+        self._error: Optional[BaseException] = None
+        self._waiter: Optional["asyncio.Future[None]"] = None
+        self._space: Optional["asyncio.Future[None]"] = None
+        self._task = self._loop.create_task(self._pump())
+
+    async def _pump(self):
+        while True:
+            try:
+                item = await self._iterator.__anext__()
+            except StopAsyncIteration:
+                item = _DONE
+            except BaseException as e:
+                self._error = e
+                self._put(_DONE)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return
+            self._put(item)
+            if item is _DONE:
+                return
+            # 等消费方取走后再读下一个
+            self._space = self._loop.create_future()
+            await self._space
+
+    def _put(self, item: Any):
+        self._item = item
+        self.wake()
+
+    def wake(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self) -> Any:
+        """取下一个事件；被 wake() 唤醒时返回 _EMPTY，流结束返回 _DONE，上游异常原样抛出"""
+        if self._item is _EMPTY:
+            self._waiter = self._loop.create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+            if self._item is _EMPTY:
+                return _EMPTY
+        item = self._item
+        if item is _DONE:
+            if self._error is not None:
+                raise self._error
+            return _DONE
+        self._item = _EMPTY
+        if self._space is not None and not self._space.done():
+            self._space.set_result(None)
+        return item
+
+    async def close(self):
+        """停止后台读取；不吞掉调用方自身的取消"""
+        self._task.cancel()
+        await asyncio.wait((self._task,))
+        if not self._task.cancelled():
+            self._task.exception()
+
+
+async def coalesce(events: AsyncIterator[Dict[str, Any]],
+                   max_bytes: int = 1024,
+                   flush_interval: float = 0.01) -> AsyncGenerator[Dict[str, Any], None]:
+    """合并相邻的内容事件
+
+    - 第一个内容片段立即发送，不增加首字延迟
+    - 之后的内容片段累积到 max_bytes 字节或距首个缓冲片段 flush_interval 秒时合并为一个事件
+    - 上游读取由单个后台任务完成，冲刷截止时间由 loop.call_at 定时器触发，不为每个片段新建任务
+    - 内容事件用 offset（相对流开始的毫秒数，单调时钟）代替 ISO 时间戳
+    - 合并事件的 id 取其中最后一个事件的 ID，续传时从其后开始
+    - 非内容事件（end/error）先冲刷缓冲，再原样发送
+    """
+    loop = asyncio.get_running_loop()
+    started = time.monotonic()
+    buffer = _Coalescer()
+    first_sent = False
+    iterator = events.__aiter__()
+    reader = _Reader(iterator)
+    flush_at = 0.0
+    timer: Optional[asyncio.TimerHandle] = None
+
+    def content_event(content: str, event_id: Optional[str]) -> Dict[str, Any]:
+        event = {
+            "type": "content",
+            "content": content,
+            "offset": int((time.monotonic() - started) * 1000)
+        }
+        if event_id is not None:
+            event["id"] = event_id
+        return event
+
+    def flush() -> Dict[str, Any]:
+        nonlocal timer
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        return content_event(*buffer.take())
+
+    try:
+        while True:
+            if buffer.parts and loop.time() >= flush_at:
+                # 定时器在消费方暂停于 yield 时触发过
+                yield flush()
+            event = await reader.get()
+            if event is _EMPTY:
+                if buffer.parts:
+                    yield flush()
+                continue
+            if event is _DONE:
+                break
+
+            if event.get("type") != "content":
+                if buffer.parts:
+                    yield flush()
+                yield event
+                continue
+
+            if not first_sent:
+                first_sent = True
+                yield content_event(event["content"], event.get("id"))
+                continue
+
+            if not buffer.parts:
+                flush_at = loop.time() + flush_interval
+                timer = loop.call_at(flush_at, reader.wake)
+            buffer.add(event["content"], event.get("id"))
+            if buffer.size >= max_bytes or loop.time() >= flush_at:
+                yield flush()
+
+        if buffer.parts:
+            yield flush()
+    finally:
+        if timer is not None:
+            timer.cancel()
+        await reader.close()
+        # 提前结束时关闭上游事件流，释放其持有的资源
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def encode_stream(events: AsyncIterator[Dict[str, Any]],
+                        max_bytes: int = 1024,
+                        flush_interval: float = 0.01) -> AsyncGenerator[bytes, None]:
+    """把 chat_stream 事件合并后编码为 SSE 帧，参数见 coalesce"""
+    trace = tracing.current_trace()
+    coalesced = coalesce(events, max_bytes, flush_interval)
+    try:
+        async for event in coalesced:
+            encode_started = time.perf_counter()
+            frame = encode_event(event)
+            if trace is not None:
+                trace.add_timing("sse_encode", time.perf_counter() - encode_started)
+            yield frame
+    finally:
+        await coalesced.aclose()
+
+
+class SSEResponse(StreamingResponse):
+    """SSE 响应：客户端断开时立即关闭事件流
+
+    Starlette 收到 http.disconnect 后会取消发送任务，但若此时生成器正停在 yield 上，
+    它只会等到垃圾回收时才被关闭；这里显式关闭，使上游请求立即取消、名额立即释放。
+    """
+
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                # 发送任务已被取消，关闭生成器需要屏蔽取消
+                with anyio.CancelScope(shield=True):
+                    await aclose()
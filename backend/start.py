@@ -1,18 +1,47 @@
 #!/usr/bin/env python3
 """
 AutoGen Chat Backend 启动脚本
+
+默认单进程并开启热重载（开发用）；--prod 时按 Config.get_production_server_config()
+启动多个 worker，并开启多进程共享状态。run_server.py 直接调用 run_production()。
 """
 
+import argparse
+import os
+from typing import Optional
+
 import uvicorn
-from main import app
 
-if __name__ == "__main__":
+
+def print_banner():
     print("🚀 启动 AutoGen Chat Backend...")
     print("📡 API文档: http://localhost:8000/docs")
     print("🔗 健康检查: http://localhost:8000/health")
     print("💬 聊天接口: http://localhost:8000/chat")
     print("🌊 流式聊天: http://localhost:8000/chat/stream")
-    
+    print("按 Ctrl+C 停止服务")
+    print("-" * 50)
+
+
+def run_production(workers: Optional[int] = None):
+    """生产模式：多 worker、关闭热重载、开启共享状态"""
+    # worker 进程重新导入配置，因此通过环境变量传递
+    os.environ.setdefault("SHARED_STATE_ENABLED", "true")
+    if workers:
+        os.environ["SERVER_WORKERS"] = str(workers)
+    from config import Config
+
+    server_config = Config.get_production_server_config()
+    print_banner()
+    print(f"⚙️  生产模式: {server_config['workers']} 个 worker, "
+          f"loop={server_config['loop']}, http={server_config['http']}")
+    # 多 worker 需要以导入路径传入应用
+    uvicorn.run("main:app", **server_config)
+
+
+def run_development():
+    """开发模式：单进程、热重载"""
+    print_banner()
     uvicorn.run(
         "main:app",  # 使用字符串形式的应用程序导入路径
         host="0.0.0.0",
@@ -20,3 +49,15 @@ if __name__ == "__main__":
         reload=True,
         log_level="info"
     )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AutoGen Chat Backend")
+    parser.add_argument("--prod", action="store_true", help="生产模式：多 worker、关闭热重载")
+    parser.add_argument("--workers", type=int, help="worker 进程数（默认 CPU 核数）")
+    args = parser.parse_args()
+
+    if args.prod:
+        run_production(args.workers)
+    else:
+        run_development()
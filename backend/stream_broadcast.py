@@ -0,0 +1,260 @@
+"""
+流式广播：同一键的多个并发 SSE 订阅者共享一个上游流，断线后可按事件 ID 续传
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """解析 "流ID:序号" 形式的事件 ID"""
+    stream_id, sep, seq = event_id.strip().rpartition(":")
+    if not sep or not stream_id or not seq.isdigit():
+        return None
+    return stream_id, int(seq)
+
+
+class _Broadcast:
+    """一个上游流及其共享事件缓冲"""
+
+    def __init__(self, key: Optional[str]):
+        self.key = key
+        self.stream_id = uuid.uuid4().hex[:16]
+        self.events: List[Dict[str, Any]] = []
+        self.size = 0
+        self.done = False
+        self.cancelled = False
+        self.finished_at = 0.0
+        self.subscribers = 0
+        self.waiters: Set[asyncio.Event] = set()
+        self.task: "asyncio.Task[None]" = None
+        self.expire_handle: Optional[asyncio.TimerHandle] = None
+        # 上游停止（结束、取消或中止）时调用，用于归还创建者的准入名额
+        self.on_stop: List[Callable[[], None]] = []
+
+    def publish(self, event: Dict[str, Any]):
+        """追加事件（分配事件 ID）并唤醒所有订阅者"""
+        event["id"] = f"{self.stream_id}:{len(self.events)}"
+        self.events.append(event)
+        self.size += len(event.get("content", "").encode("utf-8"))
+        for waiter in self.waiters:
+            waiter.set()
+
+    def stopped(self, task: "asyncio.Task[None]"):
+        """上游任务结束（含启动前即被取消）时调用 on_stop 回调"""
+        callbacks, self.on_stop = self.on_stop, []
+        for callback in callbacks:
+            callback()
+
+    def finish(self):
+        """标记上游结束并唤醒所有订阅者"""
+        self.done = True
+        self.finished_at = time.monotonic()
+        for waiter in self.waiters:
+            waiter.set()
+
+
+class StreamBroadcaster:
+    """上游流扇出与续传
+
+    - 某个键的第一个订阅者创建上游流（owner），后续订阅者直接加入；key 为空的流不共享
+    - 加入者先回放已产生的事件，再接收实时事件
+    - 每个订阅者在共享缓冲上维护自己的读取位置，上游从不等待订阅者，
+      慢读者只会落后于缓冲尾部，不会阻塞其他订阅者
+    - 最后一个订阅者离开后再等待 grace 秒才取消上游，期间可以按事件 ID 续传；
+      因截止时间放弃（abandon）的流不会被续传，立即取消
+    - 创建者通过 hold 交出的准入名额保留到上游真正停止，续传窗口内仍在生成的上游照常占用并发
+    - 进行中的流缓冲超过 max_retained_bytes 时中止并取消上游，订阅者收到 error 事件
+    - 完整结束的流在 retention_ttl 内保留，总内容字节数与流数量超过上限时淘汰最旧的
+    """
+
+    def __init__(self,
+                 grace: float = 0.0,
+                 retention_ttl: float = 0.0,
+                 max_retained: int = 256,
+                 max_retained_bytes: int = 32 * 1024 * 1024):
+        self.grace = grace
+        self.retention_ttl = retention_ttl
+        self.max_retained = max_retained
+        self.max_retained_bytes = max_retained_bytes
+        self._active: Dict[str, _Broadcast] = {}
+        # 按流 ID 索引：进行中的流与保留的已结束流（按结束顺序排列）
+        self._streams: Dict[str, _Broadcast] = {}
+        self._retained: "OrderedDict[str, _Broadcast]" = OrderedDict()
+        self._retained_bytes = 0
+        # 订阅者生成器 -> 所读的流，用于 abandon
+        self._followers: "weakref.WeakKeyDictionary[AsyncGenerator[Dict[str, Any], None], _Broadcast]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self.upstreams = 0
+        self.joined = 0
+        self.cancelled = 0
+        self.abandoned = 0
+        self.overflowed = 0
+        self.resumed = 0
+        self.resume_misses = 0
+
+    def subscribe(self,
+                  key: Optional[str],
+                  factory: Callable[[], AsyncIterator[Dict[str, Any]]],
+                  hold: Optional[Callable[[], Callable[[], None]]] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """订阅键对应的流，不存在时用 factory 创建上游
+
+        创建上游时调用 hold()，返回的回调在上游停止时调用（见 AdmissionTicket.hold）；加入已有的流时不调用。
+        """
+        broadcast = self._active.get(key) if key is not None else None
+        if broadcast is None:
+            broadcast = _Broadcast(key)
+            if hold is not None:
+                broadcast.on_stop.append(hold())
+            if key is not None:
+                self._active[key] = broadcast
+            self._streams[broadcast.stream_id] = broadcast
+            broadcast.task = asyncio.ensure_future(self._pump(broadcast, factory))
+            broadcast.task.add_done_callback(broadcast.stopped)
+            self.upstreams += 1
+        else:
+            self.joined += 1
+            logger.info(f"Joined in-flight stream {key[:12]} with {len(broadcast.events)} buffered events")
+        return self._track(broadcast, 0)
+
+    def resume(self, last_event_id: str) -> Optional[AsyncGenerator[Dict[str, Any], None]]:
+        """从 Last-Event-ID 之后继续读取；流已过期或未知时返回 None"""
+        self._evict()
+        parsed = parse_event_id(last_event_id)
+        broadcast = self._streams.get(parsed[0]) if parsed is not None else None
+        if broadcast is None or broadcast.cancelled or parsed[1] >= len(broadcast.events):
+            self.resume_misses += 1
+            return None
+        self.resumed += 1
+        logger.info(f"Resuming stream {broadcast.stream_id} after event {parsed[1]}")
+        return self._track(broadcast, parsed[1] + 1)
+
+    def _track(self, broadcast: _Broadcast, index: int) -> AsyncGenerator[Dict[str, Any], None]:
+        follower = self._follow(broadcast, index)
+        self._followers[follower] = broadcast
+        return follower
+
+    def abandon(self, follower: AsyncGenerator[Dict[str, Any], None]):
+        """订阅者因截止时间放弃流（已关闭 follower）：没有其他订阅者时立即取消上游，不保留续传窗口"""
+        broadcast = self._followers.pop(follower, None)
+        if broadcast is None or broadcast.done or broadcast.subscribers:
+            return
+        if broadcast.expire_handle is not None:
+            broadcast.expire_handle.cancel()
+        self.abandoned += 1
+        self._expire(broadcast, "deadline exceeded")
+
+    async def _follow(self, broadcast: _Broadcast, index: int) -> AsyncGenerator[Dict[str, Any], None]:
+        """从 index 开始读取共享缓冲"""
+        if broadcast.expire_handle is not None:
+            broadcast.expire_handle.cancel()
+            broadcast.expire_handle = None
+        waiter = asyncio.Event()
+        broadcast.waiters.add(waiter)
+        broadcast.subscribers += 1
+        try:
+            while True:
+                if index < len(broadcast.events):
+                    event = broadcast.events[index]
+                    index += 1
+                    yield event
+                    continue
+                if broadcast.done:
+                    break
+                waiter.clear()
+                await waiter.wait()
+        finally:
+            broadcast.waiters.discard(waiter)
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                if self.grace > 0:
+                    # 留出续传窗口，期间上游继续生成
+                    broadcast.expire_handle = asyncio.get_running_loop().call_later(
+                        self.grace, self._expire, broadcast
+                    )
+                else:
+                    self._expire(broadcast)
+
+    def _expire(self, broadcast: _Broadcast, reason: str = "no subscribers left"):
+        """没有订阅者的上游：取消"""
+        broadcast.expire_handle = None
+        if broadcast.subscribers == 0 and not broadcast.done:
+            broadcast.cancelled = True
+            broadcast.task.cancel()
+            self.cancelled += 1
+            logger.info(f"Cancelled upstream stream {broadcast.stream_id}: {reason}")
+
+    async def _pump(self, broadcast: _Broadcast, factory: Callable[[], AsyncIterator[Dict[str, Any]]]):
+        """把上游事件写入共享缓冲；缓冲超过 max_retained_bytes 时以 error 事件结束并取消上游"""
+        upstream = factory()
+        try:
+            async for event in upstream:
+                broadcast.publish(event)
+                if broadcast.size > self.max_retained_bytes:
+                    # 不完整的流不保留、不续传
+                    broadcast.cancelled = True
+                    self.overflowed += 1
+                    logger.warning(f"Broadcast {broadcast.stream_id} exceeded {self.max_retained_bytes} bytes, aborting")
+                    broadcast.publish({"type": "error", "content": "流式聊天出错: 响应超过广播缓冲上限"})
+                    break
+        except asyncio.CancelledError:
+            broadcast.cancelled = True
+        except Exception as e:
+            logger.error(f"Broadcast upstream failed: {e}")
+            broadcast.publish({"type": "error", "content": f"流式聊天出错: {str(e)}"})
+        finally:
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            broadcast.finish()
+            if broadcast.key is not None and self._active.get(broadcast.key) is broadcast:
+                del self._active[broadcast.key]
+            self._retain(broadcast)
+
+    def _retain(self, broadcast: _Broadcast):
+        """保留已结束的流以便续传；被取消的流不完整，直接丢弃"""
+        if broadcast.cancelled or self.retention_ttl <= 0:
+            self._streams.pop(broadcast.stream_id, None)
+            return
+        self._retained[broadcast.stream_id] = broadcast
+        self._retained_bytes += broadcast.size
+        self._evict()
+
+    def _evict(self):
+        """淘汰过期或超出数量/内存上限的已结束流"""
+        now = time.monotonic()
+        while self._retained:
+            stream_id, oldest = next(iter(self._retained.items()))
+            if (now - oldest.finished_at < self.retention_ttl
+                    and len(self._retained) <= self.max_retained
+                    and self._retained_bytes <= self.max_retained_bytes):
+                break
+            # 正在回放的读者持有自己的引用，不受影响
+            del self._retained[stream_id]
+            self._retained_bytes -= oldest.size
+            self._streams.pop(stream_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """广播统计信息"""
+        self._evict()
+        return {
+            "active": len(self._streams) - len(self._retained),
+            "subscribers": sum(b.subscribers for b in self._streams.values()),
+            "upstreams": self.upstreams,
+            "joined": self.joined,
+            "cancelled": self.cancelled,
+            "abandoned": self.abandoned,
+            "overflowed": self.overflowed,
+            "retained": len(self._retained),
+            "retained_bytes": self._retained_bytes,
+            "resumed": self.resumed,
+            "resume_misses": self.resume_misses,
+        }
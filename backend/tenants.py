@@ -0,0 +1,211 @@
+"""
+租户识别与限流：按 API Key 或客户端 ID 区分调用方，每个租户一组请求数与 token 数令牌桶
+"""
+
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+ANONYMOUS = "anonymous"
+
+
+class TokenBucket:
+    """令牌桶：按 rate 每秒匀速补充，最多积累 burst 个；rate <= 0 表示不限制"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated_at")
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(burst, 1.0) if rate > 0 else 0.0
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        """尝试取出 amount 个令牌：成功返回 0，否则返回需要等待的秒数（不扣除）"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        # 超过桶容量的请求按装满计，否则永远无法通过
+        amount = min(amount, self.burst)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float):
+        """退回已取出但未使用的令牌"""
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + amount)
+
+
+class Tenant:
+    """一个租户：调度权重、限流令牌桶与统计"""
+
+    def __init__(self,
+                 tenant_id: str,
+                 weight: float = 1.0,
+                 requests_per_second: float = 0.0,
+                 request_burst: float = 0.0,
+                 tokens_per_minute: float = 0.0,
+                 token_burst: float = 0.0,
+                 max_queue: int = 32):
+        self.id = tenant_id
+        self.weight = max(weight, 0.01)
+        self.max_queue = max_queue
+        self.requests = TokenBucket(requests_per_second, request_burst or requests_per_second)
+        self.tokens = TokenBucket(tokens_per_minute / 60, token_burst or tokens_per_minute)
+        # 由 AdmissionController 维护：排队中与已准入未释放的请求数（所有控制器合计）
+        self.queued = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled_requests = 0
+        self.throttled_tokens = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.charged_tokens = 0
+        self.refunded = 0
+
+    def record_wait(self, waited: float):
+        self.waited += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def idle(self) -> bool:
+        return self.in_flight == 0 and self.queued == 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "admitted": self.admitted,
+            "avg_wait_ms": round(self.total_wait / self.waited * 1000, 1) if self.waited else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "throttled_requests": self.throttled_requests,
+            "throttled_tokens": self.throttled_tokens,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+            "charged_tokens": self.charged_tokens,
+            "refunded": self.refunded,
+        }
+
+
+class TenantRegistry:
+    """租户表
+
+    - 识别顺序：API Key（`Authorization: Bearer` 或 `X-API-Key`）、`X-Client-ID`
+    - 只信任配置过的身份：api_keys 中登记的 Key 映射为其租户名，`X-Client-ID` 只在 tenants 中配置了
+      "client:<ID>" 时生效；未登记的 Key、未配置的客户端 ID 与没有身份的请求共用 anonymous 租户，
+      换一个 Key 或客户端 ID 不能得到一组新的限额
+    - tenants 按租户名覆盖 defaults 中的权重与限额，未覆盖的租户使用 defaults
+    - 最多跟踪 max_tenants 个租户，超过时淘汰最久未使用且空闲的租户（其令牌桶随之重置）
+    - 令牌桶与排队状态只在本进程内：多 worker 部署时每个 worker 各有一份，实际限额约为配置值乘以 worker 数
+    """
+
+    def __init__(self,
+                 defaults: Optional[Mapping[str, Any]] = None,
+                 tenants: Optional[Mapping[str, Mapping[str, Any]]] = None,
+                 api_keys: Optional[Mapping[str, str]] = None,
+                 max_tenants: int = 10000,
+                 completion_token_estimate: int = 256):
+        self.defaults = dict(defaults or {})
+        self.overrides = {name: dict(settings) for name, settings in (tenants or {}).items()}
+        self.api_keys = dict(api_keys or {})
+        self.max_tenants = max_tenants
+        self.completion_token_estimate = completion_token_estimate
+        self._tenants: "OrderedDict[str, Tenant]" = OrderedDict()
+        self.evicted = 0
+        self.unknown_keys = 0
+
+    def identify(self, headers: Mapping[str, str]) -> str:
+        """从请求头识别租户 ID"""
+        api_key = headers.get("x-api-key")
+        authorization = headers.get("authorization", "")
+        if not api_key and authorization[:7].lower() == "bearer ":
+            api_key = authorization[7:].strip()
+        if api_key:
+            tenant_id = self.api_keys.get(api_key)
+            if tenant_id is None:
+                self.unknown_keys += 1
+                return ANONYMOUS
+            return tenant_id
+        client_id = headers.get("x-client-id", "").strip()
+        if client_id:
+            tenant_id = "client:" + client_id[:64]
+            if tenant_id in self.overrides:
+                return tenant_id
+        return ANONYMOUS
+
+    def get(self, tenant_id: str) -> Tenant:
+        """按 ID 获取租户，不存在时按配置创建"""
+        tenant = self._tenants.get(tenant_id)
+        if tenant is not None:
+            self._tenants.move_to_end(tenant_id)
+            return tenant
+        settings = {**self.defaults, **self.overrides.get(tenant_id, {})}
+        tenant = Tenant(tenant_id, **settings)
+        self._tenants[tenant_id] = tenant
+        if len(self._tenants) > self.max_tenants:
+            self._evict()
+        return tenant
+
+    def _evict(self):
+        for tenant_id, tenant in list(self._tenants.items()):
+            if len(self._tenants) <= self.max_tenants:
+                break
+            # 配置过的租户与仍有请求的租户不淘汰
+            if tenant_id not in self.overrides and tenant.idle():
+                del self._tenants[tenant_id]
+                self.evicted += 1
+
+    def resolve(self, headers: Mapping[str, str]) -> Tenant:
+        return self.get(self.identify(headers))
+
+    def estimate_tokens(self, prompt_tokens: int) -> int:
+        """一次请求预计消耗的 token：提示词估算值加上预计的回复长度"""
+        return prompt_tokens + self.completion_token_estimate
+
+    def throttle(self, tenant: Tenant, tokens: int = 0):
+        """扣除一次请求与 tokens 个 token 的额度，额度不足时抛出 429"""
+        wait = tenant.requests.take(1)
+        if wait > 0:
+            tenant.throttled_requests += 1
+            raise AdmissionRejected(429, f"租户 {tenant.id} 请求频率超过限制", max(1, math.ceil(wait)))
+        if tokens > 0:
+            wait = tenant.tokens.take(tokens)
+            if wait > 0:
+                tenant.throttled_tokens += 1
+                # 请求额度已扣除但未放行，退回
+                tenant.requests.refund(1)
+                raise AdmissionRejected(429, f"租户 {tenant.id} token 用量超过限制", max(1, math.ceil(wait)))
+            tenant.charged_tokens += tokens
+
+    def refund(self, tenant: Tenant, tokens: int = 0):
+        """退回 throttle 扣除的额度（请求随后在排队时被拒绝或取消，没有到达上游）"""
+        tenant.requests.refund(1)
+        if tokens > 0:
+            tenant.tokens.refund(tokens)
+            tenant.charged_tokens -= tokens
+        tenant.refunded += 1
+
+    def stats(self, limit: int = 100) -> Dict[str, Any]:
+        """租户统计：按准入次数取前 limit 个"""
+        tenants = sorted(self._tenants.values(), key=lambda t: -t.admitted)[:limit]
+        return {
+            "tracked": len(self._tenants),
+            "max_tenants": self.max_tenants,
+            "evicted": self.evicted,
+            "unknown_keys": self.unknown_keys,
+            "tenants": {tenant.id: tenant.stats() for tenant in tenants},
+        }
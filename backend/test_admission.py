@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+准入控制测试：加权公平出队、排队上限与超时、取消的等待者、租户排队上限与名额持有
+"""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+from tenants import TenantRegistry
+
+
+async def _drain(controller: AdmissionController, jobs, hold):
+    """依次排入 jobs（[(租户, 数量)]），释放 hold 后按准入顺序返回租户 ID"""
+    order = []
+
+    async def job(tenant):
+        ticket = await controller.acquire(None, tenant)
+        order.append(tenant.id)
+        await asyncio.sleep(0)
+        ticket.release()
+
+    tasks = []
+    for tenant, count in jobs:
+        tasks += [asyncio.ensure_future(job(tenant)) for _ in range(count)]
+        await asyncio.sleep(0)
+    hold.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_weighted_fair_ordering():
+    """积压最多的租户先入队也不能独占名额，各租户按权重比例出队"""
+    async def run():
+        registry = TenantRegistry({"max_queue": 100}, {"big": {"weight": 3}})
+        big, small, flood = registry.get("big"), registry.get("small"), registry.get("flood")
+        controller = AdmissionController("test", max_in_flight=1, max_queue=500, queue_timeout=5)
+        hold = await controller.acquire(None, big)
+        order = await _drain(controller, [(flood, 40), (big, 30), (small, 10)], hold)
+
+        first = order[:25]
+        assert first.count("big") == 15
+        assert first.count("small") == 5
+        assert first.count("flood") == 5
+        assert controller.in_flight == 0
+        assert controller.stats()["queue_depth"] == 0
+        assert controller.stats()["queued_tenants"] == 0
+        for tenant in (big, small, flood):
+            assert tenant.in_flight == 0 and tenant.queued == 0
+
+    asyncio.run(run())
+
+
+def test_requests_without_tenant_stay_fifo():
+    async def run():
+        controller = AdmissionController("test", max_in_flight=1, max_queue=10, queue_timeout=5)
+        hold = await controller.acquire()
+        order = []
+
+        async def job(index):
+            async with await controller.acquire():
+                order.append(index)
+
+        tasks = [asyncio.ensure_future(job(i)) for i in range(5)]
+        await asyncio.sleep(0)
+        hold.release()
+        await asyncio.gather(*tasks)
+        assert order == list(range(5))
+
+    asyncio.run(run())
+
+
+def test_queue_full_and_timeout_without_tenant():
+    async def run():
+        controller = AdmissionController("chat", max_in_flight=1, max_queue=1, queue_timeout=0.05)
+        hold = await controller.acquire()
+        waiting = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as full:
+            await controller.acquire()
+        assert full.value.status_code == 429 and full.value.retry_after >= 1
+        with pytest.raises(AdmissionRejected) as timed_out:
+            await waiting
+        assert timed_out.value.status_code == 503
+
+        stats = controller.stats()
+        assert (stats["rejected_queue_full"], stats["rejected_timeout"], stats["queue_depth"]) == (1, 1, 0)
+        hold.release()
+        hold.release()  # 重复释放无效
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_request_timeout_is_capped():
+    async def run():
+        controller = AdmissionController("chat", max_in_flight=1, queue_timeout=10, max_queue_timeout=0.05)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected):
+            await asyncio.wait_for(controller.acquire(timeout=60), timeout=1.0)
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_passes_slot_on():
+    """被移交名额后、恢复执行前被取消的等待者把名额转交下一个"""
+    async def run():
+        controller = AdmissionController("chat", max_in_flight=1, queue_timeout=1.0)
+        hold = await controller.acquire()
+        first = asyncio.ensure_future(controller.acquire())
+        second = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        hold.release()  # 名额移交给 first
+        first.cancel()
+        ticket = await asyncio.wait_for(second, timeout=0.5)
+        assert first.cancelled()
+        assert controller.in_flight == 1 and controller.stats()["queue_depth"] == 0
+        ticket.release()
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_hold_defers_release_until_dropped():
+    async def run():
+        controller = AdmissionController("stream", max_in_flight=1)
+        ticket = await controller.acquire()
+        drop = ticket.hold()
+        ticket.release()
+        assert controller.in_flight == 1  # 仍被持有
+        drop()
+        drop()  # 重复调用无效
+        assert controller.in_flight == 0
+        # 已归还后的 hold 不再占用名额
+        ticket.hold()()
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_tenant_queue_limit_and_timeout():
+    async def run():
+        registry = TenantRegistry({"max_queue": 2})
+        tenant = registry.get("t")
+        controller = AdmissionController("test", max_in_flight=1, max_queue=10, queue_timeout=0.05)
+        hold = await controller.acquire(None, tenant)
+        waiting = [asyncio.ensure_future(controller.acquire(None, tenant)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(None, tenant)
+        assert rejected.value.status_code == 429
+        # 其他租户不受该租户排队上限影响
+        other = asyncio.ensure_future(controller.acquire(None, registry.get("other")))
+
+        for task in waiting:
+            with pytest.raises(AdmissionRejected) as timed_out:
+                await task
+            assert timed_out.value.status_code == 503
+        with pytest.raises(AdmissionRejected):
+            await other
+        assert tenant.rejected_queue_full == 1
+        assert tenant.rejected_timeout == 2
+        assert tenant.queued == 0
+
+        hold.release()
+        assert controller.in_flight == 0 and tenant.in_flight == 0
+        # 放弃排队的等待者不占用名额，之后立即准入
+        ticket = await controller.acquire(None, tenant)
+        ticket.release()
+
+    asyncio.run(run())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+代理池测试：并发借出、复用、LRU 淘汰与 TTL 回收
+"""
+
+import pytest
+
+import agent_pool
+from agent_pool import AgentPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(agent_pool.time, "monotonic", fake)
+    return fake
+
+
+def _factory():
+    return object()
+
+
+def test_concurrent_checkouts_get_distinct_agents():
+    pool = AgentPool()
+    first = pool.acquire("k", _factory)
+    second = pool.acquire("k", _factory)
+    assert first is not second
+    assert pool.stats()["in_use"] == 2
+
+    pool.release("k", first)
+    assert pool.acquire("k", _factory) is first
+    stats = pool.stats()
+    assert (stats["size"], stats["hits"], stats["misses"]) == (2, 1, 2)
+
+
+def test_unreusable_and_overflow_releases_are_evicted():
+    pool = AgentPool(max_idle_per_key=1)
+    agents = [pool.acquire("k", _factory) for _ in range(3)]
+    pool.release("k", agents[0], reusable=False)
+    pool.release("k", agents[1])
+    pool.release("k", agents[2])
+    stats = pool.stats()
+    assert stats["idle"] == 1 and stats["in_use"] == 0
+    assert stats["evictions"] == 2
+
+
+def test_lru_eviction_skips_checked_out_keys():
+    pool = AgentPool(max_keys=2)
+    busy = pool.acquire("busy", _factory)
+    pool.release("idle", pool.acquire("idle", _factory))
+    pool.release("new", pool.acquire("new", _factory))
+    assert set(pool._entries) == {"busy", "new"}
+    assert pool.stats()["evictions"] == 1
+
+    # 借出期间键被淘汰时，归还的代理直接丢弃
+    pool.clear()
+    pool.release("busy", busy)
+    assert pool.stats()["size"] == 0
+
+
+def test_idle_agents_expire_after_ttl(clock):
+    pool = AgentPool(ttl=60.0)
+    agent = pool.acquire("k", _factory)
+    pool.release("k", agent)
+    clock.now += 61.0
+    assert pool.acquire("k", _factory) is not agent
+    assert pool.stats()["evictions"] == 1
+
+
+def test_factory_failure_does_not_leak_checkout():
+    pool = AgentPool()
+
+    def broken():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        pool.acquire("k", broken)
+    assert pool.stats()["in_use"] == 0
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+自适应上游并发限制测试：加性增、乘性减、Retry-After 与等待者唤醒
+"""
+
+import asyncio
+
+import pytest
+
+from aimd import AIMDLimiter, UpstreamBusy, get_retry_after
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def _limiter(**kwargs) -> AIMDLimiter:
+    defaults = {"initial_limit": 4, "min_limit": 1, "max_limit": 16, "decrease_cooldown": 0.0}
+    defaults.update(kwargs)
+    return AIMDLimiter(**defaults)
+
+
+def test_additive_increase():
+    """每完成约 limit 个健康请求，限额加 1"""
+    limiter = _limiter()
+    for _ in range(5):
+        limiter.in_flight += 1
+        limiter.release(latency=0.1)
+    assert int(limiter.limit) == 5
+    assert limiter.increases == 5
+
+
+def test_slow_requests_do_not_increase():
+    limiter = _limiter()
+    limiter.in_flight += 1
+    limiter.release(latency=0.1)
+    before = limiter.limit
+    limiter.in_flight += 1
+    limiter.release(latency=1.0)
+    assert limiter.limit == before
+
+
+def test_multiplicative_decrease_with_cooldown():
+    limiter = _limiter(initial_limit=16, decrease_cooldown=60.0)
+    limiter.in_flight = 2
+    limiter.release(error=UpstreamError(429))
+    assert int(limiter.limit) == 8
+    # 冷却时间内同一波错误只减一次
+    limiter.release(error=UpstreamError(429))
+    assert int(limiter.limit) == 8
+    assert limiter.decreases == 1
+    assert limiter.history[-1]["reason"] == "rate_limited"
+
+
+def test_decrease_respects_min_limit():
+    limiter = _limiter(initial_limit=1)
+    limiter.in_flight = 1
+    limiter.release(error=asyncio.TimeoutError())
+    assert int(limiter.limit) == 1
+
+
+def test_non_throttling_errors_keep_limit():
+    limiter = _limiter()
+    limiter.in_flight = 1
+    limiter.release(error=UpstreamError(500))
+    assert int(limiter.limit) == 4
+    assert limiter.decreases == 0
+
+
+def test_retry_after_headers():
+    assert get_retry_after(UpstreamError(429, {"retry-after": "3"})) == 3.0
+    assert get_retry_after(UpstreamError(429, {"retry-after-ms": "250"})) == 0.25
+    assert get_retry_after(UpstreamError(429, {"x-ratelimit-reset-requests": "1m30s"})) == 90.0
+    assert get_retry_after(UpstreamError(429)) is None
+
+
+def test_cancelled_waiter_hands_off_slot():
+    """被唤醒但在占用名额前被取消的等待者把名额转交给下一个等待者"""
+    async def run():
+        limiter = _limiter(initial_limit=1, max_limit=1, acquire_timeout=1.0)
+        await limiter.acquire()
+        first = asyncio.ensure_future(limiter.acquire())
+        second = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+
+        limiter.release(latency=0.1)  # 唤醒 first
+        first.cancel()
+        await asyncio.wait_for(second, timeout=0.5)
+        assert first.cancelled()
+        assert limiter.in_flight == 1
+        assert limiter.stats()["waiting"] == 0
+
+    asyncio.run(run())
+
+
+def test_acquire_timeout_raises_upstream_busy():
+    async def run():
+        limiter = _limiter(initial_limit=1, max_limit=1, acquire_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(UpstreamBusy) as rejected:
+            await limiter.acquire()
+        assert rejected.value.retry_after >= 1
+        assert limiter.timeouts == 1
+        assert limiter.stats()["waiting"] == 0
+
+        # Retry-After 暂停超过剩余等待时间时立即拒绝
+        limiter.release(error=UpstreamError(429, {"retry-after": "30"}))
+        with pytest.raises(UpstreamBusy) as blocked:
+            await limiter.acquire(0.1)
+        assert blocked.value.retry_after >= 29
+
+    asyncio.run(run())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+批量请求体增量解析测试：跨块拆分的元素、格式错误的行与大小限制
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from batch import BatchParseError, BatchRunner, IncrementalItemParser, iter_items
+
+
+def _feed_in_pieces(parser: IncrementalItemParser, body: bytes, size: int):
+    items = []
+    for start in range(0, len(body), size):
+        items += parser.feed(body[start:start + size])
+    items += parser.feed(b"", final=True)
+    return items
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1024])
+def test_ndjson_split_across_chunks(size):
+    rows = [{"message": "你好"}, {"message": "second", "use_cache": False}, {"message": "x" * 50}]
+    body = "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode("utf-8")
+    parser = IncrementalItemParser()
+    assert _feed_in_pieces(parser, body, size) == rows
+    assert parser.error is None
+
+
+@pytest.mark.parametrize("size", [1, 5, 1024])
+def test_json_array_split_across_chunks(size):
+    rows = [{"message": "a"}, {"message": "多字节字符"}, 12, "tail"]
+    body = json.dumps(rows, ensure_ascii=False).encode("utf-8")
+    parser = IncrementalItemParser()
+    assert _feed_in_pieces(parser, body, size) == rows
+    assert parser.error is None
+
+
+def test_ndjson_skips_blank_lines_and_crlf():
+    parser = IncrementalItemParser()
+    items = parser.feed(b'{"a": 1}\r\n\r\n  \n{"a": 2}\n', final=True)
+    assert items == [{"a": 1}, {"a": 2}]
+
+
+def test_malformed_ndjson_line_keeps_earlier_items():
+    parser = IncrementalItemParser()
+    items = parser.feed(b'{"a": 1}\n{"a": 2}\n{bad\n{"a": 3}\n', final=True)
+    assert items == [{"a": 1}, {"a": 2}]
+    assert isinstance(parser.error, BatchParseError)
+    assert "第 3 行" in str(parser.error)
+    # 出错后不再返回新元素
+    assert parser.feed(b'{"a": 4}\n', final=True) == []
+
+
+def test_malformed_json_array():
+    parser = IncrementalItemParser()
+    assert parser.feed(b'[{"a": 1} {"a": 2}]', final=True) == [{"a": 1}]
+    assert "缺少逗号" in str(parser.error)
+
+    parser = IncrementalItemParser()
+    assert parser.feed(b'[{"a": 1},', final=True) == [{"a": 1}]
+    assert parser.error is not None
+
+    parser = IncrementalItemParser()
+    assert parser.feed(b'[1] [2]', final=True) == [1]
+    assert "多余内容" in str(parser.error)
+
+
+def test_number_at_chunk_boundary_waits_for_more_data():
+    parser = IncrementalItemParser()
+    assert parser.feed(b"[12") == []
+    assert parser.feed(b"34]", final=True) == [1234]
+
+
+def test_utf8_split_and_invalid_bytes():
+    parser = IncrementalItemParser()
+    data = json.dumps({"m": "中"}, ensure_ascii=False).encode("utf-8") + b"\n"
+    # 多字节字符被拆到两块中仍能正确解码
+    assert parser.feed(data[:7]) == []
+    assert parser.feed(data[7:], final=True) == [{"m": "中"}]
+
+    parser = IncrementalItemParser()
+    parser.feed(b'{"m": "\xff"}\n', final=True)
+    assert "UTF-8" in str(parser.error)
+
+
+def test_item_size_limit():
+    parser = IncrementalItemParser(max_item_bytes=16)
+    assert parser.feed(b'{"message": "' + b"x" * 32) == []
+    assert "16 字节" in str(parser.error)
+
+
+def test_iter_items_enforces_max_items():
+    async def chunks():
+        yield b'{"a": 1}\n{"a": 2}\n'
+        yield b'{"a": 3}\n'
+
+    async def run():
+        seen = []
+        with pytest.raises(BatchParseError):
+            async for item in iter_items(chunks(), max_items=2, max_item_bytes=1024):
+                seen.append(item)
+        return seen
+
+    assert asyncio.run(run()) == [{"a": 1}, {"a": 2}]
+
+
+def test_runner_reports_item_errors_and_parse_error():
+    async def chunks():
+        yield b'{"n": 1}\n{"n": 2}\n'
+        yield b"{bad\n"
+
+    async def handle(item):
+        if item["n"] == 2:
+            error = ValueError("boom")
+            error.status_code = 429
+            raise error
+        return item["n"] * 10
+
+    async def run():
+        runner = BatchRunner(default_concurrency=2)
+        items = iter_items(chunks(), max_items=10, max_item_bytes=1024)
+        return [result async for result in runner.run(items, handle, 2)], runner
+
+    results, runner = asyncio.run(run())
+    by_index = {r["index"]: r for r in results if "index" in r}
+    assert by_index[0] == {"index": 0, "status": 200, "response": 10}
+    assert by_index[1]["status"] == 429 and by_index[1]["error"] == "boom"
+    assert results[-1]["completed"] == 2 and "第 3 行" in results[-1]["error"]
+    assert runner.parse_errors == 1 and runner.failed_items == 1
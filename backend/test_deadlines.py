@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+流式截止时间测试：首个片段、片段间隔与整体超时，以及超时后关闭上游
+"""
+
+import asyncio
+
+from deadlines import FIRST_TOKEN_TIMEOUT, IDLE_TIMEOUT, TOTAL_TIMEOUT, Deadlines, enforce
+
+
+class Upstream:
+    """按脚本产出内容片段；数字表示先暂停该秒数"""
+
+    def __init__(self, *script):
+        self.script = script
+        self.closed = False
+
+    async def events(self):
+        try:
+            for step in self.script:
+                if isinstance(step, str):
+                    yield {"type": "content", "content": step}
+                else:
+                    await asyncio.sleep(step)
+        finally:
+            self.closed = True
+
+
+async def _collect(upstream: Upstream, first_token=1.0, idle=1.0, total=5.0):
+    deadlines = Deadlines(first_token, idle, total)
+    return [event async for event in enforce(upstream.events(), deadlines)]
+
+
+def test_resolve_applies_defaults_and_cap():
+    defaults = {"first_token": 30.0, "idle": 20.0, "total": 300.0}
+    deadlines = Deadlines.resolve(defaults, 120.0, first_token=5.0, idle=0, total=600.0)
+    assert deadlines.to_dict() == {"first_token": 5.0, "idle": 20.0, "total": 120.0}
+
+
+def test_stream_within_deadlines_passes_through():
+    async def run():
+        upstream = Upstream("a", 0.01, "b")
+        events = await _collect(upstream)
+        assert [e["content"] for e in events] == ["a", "b"]
+        assert upstream.closed
+
+    asyncio.run(run())
+
+
+def test_first_token_timeout():
+    async def run():
+        upstream = Upstream(1.0, "a")
+        events = await _collect(upstream, first_token=0.05)
+        assert len(events) == 1
+        assert events[0]["type"] == "error" and events[0]["reason"] == FIRST_TOKEN_TIMEOUT
+        # 超时后立即取消上游
+        assert upstream.closed
+
+    asyncio.run(run())
+
+
+def test_idle_timeout_after_first_token():
+    async def run():
+        upstream = Upstream("a", 1.0, "b")
+        events = await _collect(upstream, first_token=0.5, idle=0.05)
+        assert [e["type"] for e in events] == ["content", "error"]
+        assert events[1]["reason"] == IDLE_TIMEOUT
+        assert upstream.closed
+
+    asyncio.run(run())
+
+
+def test_total_timeout_wins_when_shorter():
+    async def run():
+        upstream = Upstream("a", 0.01, "b", 0.01, "c", 0.5, "d")
+        events = await _collect(upstream, first_token=1.0, idle=1.0, total=0.15)
+        assert events[-1]["type"] == "error" and events[-1]["reason"] == TOTAL_TIMEOUT
+        assert [e["content"] for e in events[:-1]] == ["a", "b", "c"]
+        assert upstream.closed
+
+    asyncio.run(run())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+对冲请求测试：对冲延迟、先出 token 者胜出、落败请求被取消
+"""
+
+import asyncio
+
+import pytest
+
+from hedging import Hedger
+
+
+class Upstream:
+    """按调用顺序返回首个 token 延迟不同的流"""
+
+    def __init__(self, *first_token_delays, fail=()):
+        self.delays = list(first_token_delays)
+        self.fail = set(fail)
+        self.opened = 0
+        self.closed = []
+
+    def open(self):
+        index = self.opened
+        self.opened += 1
+
+        async def gen():
+            try:
+                await asyncio.sleep(self.delays[index])
+                if index in self.fail:
+                    raise RuntimeError(f"upstream {index} failed")
+                yield f"{index}:a"
+                yield f"{index}:b"
+            finally:
+                self.closed.append(index)
+        return gen()
+
+
+async def _collect(hedger: Hedger, upstream: Upstream, enabled: bool = True):
+    return [item async for item in hedger.stream(upstream.open, enabled)]
+
+
+def test_delay_fixed_adaptive_and_clamped():
+    assert Hedger(delay=0.3).delay() == 0.3
+    hedger = Hedger(min_delay=0.5, max_delay=10.0, window=3, min_samples=3)
+    assert hedger.delay() == 10.0  # 样本不足
+    for sample in (1.0, 2.0, 3.0):
+        hedger.record_ttft(sample)
+    assert hedger.delay() == 3.0
+    # 滚动窗口只保留最近的样本，结果不低于 min_delay
+    for _ in range(3):
+        hedger.record_ttft(0.01)
+    assert hedger.delay() == 0.5
+
+
+def test_fast_primary_is_not_hedged():
+    async def run():
+        hedger = Hedger(delay=0.05)
+        upstream = Upstream(0.0)
+        assert await _collect(hedger, upstream) == ["0:a", "0:b"]
+        assert upstream.opened == 1
+        assert hedger.stats()["hedges"] == 0
+        assert hedger.stats()["ttft_samples"] == 1
+
+    asyncio.run(run())
+
+
+def test_hedge_wins_and_slow_primary_is_cancelled():
+    async def run():
+        hedger = Hedger(delay=0.02)
+        upstream = Upstream(1.0, 0.0)
+        assert await _collect(hedger, upstream) == ["1:a", "1:b"]
+        assert upstream.opened == 2
+        assert sorted(upstream.closed) == [0, 1]
+        stats = hedger.stats()
+        assert (stats["hedges"], stats["hedge_wins"], stats["hedge_rate"]) == (1, 1, 1.0)
+
+    asyncio.run(run())
+
+
+def test_primary_can_still_win_after_hedging():
+    async def run():
+        hedger = Hedger(delay=0.02)
+        upstream = Upstream(0.04, 1.0)
+        assert await _collect(hedger, upstream) == ["0:a", "0:b"]
+        assert hedger.stats()["hedge_wins"] == 0
+        assert 1 in upstream.closed
+
+    asyncio.run(run())
+
+
+def test_failed_request_falls_back_to_the_other():
+    async def run():
+        hedger = Hedger(delay=0.02)
+        upstream = Upstream(0.03, 0.05, fail={0})
+        assert await _collect(hedger, upstream) == ["1:a", "1:b"]
+
+        both_fail = Upstream(0.03, 0.0, fail={0, 1})
+        with pytest.raises(RuntimeError):
+            await _collect(hedger, both_fail)
+
+    asyncio.run(run())
+
+
+def test_disabled_only_records_ttft():
+    async def run():
+        hedger = Hedger(delay=0.01)
+        upstream = Upstream(0.05)
+        assert await _collect(hedger, upstream, enabled=False) == ["0:a", "0:b"]
+        assert upstream.opened == 1
+        stats = hedger.stats()
+        assert (stats["requests"], stats["hedged_requests"], stats["ttft_samples"]) == (1, 0, 1)
+
+    asyncio.run(run())
+
+
+def test_consumer_closing_early_closes_winner():
+    async def run():
+        hedger = Hedger(delay=0.02)
+        upstream = Upstream(1.0, 0.0)
+        stream = hedger.stream(upstream.open)
+        assert await stream.__anext__() == "1:a"
+        await stream.aclose()
+        assert sorted(upstream.closed) == [0, 1]
+
+    asyncio.run(run())
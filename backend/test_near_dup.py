@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+近似重复检索测试：SimHash 近似/不相似判定、特征截断与分段索引
+"""
+
+import pytest
+
+import near_dup
+from near_dup import SimHashIndex, shingles, similarity, simhash
+
+
+def _similarity(index: SimHashIndex, a: str, b: str) -> float:
+    return similarity(index.fingerprint(a), index.fingerprint(b))
+
+
+def test_near_match():
+    """只差大小写、空白与标点的提示视为近似重复"""
+    index = SimHashIndex()
+    assert _similarity(
+        index,
+        "请帮我写一个Python函数，用来计算斐波那契数列的第n项，要求使用迭代实现。",
+        "请帮我写一个 python 函数,用来计算斐波那契数列的第 n 项，要求使用迭代实现!"
+    ) >= 0.95
+    assert _similarity(
+        index,
+        "How do I reverse a linked list in Python? Please explain step by step.",
+        "how do I reverse a linked list in python ? please explain step-by-step"
+    ) >= 0.95
+
+
+def test_non_match():
+    index = SimHashIndex()
+    assert _similarity(
+        index,
+        "请帮我写一个Python函数，用来计算斐波那契数列的第n项，要求使用迭代实现。",
+        "请帮我写一个Python函数，用来计算阶乘，要求使用递归实现。"
+    ) < 0.95
+    assert _similarity(
+        index,
+        "How do I reverse a linked list in Python? Please explain step by step.",
+        "How do I sort a linked list in Java? Please explain step by step."
+    ) < 0.95
+
+
+def test_short_prompts_have_no_fingerprint():
+    assert SimHashIndex().fingerprint("hi there") is None
+
+
+def test_shingles_keep_first_seen_order():
+    assert shingles("b a b c") == ["b", "a", "b a", "a b", "c", "b c"]
+
+
+def test_feature_count_does_not_overflow_lanes():
+    """超过单个计数槽容量的特征数只取前 MAX_FEATURES 个，指纹不被进位破坏"""
+    features = [f"w{i}" for i in range(near_dup.MAX_FEATURES + 10000)]
+    assert simhash(features) == simhash(features[:near_dup.MAX_FEATURES])
+    # 全部特征相同时每一位都应与该特征的哈希一致
+    same = ["x"] * 70000
+    assert simhash(same) == simhash(["x"])
+
+
+def test_index_lookup_and_namespaces():
+    index = SimHashIndex()
+    index.add("ns-a", 0b1011, "k1")
+    index.add("ns-b", 0b1011, "k2")
+
+    assert index.lookup("ns-a", 0b1011, 0.95) == ("k1", 1.0)
+    # 汉明距离 1：相似度 63/64
+    key, score = index.lookup("ns-a", 0b1010, 0.95)
+    assert key == "k1" and score == 63 / 64
+    assert index.lookup("ns-a", (1 << 64) - 1 - 0b1011, 0.95) is None
+    assert index.lookup("ns-c", 0b1011, 0.5) is None
+
+    index.remove("k1")
+    assert index.lookup("ns-a", 0b1011, 0.5) is None
+    assert index.stats()["namespaces"] == 1
+    index.clear()
+    stats = index.stats()
+    assert stats["entries"] == 0 and stats["namespaces"] == 0 and stats["buckets"] == 0
+
+
+def test_bands_follow_threshold():
+    assert near_dup.bands_for(0.95) == 4
+    assert near_dup.bands_for(1 - 3 / 64) == 4
+    assert near_dup.bands_for(0.9) == 8
+    assert near_dup.bands_for(1.0) == 1
+    assert SimHashIndex(min_threshold=0.9).bands == 8
+    with pytest.raises(ValueError):
+        SimHashIndex(bands=4, min_threshold=0.9)
+    with pytest.raises(ValueError):
+        SimHashIndex(bands=3)
+
+
+def test_lowered_threshold_still_finds_distant_match():
+    """汉明距离 6（相似度 0.906）的近似项在阈值 0.9 下必须能找到"""
+    index = SimHashIndex(min_threshold=0.9, min_shingles=1)
+    base = 0x0123456789ABCDEF
+    # 翻转分布在前四个 16 位段中的 6 位：4 段索引下没有一段相同
+    nearby = base ^ (0b11 | 0b11 << 16 | 0b1 << 32 | 0b1 << 48)
+    index.add("ns", base, "k")
+    assert index.lookup("ns", nearby, 0.9) == ("k", 1 - 6 / 64)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+响应缓存测试：单飞去重、调用方取消、失败不缓存与 LRU/内存上限
+"""
+
+import asyncio
+
+from response_cache import ResponseCache
+
+
+class Upstream:
+    """可控的上游调用：release() 后返回结果"""
+
+    def __init__(self, chunks=("he", "llo")):
+        self.chunks = list(chunks)
+        self.calls = 0
+        self.done = asyncio.Event()
+        self.error = None
+
+    async def __call__(self):
+        self.calls += 1
+        await self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.chunks
+
+    def release(self, error=None):
+        self.error = error
+        self.done.set()
+
+
+def test_concurrent_misses_share_one_upstream_call():
+    async def run():
+        cache = ResponseCache()
+        upstream = Upstream()
+        callers = [asyncio.ensure_future(cache.get_or_compute("k", upstream)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert cache.stats()["inflight"] == 1
+
+        upstream.release()
+        results = await asyncio.gather(*callers)
+        assert results == [["he", "llo"]] * 5
+        assert upstream.calls == 1
+
+        stats = cache.stats()
+        assert (stats["misses"], stats["hits"], stats["coalesced"]) == (1, 4, 4)
+        assert stats["inflight"] == 0 and stats["entries"] == 1
+        # 之后的请求直接命中缓存
+        assert await cache.get_or_compute("k", upstream) == ["he", "llo"]
+        assert upstream.calls == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    async def run():
+        cache = ResponseCache()
+        upstream = Upstream()
+        owner = asyncio.ensure_future(cache.get_or_compute("k", upstream))
+        follower = asyncio.ensure_future(cache.get_or_compute("k", upstream))
+        await asyncio.sleep(0)
+
+        owner.cancel()
+        await asyncio.sleep(0)
+        upstream.release()
+        assert await follower == ["he", "llo"]
+        assert owner.cancelled()
+        assert cache.stats()["entries"] == 1
+
+    asyncio.run(run())
+
+
+def test_failure_is_shared_but_not_cached():
+    async def run():
+        cache = ResponseCache()
+        upstream = Upstream()
+        callers = [asyncio.ensure_future(cache.get_or_compute("k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        upstream.release(RuntimeError("boom"))
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert upstream.calls == 1
+
+        retry = Upstream()
+        retry.release()
+        assert await cache.get_or_compute("k", retry) == ["he", "llo"]
+        assert retry.calls == 1
+
+    asyncio.run(run())
+
+
+def test_lru_and_byte_limits():
+    async def run():
+        cache = ResponseCache(max_entries=2, max_bytes=10)
+        cache.put("a", ["aaa"])
+        cache.put("b", ["bbb"])
+        assert await cache.get("a") == ["aaa"]  # a 变为最近使用
+        cache.put("c", ["ccc"])
+        assert await cache.get("b") is None
+        assert await cache.get("a") == ["aaa"] and await cache.get("c") == ["ccc"]
+
+        # 超过单条上限的响应不缓存
+        cache.put("big", ["x" * 11])
+        assert await cache.get("big") is None
+        cache.put("d", ["dddddddd"])
+        assert cache.stats()["bytes"] <= 10
+        assert cache.stats()["evictions"] == 3
+
+    asyncio.run(run())
+
+
+def test_expired_entries_miss(monkeypatch):
+    import response_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(ttl=10)
+    cache.put("k", ["v"])
+    now[0] += 11
+    assert asyncio.run(cache.get("k")) is None
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+会话存储测试：服务端生成 ID、并发追加的序号分配、多进程共用数据库、上下文窗口裁剪与过期清理
+"""
+
+import asyncio
+import time
+
+from sessions import ASSISTANT, USER, SessionStore
+
+
+def test_ids_are_generated_server_side(tmp_path):
+    async def run():
+        store = SessionStore(str(tmp_path / "s.db"))
+        first = await store.create("sys")
+        second = await store.create("sys")
+        assert first.id != second.id and len(first.id) == 32
+        assert await store.get("unknown") is None
+        assert store.stats()["misses"] == 1
+        store.close()
+
+    asyncio.run(run())
+
+
+def test_append_and_reload_from_database(tmp_path):
+    async def run():
+        path = str(tmp_path / "s.db")
+        store = SessionStore(path)
+        session = await store.create("sys")
+        await store.append_turn(session, "q1", "a1")
+        await store.append_turn(session, "q2", "a2")
+        store.close()
+
+        reopened = SessionStore(path)
+        loaded = await reopened.get(session.id)
+        assert loaded.system_message == "sys" and loaded.message_count == 4
+        assert [(m.seq, m.role, m.content) for m in loaded.window] == [
+            (0, USER, "q1"), (1, ASSISTANT, "a1"), (2, USER, "q2"), (3, ASSISTANT, "a2")
+        ]
+        assert [m.content for m in await reopened.history(session.id, 2)] == ["q2", "a2"]
+        reopened.close()
+
+    asyncio.run(run())
+
+
+def test_concurrent_appends_get_distinct_seqs(tmp_path):
+    """同一会话的并发写入（含两个各自持有会话副本的存储实例）不会覆盖彼此的消息"""
+    async def run():
+        path = str(tmp_path / "s.db")
+        store = SessionStore(path, shared=True)
+        other = SessionStore(path, shared=True)
+        session = await store.create("sys")
+        stale_copy = await other.get(session.id)
+
+        await asyncio.gather(*(store.append_turn(session, f"q{i}", f"a{i}") for i in range(5)))
+        await other.append_turn(stale_copy, "q-other", "a-other")
+
+        assert [m.seq for m in session.window] == list(range(10))
+        assert stale_copy.message_count == 12
+        history = await store.history(session.id, 100)
+        assert [m.seq for m in history] == list(range(12))
+        assert history[-2].content == "q-other"
+        assert (await store.get(session.id)).message_count == 12
+        store.close()
+        other.close()
+
+    asyncio.run(run())
+
+
+def test_fit_window_trims_whole_turns_and_summarizes():
+    async def run():
+        store = SessionStore()
+        session = await store.create("sys")
+        for i in range(6):
+            await store.append_turn(session, "问题" * 20 + str(i), "回答" * 20 + str(i))
+
+        summarized = []
+
+        async def summarize(summary, dropped):
+            summarized.extend(dropped)
+            return "摘要"
+
+        window = await store.fit_window(session, "新问题", budget=400, trim_target=0.5, summarize=summarize)
+        assert len(window) == 4 and window[0].role == USER
+        assert session.window_start == window[0].seq
+        assert session.summary == "摘要" and summarized[0].seq == 0
+        # 未超出预算时窗口不变
+        assert await store.fit_window(session, "新问题", budget=10000) is session.window
+
+    asyncio.run(run())
+
+
+def test_purge_expired(tmp_path):
+    async def run():
+        store = SessionStore(str(tmp_path / "s.db"), ttl=60)
+        session = await store.create("sys")
+        fresh = await store.create("sys")
+        session.updated_at = time.time() - 120
+        await store._run(store._save_state, session)
+
+        assert await store.purge() == 1
+        assert await store.get(session.id) is None
+        assert await store.get(fresh.id) is not None
+        store.close()
+
+    asyncio.run(run())
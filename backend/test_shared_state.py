@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+多进程共享状态测试：跨实例的响应缓存二级存储、worker 快照汇总与过期清理
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+from response_cache import ResponseCache
+from shared_state import SharedStore
+
+
+def test_cache_round_trip_and_expiry(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"))
+    store.cache_put("k", ["你", "好"], 6, time.time() + 60)
+    chunks, expires_at = store.cache_get("k")
+    assert chunks == ["你", "好"] and expires_at > time.time()
+
+    store.cache_put("old", ["x"], 1, time.time() - 1)
+    assert store.cache_get("old") is None
+    store.purge()
+    assert store.stats()["cache_entries"] == 1 and store.stats()["cache_bytes"] == 6
+    store.close()
+
+
+def test_purge_enforces_byte_limit_oldest_first(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"), max_cache_bytes=10)
+    now = time.time()
+    for i, key in enumerate("abc"):
+        store.cache_put(key, ["xxxxx"], 5, now + 60 + i)
+    store.purge()
+    assert store.cache_get("a") is None
+    assert store.cache_get("b") is not None and store.cache_get("c") is not None
+    store.close()
+
+
+def test_worker_snapshots_and_stale_workers(tmp_path):
+    store = SharedStore(str(tmp_path / "shared.db"), stale_after=30)
+    store.publish("stats", {"requests": 1})
+    assert store.collect("stats") == {os.getpid(): {"requests": 1}}
+    store._execute("UPDATE worker_state SET updated_at = ?", (time.time() - 60,))
+    assert store.collect("stats") == {}
+    store.close()
+
+
+def test_response_caches_share_entries_off_the_event_loop(tmp_path):
+    """一个 worker 写入的响应另一个 worker 可以命中；共享存储读写不在事件循环线程执行"""
+    async def run():
+        path = str(tmp_path / "shared.db")
+        loop_thread = threading.get_ident()
+        threads = []
+
+        class RecordingStore(SharedStore):
+            def _execute(self, sql, params=()):
+                threads.append(threading.get_ident())
+                return super()._execute(sql, params)
+
+        writer = ResponseCache(shared=RecordingStore(path))
+        reader = ResponseCache(shared=RecordingStore(path))
+
+        writer.put("k", ["he", "llo"])
+        for _ in range(100):
+            if await reader.get("k") is not None:
+                break
+            await asyncio.sleep(0.01)
+        assert reader.stats()["shared_hits"] == 1
+        # 之后从本进程内存命中
+        assert await reader.get("k") == ["he", "llo"]
+        assert reader.stats()["shared_hits"] == 1
+        assert threads and loop_thread not in threads
+        writer.shared.close()
+        reader.shared.close()
+
+    asyncio.run(run())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+SSE 合并测试：首个片段立即发送、按字节数与时间合并、非内容事件冲刷缓冲、提前关闭与上游异常
+"""
+
+import asyncio
+
+import pytest
+
+import sse
+
+
+class Upstream:
+    """按脚本产出事件；数字表示先暂停该秒数"""
+
+    def __init__(self, *script, error=None):
+        self.script = script
+        self.error = error
+        self.closed = False
+
+    async def events(self):
+        try:
+            for index, step in enumerate(self.script):
+                if isinstance(step, (int, float)):
+                    await asyncio.sleep(step)
+                elif isinstance(step, str):
+                    yield {"type": "content", "content": step, "id": f"s:{index}"}
+                else:
+                    yield step
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.closed = True
+
+
+async def _collect(upstream: Upstream, max_bytes=1024, flush_interval=0.05):
+    return [event async for event in sse.coalesce(upstream.events(), max_bytes, flush_interval)]
+
+
+def _contents(events):
+    return [e["content"] for e in events if e["type"] == "content"]
+
+
+def test_first_chunk_is_immediate_and_rest_are_merged():
+    async def run():
+        events = await _collect(Upstream("a", "b", "c", "d"))
+        assert _contents(events) == ["a", "bcd"]
+        # 合并事件的 id 取最后一个片段的 ID
+        assert [e["id"] for e in events] == ["s:0", "s:3"]
+        assert all("offset" in e for e in events)
+
+    asyncio.run(run())
+
+
+def test_flushes_when_buffer_reaches_max_bytes():
+    async def run():
+        events = await _collect(Upstream("x", "ab", "cd", "ef", "g"), max_bytes=4)
+        assert _contents(events) == ["x", "abcd", "efg"]
+
+    asyncio.run(run())
+
+
+def test_flushes_on_timer_while_upstream_stalls():
+    async def run():
+        loop = asyncio.get_running_loop()
+        upstream = Upstream("a", "b", "c", 0.3, "d")
+        received = []
+        async for event in sse.coalesce(upstream.events(), 1024, 0.02):
+            received.append((event["content"], loop.time()))
+        assert [content for content, _ in received] == ["a", "bc", "d"]
+        # "bc" 在上游停顿期间按定时器发出，而不是等到 "d" 到达
+        assert received[2][1] - received[1][1] >= 0.2
+
+    asyncio.run(run())
+
+
+def test_non_content_event_flushes_buffer_first():
+    async def run():
+        end = {"type": "end", "content": ""}
+        events = await _collect(Upstream("a", "b", "c", end))
+        assert [(e["type"], e["content"]) for e in events] == [
+            ("content", "a"), ("content", "bc"), ("end", "")
+        ]
+
+    asyncio.run(run())
+
+
+def test_early_close_closes_upstream():
+    async def run():
+        upstream = Upstream("a", "b", 10)
+        stream = sse.coalesce(upstream.events(), 1024, 0.01)
+        assert (await stream.__anext__())["content"] == "a"
+        assert (await stream.__anext__())["content"] == "b"
+        await stream.aclose()
+        assert upstream.closed
+
+    asyncio.run(run())
+
+
+def test_upstream_error_propagates_after_buffered_chunks():
+    async def run():
+        upstream = Upstream("a", "b", error=RuntimeError("boom"))
+        stream = sse.coalesce(upstream.events(), 1024, 10)
+        received = []
+        with pytest.raises(RuntimeError, match="boom"):
+            async for event in stream:
+                received.append(event["content"])
+        assert received == ["a"]
+        assert upstream.closed
+
+    asyncio.run(run())
+
+
+def test_encode_stream_frames():
+    async def run():
+        upstream = Upstream("a", {"type": "end", "content": ""})
+        frames = [frame async for frame in sse.encode_stream(upstream.events(), 1024, 0.01)]
+        assert frames[0].startswith(b"id: s:0\ndata: ")
+        assert frames[1].startswith(b"data: ") and frames[1].endswith(b"\n\n")
+
+    asyncio.run(run())
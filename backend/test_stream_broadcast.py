@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+流式广播测试：Last-Event-ID 中途续传、共享上游、续传窗口、截止时间放弃与准入名额持有
+"""
+
+import asyncio
+
+from admission import AdmissionController
+from stream_broadcast import StreamBroadcaster, parse_event_id
+
+
+def _content(*texts):
+    return [{"type": "content", "content": text} for text in texts]
+
+
+class Producer:
+    """可控的上游：每次 step() 放行一个事件"""
+
+    def __init__(self, events):
+        self.events = events
+        self.gate = asyncio.Semaphore(0)
+        self.started = 0
+        self.cancelled = False
+
+    async def stream(self):
+        self.started += 1
+        try:
+            for event in self.events:
+                await self.gate.acquire()
+                yield dict(event)
+        except (asyncio.CancelledError, GeneratorExit):
+            self.cancelled = True
+            raise
+
+    def step(self, count: int = 1):
+        for _ in range(count):
+            self.gate.release()
+
+
+async def _take(events, count):
+    return [await events.__anext__() for _ in range(count)]
+
+
+def test_parse_event_id():
+    assert parse_event_id("abc:12") == ("abc", 12)
+    assert parse_event_id("a:b:3") == ("a:b", 3)
+    assert parse_event_id("abc") is None
+    assert parse_event_id(":1") is None
+    assert parse_event_id("abc:x") is None
+
+
+def test_resume_from_middle_of_live_stream():
+    """断开后带 Last-Event-ID 续传：不重复、不遗漏，上游只调用一次"""
+    async def run():
+        broadcaster = StreamBroadcaster(grace=5.0)
+        producer = Producer(_content("a", "b", "c", "d") + [{"type": "end", "content": ""}])
+        first = broadcaster.subscribe(None, producer.stream)
+        producer.step(2)
+        received = await _take(first, 2)
+        await first.aclose()  # 客户端断开，上游在续传窗口内继续生成
+
+        producer.step(2)
+        await asyncio.sleep(0)
+        resumed = broadcaster.resume(received[-1]["id"])
+        assert resumed is not None
+        producer.step(1)
+        rest = [event async for event in resumed]
+
+        assert [e["content"] for e in received + rest] == ["a", "b", "c", "d", ""]
+        assert [parse_event_id(e["id"])[1] for e in received + rest] == [0, 1, 2, 3, 4]
+        assert producer.started == 1 and not producer.cancelled
+        assert broadcaster.stats()["resumed"] == 1
+
+    asyncio.run(run())
+
+
+def test_resume_unknown_or_past_end_misses():
+    async def run():
+        broadcaster = StreamBroadcaster(grace=5.0, retention_ttl=60.0)
+        producer = Producer(_content("a") + [{"type": "end", "content": ""}])
+        producer.step(2)
+        events = [event async for event in broadcaster.subscribe(None, producer.stream)]
+        await asyncio.sleep(0)
+
+        # 已结束的流在保留期内仍可从中间续传
+        replay = broadcaster.resume(events[0]["id"])
+        assert [e["type"] async for e in replay] == ["end"]
+        stream_id = parse_event_id(events[0]["id"])[0]
+        assert broadcaster.resume(f"{stream_id}:{len(events)}") is None
+        assert broadcaster.resume("unknown:0") is None
+        assert broadcaster.resume("garbage") is None
+        assert broadcaster.stats()["resume_misses"] == 3
+
+    asyncio.run(run())
+
+
+def test_joined_subscriber_replays_buffer():
+    async def run():
+        broadcaster = StreamBroadcaster()
+        producer = Producer(_content("a", "b") + [{"type": "end", "content": ""}])
+        owner = broadcaster.subscribe("key", producer.stream)
+        producer.step(1)
+        assert [e["content"] for e in await _take(owner, 1)] == ["a"]
+
+        joiner = broadcaster.subscribe("key", producer.stream)
+        producer.step(2)
+        owner_rest = [e["content"] async for e in owner]
+        joiner_all = [e["content"] async for e in joiner]
+        assert owner_rest == ["b", ""]
+        assert joiner_all == ["a", "b", ""]
+        assert producer.started == 1
+        assert broadcaster.stats()["joined"] == 1
+
+    asyncio.run(run())
+
+
+def test_grace_expiry_cancels_upstream():
+    async def run():
+        broadcaster = StreamBroadcaster(grace=0.05)
+        producer = Producer(_content("a", "b"))
+        events = broadcaster.subscribe(None, producer.stream)
+        producer.step(1)
+        first = await _take(events, 1)
+        await events.aclose()
+
+        await asyncio.sleep(0.1)
+        assert producer.cancelled
+        # 被取消的流不完整，不能续传
+        assert broadcaster.resume(first[0]["id"]) is None
+        assert broadcaster.stats()["cancelled"] == 1
+
+    asyncio.run(run())
+
+
+def test_owner_ticket_is_held_until_upstream_stops():
+    """创建者断开后，续传窗口内仍在生成的上游继续占用其准入名额；加入者不持有"""
+    async def run():
+        controller = AdmissionController("stream", max_in_flight=2)
+        broadcaster = StreamBroadcaster(grace=0.05)
+        producer = Producer(_content("a", "b"))
+        owner_ticket = await controller.acquire()
+        owner = broadcaster.subscribe("k", producer.stream, owner_ticket.hold)
+        joiner_ticket = await controller.acquire()
+        joiner = broadcaster.subscribe("k", producer.stream, joiner_ticket.hold)
+        producer.step(1)
+        await _take(owner, 1)
+        await _take(joiner, 1)
+
+        await owner.aclose()
+        owner_ticket.release()
+        await joiner.aclose()
+        joiner_ticket.release()
+        assert controller.in_flight == 1
+
+        await asyncio.sleep(0.1)
+        assert producer.cancelled
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_ticket_is_released_when_upstream_cancelled_before_start():
+    async def run():
+        controller = AdmissionController("stream", max_in_flight=1)
+        broadcaster = StreamBroadcaster()
+        ticket = await controller.acquire()
+        events = broadcaster.subscribe(None, Producer(_content("a")).stream, ticket.hold)
+        await events.aclose()
+        broadcaster.abandon(events)  # 上游任务尚未开始执行即被取消
+        ticket.release()
+        await asyncio.sleep(0.01)
+        assert controller.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_abandon_cancels_without_waiting_for_grace():
+    """因截止时间放弃的流立即取消上游，但仍有其他订阅者时不取消"""
+    async def run():
+        broadcaster = StreamBroadcaster(grace=30.0)
+        producer = Producer(_content("a", "b"))
+        owner = broadcaster.subscribe("key", producer.stream)
+        joiner = broadcaster.subscribe("key", producer.stream)
+        producer.step(1)
+        await _take(owner, 1)
+        await _take(joiner, 1)
+
+        await owner.aclose()
+        broadcaster.abandon(owner)
+        await asyncio.sleep(0)
+        assert not producer.cancelled
+
+        await joiner.aclose()
+        broadcaster.abandon(joiner)
+        await asyncio.sleep(0)
+        assert producer.cancelled
+        assert broadcaster.stats()["abandoned"] == 1
+
+    asyncio.run(run())
+
+
+def test_oversized_active_stream_is_aborted():
+    """进行中的流缓冲超过上限时以 error 事件结束并取消上游，之后不能续传"""
+    async def run():
+        broadcaster = StreamBroadcaster(grace=5.0, retention_ttl=60.0, max_retained_bytes=8)
+        producer = Producer(_content("abcd", "efgh", "ijkl", "mnop"))
+        producer.step(4)
+        events = [event async for event in broadcaster.subscribe("key", producer.stream)]
+
+        assert [e["type"] for e in events] == ["content", "content", "content", "error"]
+        assert producer.cancelled
+        assert broadcaster.resume(events[0]["id"]) is None
+        stats = broadcaster.stats()
+        assert stats["overflowed"] == 1 and stats["retained"] == 0 and stats["active"] == 0
+
+    asyncio.run(run())
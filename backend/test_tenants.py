@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+租户测试：令牌桶补充与退回、限流、身份识别与租户淘汰
+"""
+
+import pytest
+
+import tenants
+from admission import AdmissionRejected
+from tenants import TenantRegistry, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(tenants.time, "monotonic", fake)
+    return fake
+
+
+def test_token_bucket_refill(clock):
+    bucket = TokenBucket(rate=2.0, burst=4.0)
+    for _ in range(4):
+        assert bucket.take(1) == 0
+    assert bucket.take(1) == pytest.approx(0.5)
+
+    clock.now += 1.0
+    assert bucket.take(2) == 0
+    assert bucket.take(1) == pytest.approx(0.5)
+
+    # 补充不超过 burst
+    clock.now += 100.0
+    assert bucket.take(4) == 0
+    assert bucket.take(1) > 0
+
+
+def test_token_bucket_unlimited_and_oversized(clock):
+    assert TokenBucket(rate=0, burst=0).take(10 ** 9) == 0
+    bucket = TokenBucket(rate=1.0, burst=10.0)
+    # 超过桶容量的请求按装满计
+    assert bucket.take(50) == 0
+    assert bucket.take(50) == pytest.approx(10.0)
+
+
+def test_throttle_and_refund(clock):
+    registry = TenantRegistry({"requests_per_second": 1, "request_burst": 2, "tokens_per_minute": 600})
+    tenant = registry.get("t")
+    registry.throttle(tenant, 400)
+    with pytest.raises(AdmissionRejected) as rejected:
+        registry.throttle(tenant, 400)
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after == 20
+    assert tenant.throttled_tokens == 1
+    # token 额度不足时请求额度已退回，第二次请求仍可通过请求数限流
+    registry.throttle(tenant, 100)
+    with pytest.raises(AdmissionRejected):
+        registry.throttle(tenant)
+    assert tenant.throttled_requests == 1
+
+    registry.refund(tenant, 100)
+    assert tenant.charged_tokens == 400
+    registry.throttle(tenant, 200)
+
+
+def test_identify_tenant():
+    registry = TenantRegistry(tenants={"client:web": {"weight": 2}}, api_keys={"sk-a": "team-a"})
+    assert registry.identify({"authorization": "Bearer sk-a"}) == "team-a"
+    assert registry.identify({"x-api-key": "sk-a", "x-client-id": "c"}) == "team-a"
+    assert registry.identify({"x-client-id": "web"}) == "client:web"
+    assert registry.identify({}) == tenants.ANONYMOUS
+
+
+def test_unconfigured_identities_share_the_anonymous_tenant(clock):
+    """换一个未登记的 Key 或客户端 ID 不能得到新的限额"""
+    registry = TenantRegistry({"requests_per_second": 1, "request_burst": 1}, api_keys={"sk-a": "team-a"})
+    first = registry.resolve({"x-api-key": "random-1"})
+    registry.throttle(first)
+    for headers in ({"x-api-key": "random-2"}, {"authorization": "Bearer random-3"}, {"x-client-id": "spoofed"}, {}):
+        tenant = registry.resolve(headers)
+        assert tenant is first and tenant.id == tenants.ANONYMOUS
+        with pytest.raises(AdmissionRejected):
+            registry.throttle(tenant)
+    # 登记过的 Key 有自己的限额
+    registry.throttle(registry.resolve({"x-api-key": "sk-a"}))
+    stats = registry.stats()
+    assert stats["unknown_keys"] == 3 and stats["tracked"] == 2
+    assert "random" not in str(stats)
+
+
+def test_registry_evicts_idle_unconfigured_tenants():
+    registry = TenantRegistry(tenants={"vip": {"weight": 2}}, max_tenants=2)
+    registry.get("vip")
+    busy = registry.get("busy")
+    busy.in_flight = 1
+    registry.get("new")
+    assert "vip" in registry._tenants and "busy" in registry._tenants
+    assert registry.evicted == 1
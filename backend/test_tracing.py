@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+请求追踪测试：服务端生成追踪 ID，客户端 X-Request-ID 只作为属性保存
+"""
+
+import asyncio
+
+import tracing
+from tracing import TraceStore, TracingMiddleware
+
+
+async def _app(scope, receive, send):
+    with tracing.span("handler"):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+def _request(middleware, headers=()):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/chat", "headers": list(headers)}
+    asyncio.run(middleware(scope, None, send))
+    return dict(sent[0]["headers"])[b"x-request-id"].decode()
+
+
+def test_client_request_id_is_not_the_trace_key():
+    store = TraceStore()
+    middleware = TracingMiddleware(_app, store)
+    first = _request(middleware, [(b"x-request-id", b"dup")])
+    second = _request(middleware, [(b"x-request-id", b"dup")])
+
+    assert first != second and "dup" not in (first, second)
+    assert store.get(first)["client_request_id"] == "dup"
+    assert [s["name"] for s in store.get(second)["spans"]] == ["response_start", "handler"]
+    assert len(store.recent(client_request_id="dup")) == 2
+
+
+def test_unsafe_client_request_id_is_dropped():
+    store = TraceStore()
+    trace_id = _request(TracingMiddleware(_app, store), [(b"x-request-id", b"a b\r\nc")])
+    assert store.get(trace_id)["client_request_id"] is None
+
+
+def test_excluded_paths_are_not_traced():
+    store = TraceStore()
+    middleware = TracingMiddleware(_app, store)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware({"type": "http", "method": "GET", "path": "/metrics", "headers": []}, None, send))
+    assert store.recent() == []
+    assert sent[0]["headers"] == []
+
+
+def test_store_is_bounded():
+    store = TraceStore(max_traces=2)
+    middleware = TracingMiddleware(_app, store)
+    ids = [_request(middleware) for _ in range(3)]
+    assert store.get(ids[0]) is None
+    assert [r["request_id"] for r in store.recent()] == ids[:0:-1]
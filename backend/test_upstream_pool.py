@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+上游连接池测试：就绪检查只请求 GET /models，任一上游可用即通过
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from upstream_pool import UpstreamConnectionPool
+
+
+def _pool(statuses):
+    """statuses: {base_url 主机名: 状态码}；记录收到的请求"""
+    pool = UpstreamConnectionPool(http2=False)
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(statuses[request.url.host])
+
+    pool.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    for host in statuses:
+        pool.register_target(f"https://{host}/v1/", "sk-test")
+    return pool, requests
+
+
+def test_check_uses_models_endpoint():
+    async def run():
+        pool, requests = _pool({"a.example": 200, "b.example": 503})
+        assert await pool.check() == 1
+        assert [(r.method, r.url.path) for r in requests] == [("GET", "/v1/models")] * 2
+        assert requests[0].headers["authorization"] == "Bearer sk-test"
+        await pool.close()
+
+    asyncio.run(run())
+
+
+def test_check_fails_when_every_upstream_fails():
+    async def run():
+        pool, _ = _pool({"a.example": 401, "b.example": 500})
+        with pytest.raises(httpx.HTTPStatusError):
+            await pool.check()
+        await pool.close()
+
+        with pytest.raises(RuntimeError):
+            await UpstreamConnectionPool(http2=False).check()
+
+    asyncio.run(run())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+多上游路由测试：熔断状态转换、最少未完成请求选择、可重试错误的故障转移
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import upstream_router
+from upstream_router import CircuitBreaker, NoUpstreamAvailable, UpstreamEndpoint, UpstreamRouter, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(upstream_router.time, "monotonic", fake)
+    return fake
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _router(*names, failure_threshold=5):
+    router = UpstreamRouter()
+    for name in names:
+        router.add_endpoint(UpstreamEndpoint(
+            name=name, base_url=f"https://{name}", api_key="", model="m", weight=1.0,
+            model_client=None, breaker=CircuitBreaker(failure_threshold=failure_threshold, cooldown=30.0)
+        ))
+    return router
+
+
+def test_is_retryable():
+    request = httpx.Request("POST", "https://upstream/v1/chat/completions")
+    assert is_retryable(httpx.ConnectError("refused", request=request))
+    assert is_retryable(httpx.ReadTimeout("slow", request=request))
+    assert is_retryable(asyncio.TimeoutError())
+    for status in (500, 503, 408, 429):
+        assert is_retryable(StatusError(status))
+    for status in (400, 401, 404, 422):
+        assert not is_retryable(StatusError(status))
+    # 程序错误与请求内容错误不转移
+    for error in (TypeError("x"), KeyError("x"), ValueError("bad payload"), RuntimeError("x")):
+        assert not is_retryable(error)
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30.0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.try_acquire()
+
+    clock.now += 30.0
+    assert breaker.try_acquire()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # 半开时只放行一个试探请求
+    assert not breaker.try_acquire()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 2
+
+    clock.now += 30.0
+    assert breaker.try_acquire()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 0
+
+
+def test_rate_limit_trips_breaker_immediately(clock):
+    breaker = CircuitBreaker(failure_threshold=5)
+    breaker.record_failure(trip=True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_selects_least_outstanding_then_fastest():
+    async def run():
+        router = _router("a", "b")
+        a, b = router.endpoints
+        a.ewma_latency, b.ewma_latency = 1.0, 2.0
+        assert await router.acquire() is a
+        # 得分 = (未完成请求 + 1) × 延迟：a 为 2.0 与 b 相同时按登记顺序，a 升到 3.0 后选 b
+        assert await router.acquire() is a
+        assert await router.acquire() is b
+        assert (a.outstanding, b.outstanding) == (2, 1)
+
+    asyncio.run(run())
+
+
+def test_call_fails_over_on_retryable_errors():
+    async def run():
+        router = _router("a", "b")
+        calls = []
+
+        async def fn(endpoint):
+            calls.append(endpoint.name)
+            if endpoint.name == "a":
+                raise StatusError(503)
+            return "ok"
+
+        assert await router.call(fn) == "ok"
+        assert calls == ["a", "b"]
+        assert router.failovers == 1
+        assert [e.outstanding for e in router.endpoints] == [0, 0]
+        assert router.endpoints[0].failures == 1
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("error", [StatusError(400), TypeError("bug"), ValueError("bad payload")])
+def test_call_does_not_fail_over_or_trip_on_request_errors(error):
+    async def run():
+        router = _router("a", "b", failure_threshold=1)
+        calls = []
+
+        async def fn(endpoint):
+            calls.append(endpoint.name)
+            raise error
+
+        with pytest.raises(type(error)):
+            await router.call(fn)
+        assert calls == ["a"]
+        assert router.endpoints[0].breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(run())
+
+
+def test_call_raises_last_error_when_all_fail():
+    async def run():
+        router = _router("a", "b")
+
+        async def fn(endpoint):
+            raise StatusError(500)
+
+        with pytest.raises(StatusError):
+            await router.call(fn)
+        with pytest.raises(NoUpstreamAvailable):
+            await _router().call(fn)
+
+    asyncio.run(run())
+
+
+def test_stream_fails_over_only_before_first_chunk():
+    async def run():
+        router = _router("a", "b")
+
+        def failing_before(endpoint):
+            async def gen():
+                if endpoint.name == "a":
+                    raise StatusError(502)
+                yield endpoint.name
+            return gen()
+
+        assert [item async for item in router.stream(failing_before)] == ["b"]
+
+        def failing_after(endpoint):
+            async def gen():
+                yield endpoint.name
+                raise StatusError(502)
+            return gen()
+
+        received = []
+        with pytest.raises(StatusError):
+            async for item in router.stream(failing_after):
+                received.append(item)
+        assert len(received) == 1
+        assert router.failovers == 1
+
+    asyncio.run(run())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+WebSocket 多路复用测试：控制消息、并发流、取消、打开失败、断开清理与发送窗口背压
+"""
+
+import asyncio
+import json
+
+from starlette.websockets import WebSocketDisconnect
+
+from ws_chat import WebSocketChatSession
+
+_DISCONNECT = object()
+
+
+class FakeWebSocket:
+    """receive_text 从队列读取客户端消息；send_text 记录服务端消息，blocked 时发送挂起"""
+
+    def __init__(self):
+        self.inbox: "asyncio.Queue" = asyncio.Queue()
+        self.sent = []
+        self.unblocked = asyncio.Event()
+        self.unblocked.set()
+
+    def client_send(self, message):
+        self.inbox.put_nowait(message if isinstance(message, str) else json.dumps(message))
+
+    def disconnect(self):
+        self.inbox.put_nowait(_DISCONNECT)
+
+    async def receive_text(self) -> str:
+        message = await self.inbox.get()
+        if message is _DISCONNECT:
+            raise WebSocketDisconnect(1000)
+        return message
+
+    async def send_text(self, text: str):
+        await self.unblocked.wait()
+        self.sent.append(json.loads(text))
+
+    def messages(self, stream=None):
+        return [m for m in self.sent if m.get("stream") == stream]
+
+
+class Opener:
+    """打开流时返回可控的上游，并记录释放与关闭"""
+
+    def __init__(self, chunks=("a", "b"), gate=False, error=None):
+        self.chunks = chunks
+        self.gate = asyncio.Semaphore(0) if gate else None
+        self.error = error
+        self.produced = 0
+        self.opened = []
+        self.closed = []
+        self.released = []
+
+    async def __call__(self, message):
+        if self.error is not None:
+            raise self.error
+        stream_id = message["stream"]
+        self.opened.append(stream_id)
+
+        async def events():
+            try:
+                for chunk in self.chunks:
+                    if self.gate is not None:
+                        await self.gate.acquire()
+                    self.produced += 1
+                    yield {"type": "content", "content": chunk}
+                yield {"type": "end", "content": ""}
+            finally:
+                self.closed.append(stream_id)
+        return events(), lambda: self.released.append(stream_id)
+
+
+class Rejected(Exception):
+    def __init__(self):
+        super().__init__("队列已满")
+        self.status_code = 429
+        self.detail = "队列已满"
+
+
+async def _wait_for(condition, timeout=1.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not reached"
+        await asyncio.sleep(0.005)
+
+
+def _session(websocket, opener, **kwargs):
+    kwargs.setdefault("flush_interval", 0.001)
+    return WebSocketChatSession(websocket, opener, **kwargs)
+
+
+def test_control_messages_and_validation():
+    async def run():
+        websocket = FakeWebSocket()
+        task = asyncio.ensure_future(_session(websocket, Opener()).run())
+        websocket.client_send({"type": "ping"})
+        websocket.client_send("not json")
+        websocket.client_send("[1]")
+        websocket.client_send({"type": "chat"})
+        websocket.client_send({"type": "bogus", "stream": "s"})
+        await _wait_for(lambda: len(websocket.sent) == 5)
+        websocket.disconnect()
+        await task
+
+        assert websocket.sent[0] == {"type": "pong"}
+        assert [m.get("status") for m in websocket.sent[1:]] == [400, 400, 400, 400]
+        assert websocket.sent[4]["stream"] == "s"
+
+    asyncio.run(run())
+
+
+def test_concurrent_streams_are_multiplexed():
+    async def run():
+        websocket = FakeWebSocket()
+        opener = Opener()
+        task = asyncio.ensure_future(_session(websocket, opener).run())
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        websocket.client_send({"type": "chat", "stream": "s2", "message": "hi"})
+        await _wait_for(lambda: sorted(opener.released) == ["s1", "s2"])
+        websocket.disconnect()
+        await task
+
+        for stream_id in ("s1", "s2"):
+            messages = websocket.messages(stream_id)
+            assert "".join(m["content"] for m in messages if m["type"] == "content") == "ab"
+            assert messages[-1]["type"] == "end"
+        assert sorted(opener.closed) == ["s1", "s2"]
+
+    asyncio.run(run())
+
+
+def test_cancel_closes_upstream_and_releases():
+    async def run():
+        websocket = FakeWebSocket()
+        opener = Opener(gate=True)
+        task = asyncio.ensure_future(_session(websocket, opener).run())
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        opener.gate.release()
+        await _wait_for(lambda: websocket.messages("s1"))
+        websocket.client_send({"type": "cancel", "stream": "s1"})
+        await _wait_for(lambda: opener.released == ["s1"])
+        await _wait_for(lambda: websocket.messages("s1")[-1]["type"] == "cancelled")
+        assert opener.closed == ["s1"]
+        websocket.disconnect()
+        await task
+
+    asyncio.run(run())
+
+
+def test_duplicate_stream_and_stream_limit():
+    async def run():
+        websocket = FakeWebSocket()
+        opener = Opener(gate=True)
+        task = asyncio.ensure_future(_session(websocket, opener, max_streams=1).run())
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        websocket.client_send({"type": "chat", "stream": "s2", "message": "hi"})
+        await _wait_for(lambda: len(websocket.sent) == 2)
+        assert websocket.messages("s1")[0]["status"] == 409
+        assert websocket.messages("s2")[0]["status"] == 429
+        websocket.disconnect()
+        await task
+
+    asyncio.run(run())
+
+
+def test_open_failure_reports_status():
+    async def run():
+        websocket = FakeWebSocket()
+        task = asyncio.ensure_future(_session(websocket, Opener(error=Rejected())).run())
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        await _wait_for(lambda: websocket.sent)
+        assert websocket.sent[0] == {"stream": "s1", "type": "error", "status": 429, "content": "队列已满"}
+        websocket.disconnect()
+        await task
+
+    asyncio.run(run())
+
+
+def test_disconnect_cancels_open_streams():
+    async def run():
+        websocket = FakeWebSocket()
+        opener = Opener(gate=True)
+        task = asyncio.ensure_future(_session(websocket, opener).run())
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        await _wait_for(lambda: opener.opened == ["s1"])
+        websocket.disconnect()
+        await asyncio.wait_for(task, timeout=1.0)
+        assert opener.closed == ["s1"] and opener.released == ["s1"]
+
+    asyncio.run(run())
+
+
+def test_send_window_pauses_upstream_reads():
+    async def run():
+        websocket = FakeWebSocket()
+        websocket.unblocked.clear()  # 客户端不读
+        opener = Opener(chunks=[str(i) for i in range(50)])
+        # chunk_size=1：每个片段单独成帧，便于计数
+        task = asyncio.ensure_future(_session(websocket, opener, send_window=4, chunk_size=1).run())
+        websocket.client_send({"type": "chat", "stream": "s1", "message": "hi"})
+        await asyncio.sleep(0.05)
+        # 窗口 4 帧 + 正在写出的 1 帧 + 合并器与上游各预读的少量片段
+        assert opener.produced < 10
+
+        websocket.unblocked.set()
+        await _wait_for(lambda: opener.released == ["s1"])
+        contents = [m["content"] for m in websocket.messages("s1") if m["type"] == "content"]
+        assert "".join(contents) == "".join(str(i) for i in range(50))
+        websocket.disconnect()
+        await task
+
+    asyncio.run(run())
@@ -0,0 +1,17 @@
+"""
+token 数估算（不依赖具体模型的分词器）
+"""
+
+import math
+import re
+
+# 中日韩字符大多单独成 token；其余文本按约 4 个字符一个 token 估算
+_CJK = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
@@ -0,0 +1,279 @@
+"""
+请求级 span 追踪
+"""
+
+import json
+import logging
+import random
+import re
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from profiler import StackSampler
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "x-request-id"
+# 客户端传入的请求 ID 只作为追踪记录的属性保存，只接受安全字符
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9_\-]{1,128}")
+
+# httpcore trace 事件 -> span 名称（started/complete 成对出现）
+_HTTPCORE_SPANS = {
+    "connection.connect_tcp": "upstream_connect",
+    "connection.start_tls": "upstream_tls",
+    "http11.receive_response_headers": "upstream_first_byte",
+    "http2.receive_response_headers": "upstream_first_byte",
+}
+
+
+class Trace:
+    """单个请求的 span 记录
+
+    - span: 有起止时间的阶段（相对请求开始的毫秒偏移）
+    - event: 时间点
+    - timing: 高频操作（SSE 编码、socket 写入）只累计次数和总耗时，不逐条记录
+    """
+
+    __slots__ = ("request_id", "client_request_id", "method", "path", "started_at", "_t0", "spans", "timings",
+                 "status", "duration_ms", "profile", "max_spans", "dropped")
+
+    def __init__(self, request_id: str, method: str, path: str, max_spans: int = 64,
+                 client_request_id: Optional[str] = None):
+        self.request_id = request_id
+        self.client_request_id = client_request_id
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now().isoformat()
+        self._t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.timings: Dict[str, List[float]] = {}
+        self.status: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+        self.profile: Optional[str] = None
+        self.max_spans = max_spans
+        self.dropped = 0
+
+    def offset_ms(self, at: Optional[float] = None) -> float:
+        return round(((at if at is not None else time.perf_counter()) - self._t0) * 1000, 3)
+
+    def add_span(self, name: str, started: float, ended: float, **attrs: Any):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        span = {"name": name, "start_ms": self.offset_ms(started), "duration_ms": round((ended - started) * 1000, 3)}
+        if attrs:
+            span["attrs"] = attrs
+        self.spans.append(span)
+
+    def add_event(self, name: str, **attrs: Any):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        event = {"name": name, "start_ms": self.offset_ms()}
+        if attrs:
+            event["attrs"] = attrs
+        self.spans.append(event)
+
+    def add_timing(self, name: str, seconds: float):
+        timing = self.timings.get(name)
+        if timing is None:
+            self.timings[name] = [1, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+
+    def finish(self, status: Optional[int]):
+        self.status = status
+        self.duration_ms = self.offset_ms()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "client_request_id": self.client_request_id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": self.duration_ms,
+            "spans": self.spans,
+            "timings": {
+                name: {"count": int(count), "total_ms": round(total * 1000, 3)}
+                for name, (count, total) in self.timings.items()
+            },
+            "dropped_spans": self.dropped,
+            "profile": self.profile,
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[None]:
+    """记录一个阶段；当前请求未追踪时几乎没有开销"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_span(name, started, time.perf_counter(), **attrs)
+
+
+def event(name: str, **attrs: Any):
+    """记录一个时间点"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add_event(name, **attrs)
+
+
+def attach_httpx_trace(request: Any):
+    """为上游 httpx 请求挂上 httpcore trace 回调，拆分连接、TLS 与首字节耗时"""
+    trace = _current.get()
+    if trace is None:
+        return
+    started: Dict[str, float] = {}
+
+    async def on_event(event_name: str, info: Dict[str, Any]):
+        stage, _, phase = event_name.rpartition(".")
+        name = _HTTPCORE_SPANS.get(stage)
+        if name is None:
+            return
+        if phase == "started":
+            started[stage] = time.perf_counter()
+        elif stage in started:
+            if phase == "failed":
+                trace.add_span(name, started.pop(stage), time.perf_counter(), failed=True)
+            else:
+                trace.add_span(name, started.pop(stage), time.perf_counter())
+
+    request.extensions["trace"] = on_event
+
+
+class TraceStore:
+    """最近请求的内存环形缓冲，可选追加写入 JSONL 文件"""
+
+    def __init__(self, max_traces: int = 500, jsonl_path: str = ""):
+        self.max_traces = max_traces
+        self.jsonl_path = jsonl_path
+        self._traces: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._file = None
+        if jsonl_path:
+            self._file = open(jsonl_path, "a", encoding="utf-8")
+
+    def add(self, trace: Trace):
+        record = trace.to_dict()
+        self._traces[trace.request_id] = record
+        self._traces.move_to_end(trace.request_id)
+        while len(self._traces) > self.max_traces:
+            self._traces.popitem(last=False)
+        if self._file is not None:
+            try:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning(f"Failed to write trace to {self.jsonl_path}: {e}")
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        return self._traces.get(request_id)
+
+    def recent(self,
+               limit: int = 50,
+               min_duration_ms: float = 0.0,
+               path: Optional[str] = None,
+               client_request_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间倒序返回最近的追踪记录；client_request_id 可能对应多条记录"""
+        result = []
+        for record in reversed(self._traces.values()):
+            if (record["duration_ms"] or 0.0) < min_duration_ms:
+                continue
+            if path is not None and record["path"] != path:
+                continue
+            if client_request_id is not None and record["client_request_id"] != client_request_id:
+                continue
+            result.append(record)
+            if len(result) >= limit:
+                break
+        return result
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TracingMiddleware:
+    """纯 ASGI 追踪中间件
+
+    为每个 HTTP 请求在服务端生成追踪 ID 并写入响应头 X-Request-ID；客户端传入的 X-Request-ID
+    可能重复，只作为 client_request_id 属性保存，不用作追踪记录或分析结果的键。
+    同时累计响应体写入 socket 的耗时；按采样率对部分请求开启栈采样。
+    不使用 BaseHTTPMiddleware，避免流式响应被额外包一层队列。
+    """
+
+    def __init__(self,
+                 app: Any,
+                 store: TraceStore,
+                 sampler: Optional[StackSampler] = None,
+                 profile_sample_rate: float = 0.0,
+                 exclude_paths: tuple = ("/metrics", "/health/live", "/debug/traces")):
+        self.app = app
+        self.store = store
+        self.sampler = sampler
+        self.profile_sample_rate = profile_sample_rate
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        client_request_id = None
+        for name, value in scope.get("headers", []):
+            if name == REQUEST_ID_HEADER.encode():
+                value = value.decode("latin-1")
+                if _REQUEST_ID_PATTERN.fullmatch(value):
+                    client_request_id = value
+                break
+        trace = Trace(uuid.uuid4().hex, scope["method"], scope["path"], client_request_id=client_request_id)
+        token = _current.set(trace)
+        status: Optional[int] = None
+
+        profiling = self.sampler is not None and random.random() < self.profile_sample_rate
+        if profiling:
+            self.sampler.begin(trace.request_id)
+
+        async def send_wrapper(message: Dict[str, Any]):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER.encode(), trace.request_id.encode("latin-1"))
+                ]
+                trace.add_event("response_start", status=status)
+                await send(message)
+            elif message["type"] == "http.response.body":
+                started = time.perf_counter()
+                await send(message)
+                trace.add_timing("socket_write", time.perf_counter() - started)
+            else:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiling:
+                trace.profile = self.sampler.end(trace.request_id)
+            trace.finish(status)
+            self.store.add(trace)
+            _current.reset(token)
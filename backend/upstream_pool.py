@@ -0,0 +1,173 @@
+"""
+上游 HTTP 连接池（连接复用、预热与保活）
+"""
+
+import asyncio
+import importlib.util
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamConnectionPool:
+    """所有模型客户端共享的 httpx.AsyncClient
+
+    - 可配置最大连接数、保活连接数、保活过期时间、HTTP/2 与各阶段超时
+    - 启动后在后台向每个上游预热 N 条连接，之后周期性发送轻量请求保持连接温热；
+      预热/保活请求使用较短的 ping_timeout，上游缓慢或不可用时不会拖慢启动
+    """
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0,
+                 http2: bool = True,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 120.0,
+                 pool_timeout: float = 10.0,
+                 prewarm_connections: int = 2,
+                 ping_interval: float = 45.0,
+                 ping_timeout: float = 5.0):
+        # HTTP/2 依赖可选的 h2 包，未安装时退回 HTTP/1.1
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("h2 is not installed, upstream HTTP/2 disabled")
+            http2 = False
+        self.http2 = http2
+        self.prewarm_connections = prewarm_connections
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            read_timeout,
+            connect=connect_timeout,
+            pool=pool_timeout
+        )
+        self.client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            event_hooks={"request": [self._on_request]}
+        )
+        # 预热/保活目标: (base_url, api_key)
+        self._targets: List[Tuple[str, str]] = []
+        self._ping_task: Optional["asyncio.Task[None]"] = None
+        self.requests = 0
+        self.pings = 0
+        self.ping_failures = 0
+        self.last_ping_ms: Optional[float] = None
+
+    async def _on_request(self, request: httpx.Request):
+        self.requests += 1
+        tracing.attach_httpx_trace(request)
+
+    def register_target(self, base_url: str, api_key: str):
+        """登记需要预热和保活的上游"""
+        target = (base_url.rstrip("/"), api_key)
+        if target not in self._targets:
+            self._targets.append(target)
+
+    async def _ping(self, base_url: str, api_key: str):
+        """轻量请求：GET /models，不消耗模型 token"""
+        started = time.perf_counter()
+        try:
+            await self.client.get(
+                f"{base_url}/models",
+                headers={"Authorization": f"Bearer {api_key}"},
+                timeout=self.ping_timeout
+            )
+            self.last_ping_ms = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            self.ping_failures += 1
+            logger.debug(f"Upstream ping to {base_url} failed: {e}")
+        finally:
+            self.pings += 1
+
+    async def check(self) -> int:
+        """就绪检查：并发向每个上游发送 GET /models，返回可用的上游数；全部不可用时抛出第一个错误"""
+        if not self._targets:
+            raise RuntimeError("No upstream registered")
+
+        async def probe(base_url: str, api_key: str):
+            response = await self.client.get(
+                f"{base_url}/models",
+                headers={"Authorization": f"Bearer {api_key}"},
+                timeout=self.ping_timeout
+            )
+            response.raise_for_status()
+
+        results = await asyncio.gather(
+            *[probe(base_url, api_key) for base_url, api_key in self._targets], return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        if len(errors) == len(results):
+            raise errors[0]
+        return len(results) - len(errors)
+
+    async def prewarm(self):
+        """并发向每个上游建立 N 条连接（HTTP/2 下一条连接即可多路复用）"""
+        count = 1 if self.http2 else self.prewarm_connections
+        if count <= 0 or not self._targets:
+            return
+        await asyncio.gather(*[
+            self._ping(base_url, api_key)
+            for base_url, api_key in self._targets
+            for _ in range(count)
+        ])
+        logger.info(f"Prewarmed upstream connections: {self.stats()['connections']}")
+
+    async def _keepalive_loop(self):
+        await self.prewarm()
+        if self.ping_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await self.prewarm()
+
+    async def start(self):
+        """在后台预热连接并启动保活任务，不等待预热完成"""
+        if self._ping_task is None:
+            self._ping_task = asyncio.ensure_future(self._keepalive_loop())
+
+    async def close(self):
+        """停止保活并关闭所有连接"""
+        if self._ping_task is not None:
+            self._ping_task.cancel()
+            try:
+                await self._ping_task
+            except asyncio.CancelledError:
+                pass
+            self._ping_task = None
+        await self.client.aclose()
+
+    def _connections(self) -> List[Any]:
+        # httpx 未公开连接池状态，这里读取底层 httpcore 连接池
+        pool = getattr(getattr(self.client, "_transport", None), "_pool", None)
+        return list(getattr(pool, "connections", []) or [])
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池利用率"""
+        connections = self._connections()
+        idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        max_connections = self.limits.max_connections
+        return {
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "max_connections": max_connections,
+            "utilization": round((len(connections) - idle) / max_connections, 4) if max_connections else 0.0,
+            "http2": self.http2,
+            "requests": self.requests,
+            "pings": self.pings,
+            "ping_failures": self.ping_failures,
+            "last_ping_ms": self.last_ping_ms,
+        }
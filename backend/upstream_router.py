@@ -0,0 +1,298 @@
+"""
+多上游路由：最少未完成请求 + 延迟加权选择，熔断与故障转移
+"""
+
+import asyncio
+import logging
+import sys
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class NoUpstreamAvailable(Exception):
+    """所有上游均不可用（熔断或已尝试失败）"""
+
+
+def get_status_code(exc: BaseException) -> Optional[int]:
+    """从上游异常中取出 HTTP 状态码（openai.APIStatusError 等）"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """是否为上游限流"""
+    return get_status_code(exc) == 429
+
+
+def is_transport_error(exc: BaseException) -> bool:
+    """连接或超时错误（httpx、openai 客户端与 asyncio 超时）"""
+    if isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # openai 只在创建模型客户端后才导入，未导入时不可能抛出它的异常
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(exc, openai.APIConnectionError)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """网络错误、超时、限流和 5xx 可以转移到其他上游；其余 4xx 与程序错误是请求本身的问题"""
+    status = get_status_code(exc)
+    if status is not None:
+        return status >= 500 or status in (408, 429)
+    return is_transport_error(exc)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败或限流时打开，冷却后半开放行一个试探请求"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.trips = 0
+
+    def available(self) -> bool:
+        """当前是否可以接收请求（不改变状态）"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.cooldown
+        return not self.trial_in_flight
+
+    def try_acquire(self) -> bool:
+        """放行一个请求；冷却结束的打开状态转为半开并放行试探请求"""
+        if self.state == self.CLOSED:
+            return True
+        if not self.available():
+            return False
+        self.state = self.HALF_OPEN
+        self.trial_in_flight = True
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self, trip: bool = False):
+        self.failures += 1
+        self.trial_in_flight = False
+        if trip or self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """请求被取消（非上游故障）时释放试探名额"""
+        self.trial_in_flight = False
+
+
+class UpstreamEndpoint:
+    """单个上游：模型客户端及其负载、延迟、熔断状态"""
+
+    def __init__(self,
+                 name: str,
+                 base_url: str,
+                 api_key: str,
+                 model: str,
+                 weight: float,
+                 model_client: Any,
+                 breaker: CircuitBreaker,
+                 limiter: Optional[Any] = None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.weight = max(weight, 0.01)
+        self.model_client = model_client
+        self.breaker = breaker
+        # 自适应并发限制（aimd.AIMDLimiter），为空时不限制
+        self.limiter = limiter
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+
+    def score(self, default_latency: float) -> float:
+        """越小越优先：(未完成请求 + 1) × 近期延迟 ÷ 权重"""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return (self.outstanding + 1) * latency / self.weight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "model": self.model,
+            "weight": self.weight,
+            "outstanding": self.outstanding,
+            "ewma_latency_ms": round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            "requests": self.requests,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+            "circuit": self.breaker.state,
+            "circuit_trips": self.breaker.trips,
+            "concurrency": self.limiter.stats() if self.limiter is not None else None,
+        }
+
+
+class UpstreamRouter:
+    """在多个上游之间路由请求
+
+    /chat 失败时透明转移到下一个上游；流式请求只有在尚未产出任何片段时才转移。
+    """
+
+    def __init__(self, ewma_alpha: float = 0.3):
+        self.endpoints: List[UpstreamEndpoint] = []
+        self.ewma_alpha = ewma_alpha
+        self.failovers = 0
+
+    def add_endpoint(self, endpoint: UpstreamEndpoint):
+        self.endpoints.append(endpoint)
+
+    def _default_latency(self) -> float:
+        # 尚无延迟样本的上游按已知上游的平均延迟估计，保证新上游也能被选中
+        samples = [e.ewma_latency for e in self.endpoints if e.ewma_latency is not None]
+        return sum(samples) / len(samples) if samples else 1.0
+
+    def _select(self, exclude: List[UpstreamEndpoint]) -> Optional[UpstreamEndpoint]:
+        """选择得分最低的可用上游；优先选择并发限额未满的上游"""
+        default_latency = self._default_latency()
+        candidates = sorted(
+            (e for e in self.endpoints if e not in exclude and e.breaker.available()),
+            key=lambda e: (e.limiter is not None and not e.limiter.has_capacity(), e.score(default_latency))
+        )
+        for endpoint in candidates:
+            if endpoint.breaker.try_acquire():
+                endpoint.outstanding += 1
+                endpoint.requests += 1
+                return endpoint
+        return None
+
+    async def acquire(self, exclude: Optional[List[UpstreamEndpoint]] = None) -> Optional[UpstreamEndpoint]:
+        """选择上游并占用一个请求名额（必要时等待其并发限额）"""
+        endpoint = self._select(exclude or [])
+        if endpoint is not None and endpoint.limiter is not None:
+            try:
+                await endpoint.limiter.acquire()
+            except BaseException:
+                endpoint.outstanding = max(endpoint.outstanding - 1, 0)
+                endpoint.breaker.release()
+                raise
+        return endpoint
+
+    def release(self,
+                endpoint: UpstreamEndpoint,
+                latency: Optional[float] = None,
+                error: Optional[BaseException] = None,
+                kind: str = "call"):
+        """归还请求名额并记录结果；latency 与 error 都为空表示请求被取消"""
+        endpoint.outstanding = max(endpoint.outstanding - 1, 0)
+        if endpoint.limiter is not None:
+            endpoint.limiter.release(latency, error, kind)
+        if error is not None:
+            endpoint.failures += 1
+            rate_limited = is_rate_limited(error)
+            if rate_limited:
+                endpoint.rate_limited += 1
+            if is_retryable(error):
+                endpoint.breaker.record_failure(trip=rate_limited)
+            else:
+                endpoint.breaker.release()
+        elif latency is not None:
+            if endpoint.ewma_latency is None:
+                endpoint.ewma_latency = latency
+            else:
+                endpoint.ewma_latency += self.ewma_alpha * (latency - endpoint.ewma_latency)
+            endpoint.breaker.record_success()
+        else:
+            endpoint.breaker.release()
+
+    async def call(self, fn: Callable[[UpstreamEndpoint], Awaitable[T]]) -> T:
+        """调用上游，可重试的失败自动转移到其他上游"""
+        tried: List[UpstreamEndpoint] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            endpoint = await self.acquire(exclude=tried)
+            if endpoint is None:
+                raise last_error or NoUpstreamAvailable("没有可用的上游")
+            if tried:
+                self.failovers += 1
+                logger.warning(f"Failing over to upstream {endpoint.name}: {last_error}")
+            tried.append(endpoint)
+
+            started = time.perf_counter()
+            try:
+                result = await fn(endpoint)
+            except Exception as e:
+                self.release(endpoint, error=e)
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                self.release(endpoint)
+                raise
+            self.release(endpoint, latency=time.perf_counter() - started)
+            return result
+
+    async def stream(self, factory: Callable[[UpstreamEndpoint], AsyncIterator[T]]) -> AsyncGenerator[T, None]:
+        """流式调用上游；首个片段产出前的可重试失败自动转移到其他上游"""
+        tried: List[UpstreamEndpoint] = []
+        last_error: Optional[BaseException] = None
+        while True:
+            endpoint = await self.acquire(exclude=tried)
+            if endpoint is None:
+                raise last_error or NoUpstreamAvailable("没有可用的上游")
+            if tried:
+                self.failovers += 1
+                logger.warning(f"Failing over stream to upstream {endpoint.name}: {last_error}")
+            tried.append(endpoint)
+
+            started = time.perf_counter()
+            first_chunk_latency: Optional[float] = None
+            stream = factory(endpoint)
+            try:
+                async for item in stream:
+                    if first_chunk_latency is None:
+                        # 流式请求以首片段延迟作为上游延迟样本
+                        first_chunk_latency = time.perf_counter() - started
+                    yield item
+            except Exception as e:
+                self.release(endpoint, error=e, kind="stream")
+                if first_chunk_latency is not None or not is_retryable(e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                self.release(endpoint, kind="stream")
+                raise
+            finally:
+                # 下游提前关闭（客户端断开）时立即关闭上游流，而不是等垃圾回收
+                aclose = getattr(stream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            self.release(endpoint, latency=first_chunk_latency or time.perf_counter() - started, kind="stream")
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        """路由统计信息"""
+        return {
+            "failovers": self.failovers,
+            "endpoints": [e.stats() for e in self.endpoints],
+        }
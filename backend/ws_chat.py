@@ -0,0 +1,158 @@
+"""
+WebSocket 多路复用聊天：一条长连接上并发多个按流 ID 区分的聊天流
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+from starlette.websockets import WebSocket, WebSocketDisconnect
+
+import sse
+
+logger = logging.getLogger(__name__)
+
+# 打开一个流：返回事件流与结束时的释放回调；失败时抛出带 status_code 的异常
+StreamOpener = Callable[[Dict[str, Any]], Awaitable[Tuple[AsyncIterator[Dict[str, Any]], Callable[[], None]]]]
+
+_MAX_STREAM_ID_LENGTH = 64
+
+
+class WebSocketChatSession:
+    """单条 WebSocket 连接上的多路聊天流
+
+    客户端消息：
+    - `{"type": "chat", "stream": "s1", ...ChatRequest 字段, "last_event_id": 可选}` 打开一个流
+    - `{"type": "cancel", "stream": "s1"}` 取消该流（上游生成随之取消）
+    - `{"type": "ping"}` 心跳，回复 `{"type": "pong"}`
+
+    服务端消息与 /chat/stream 的 data 帧相同（content/end/error/restart），另带 `stream` 字段；
+    取消成功后发送 `{"type": "cancelled"}`。
+
+    所有流共用一个有界发送窗口：客户端读得慢时发送阻塞，窗口耗尽后各个流暂停读取上游事件。
+    控制消息（pong、cancelled、打开失败的 error）不占窗口，不会被数据消息阻塞。
+    """
+
+    def __init__(self,
+                 websocket: WebSocket,
+                 open_stream: StreamOpener,
+                 max_streams: int = 16,
+                 send_window: int = 64,
+                 chunk_size: int = 1024,
+                 flush_interval: float = 0.01):
+        self.websocket = websocket
+        self.open_stream = open_stream
+        self.max_streams = max_streams
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self._streams: Dict[str, "asyncio.Task[None]"] = {}
+        self._outbox: Deque[Tuple[Dict[str, Any], bool]] = deque()
+        self._outbox_ready = asyncio.Event()
+        self._send_window = asyncio.Semaphore(send_window)
+
+    async def run(self):
+        """处理连接直到客户端断开，断开时取消所有未结束的流"""
+        writer = asyncio.ensure_future(self._writer())
+        try:
+            while True:
+                text = await self.websocket.receive_text()
+                try:
+                    message = json.loads(text)
+                except json.JSONDecodeError:
+                    self._control({"type": "error", "status": 400, "content": "消息不是合法的 JSON"})
+                    continue
+                if not isinstance(message, dict):
+                    self._control({"type": "error", "status": 400, "content": "消息必须是 JSON 对象"})
+                    continue
+                self._dispatch(message)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            pending = [writer, *self._streams.values()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def _dispatch(self, message: Dict[str, Any]):
+        kind = message.get("type")
+        stream_id = message.get("stream")
+        if kind == "ping":
+            self._control({"type": "pong"})
+            return
+        if not isinstance(stream_id, str) or not 0 < len(stream_id) <= _MAX_STREAM_ID_LENGTH:
+            self._control({"type": "error", "status": 400, "content": "缺少或无效的 stream 字段"})
+            return
+        if kind == "cancel":
+            task = self._streams.get(stream_id)
+            if task is not None:
+                task.cancel()
+            return
+        if kind != "chat":
+            self._control({"stream": stream_id, "type": "error", "status": 400, "content": f"未知的消息类型: {kind}"})
+            return
+        if stream_id in self._streams:
+            self._control({"stream": stream_id, "type": "error", "status": 409, "content": "流 ID 已在使用"})
+            return
+        if len(self._streams) >= self.max_streams:
+            self._control({"stream": stream_id, "type": "error", "status": 429, "content": "并发流过多"})
+            return
+        task = asyncio.ensure_future(self._run_stream(stream_id, message))
+        self._streams[stream_id] = task
+
+    async def _run_stream(self, stream_id: str, message: Dict[str, Any]):
+        """打开流并把事件转发给客户端"""
+        events: Optional[AsyncIterator[Dict[str, Any]]] = None
+        release: Optional[Callable[[], None]] = None
+        try:
+            try:
+                source, release = await self.open_stream(message)
+            except Exception as e:
+                self._control({
+                    "stream": stream_id,
+                    "type": "error",
+                    "status": getattr(e, "status_code", 500),
+                    "content": getattr(e, "detail", None) or str(e)
+                })
+                return
+            events = sse.coalesce(source, self.chunk_size, self.flush_interval)
+            async for event in events:
+                await self._send({"stream": stream_id, **event})
+        except asyncio.CancelledError:
+            self._control({"stream": stream_id, "type": "cancelled", "content": ""})
+        except Exception as e:
+            logger.error(f"WebSocket stream {stream_id} error: {e}")
+            self._control({"stream": stream_id, "type": "error", "status": 500, "content": f"错误: {str(e)}"})
+        finally:
+            self._streams.pop(stream_id, None)
+            if events is not None:
+                # 逐层关闭以立即取消上游
+                await events.aclose()
+            if release is not None:
+                release()
+
+    async def _send(self, message: Dict[str, Any]):
+        """发送数据消息：先占用发送窗口，客户端读得慢时在这里等待"""
+        await self._send_window.acquire()
+        self._outbox.append((message, True))
+        self._outbox_ready.set()
+
+    def _control(self, message: Dict[str, Any]):
+        """发送控制消息：不占用发送窗口"""
+        self._outbox.append((message, False))
+        self._outbox_ready.set()
+
+    async def _writer(self):
+        """唯一的发送者：按入队顺序写出消息"""
+        while True:
+            if not self._outbox:
+                self._outbox_ready.clear()
+                await self._outbox_ready.wait()
+                continue
+            message, is_data = self._outbox.popleft()
+            try:
+                await self.websocket.send_text(sse.dumps(message).decode("utf-8"))
+            finally:
+                if is_data:
+                    self._send_window.release()
@@ -1,7 +1,14 @@
 // 全局变量
 const API_BASE_URL = 'http://localhost:8000';
 let isStreaming = false;
-let currentEventSource = null;
+// 当前流式请求的 AbortController，中止后服务端会检测到断开并取消上游生成
+let currentController = null;
+// 流式连接中断后的最大续传次数
+const MAX_STREAM_RECONNECTS = 3;
+// 流式请求优先走 WebSocket 多路复用连接，连接失败时回退到 SSE
+const USE_WEBSOCKET = true;
+const WS_URL = API_BASE_URL.replace(/^http/, 'ws') + '/ws';
+const SYSTEM_MESSAGE = "你是一个智能助手，能够帮助用户解答各种问题。请用中文回答，回答要详细且有帮助。";
 
 // DOM 元素
 const messageInput = document.getElementById('messageInput');
@@ -22,6 +29,13 @@ document.addEventListener('DOMContentLoaded', function() {
     checkBackendConnection();
 });
 
+// 离开页面时中止正在进行的流
+window.addEventListener('pagehide', function() {
+    if (currentController) {
+        currentController.abort();
+    }
+});
+
 // 处理输入变化
 function handleInputChange() {
     const hasContent = messageInput.value.trim().length > 0;
@@ -92,9 +106,9 @@ function sendSuggestion(message) {
 // 开始新对话
 function startNewChat() {
     // 停止当前流
-    if (currentEventSource) {
-        currentEventSource.close();
-        currentEventSource = null;
+    if (currentController) {
+        currentController.abort();
+        currentController = null;
     }
     
     // 清空消息容器
@@ -192,116 +206,332 @@ async function sendMessage() {
     try {
         await sendStreamMessage(message);
     } catch (error) {
+        if (error.name === 'AbortError') {
+            // 用户主动中止（如开始新对话），不提示错误
+            return;
+        }
         console.error('Send message error:', error);
         addMessage('抱歉，发生了错误。请稍后重试。', false);
         updateStatus('发送失败', 'error');
     } finally {
+        currentController = null;
         isStreaming = false;
         handleInputChange();
     }
 }
 
+// 流式回复的显示：逐段追加内容，结束时移除光标
+function createStreamView() {
+    let content = '';
+    let element = null;
+
+    return {
+        reset() {
+            content = '';
+        },
+        append(text) {
+            content += text;
+
+            // 如果还没有流式元素，创建一个
+            if (!element) {
+                element = addMessage('', false, true);
+            }
+
+            // 更新内容
+            element.innerHTML = formatMessage(content) + '<span class="cursor">|</span>';
+
+            // 滚动到底部
+            messagesContainer.scrollTop = messagesContainer.scrollHeight;
+        },
+        finish() {
+            if (element) {
+                const cursor = element.querySelector('.cursor');
+                if (cursor) cursor.remove();
+            }
+            updateStatus('就绪', 'success');
+        }
+    };
+}
+
+// WebSocket 多路复用连接：所有流共用一条连接，按 stream 字段分发事件
+const chatSocket = {
+    socket: null,
+    connecting: null,
+    streams: new Map(),
+    nextId: 0,
+
+    connect() {
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            return Promise.resolve();
+        }
+        if (!this.connecting) {
+            this.connecting = new Promise((resolve, reject) => {
+                const socket = new WebSocket(WS_URL);
+                socket.onopen = () => {
+                    this.socket = socket;
+                    this.connecting = null;
+                    resolve();
+                };
+                socket.onerror = () => {
+                    if (this.connecting) {
+                        this.connecting = null;
+                        reject(new Error('WebSocket connection failed'));
+                    }
+                };
+                socket.onmessage = (event) => this.dispatch(event);
+                socket.onclose = () => this.closed(socket);
+            });
+        }
+        return this.connecting;
+    },
+
+    async open(payload, handler) {
+        await this.connect();
+        const streamId = `s${++this.nextId}`;
+        this.streams.set(streamId, handler);
+        this.socket.send(JSON.stringify({ ...payload, type: 'chat', stream: streamId }));
+        return streamId;
+    },
+
+    cancel(streamId) {
+        // 服务端收到后取消上游生成
+        if (this.streams.delete(streamId) && this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify({ type: 'cancel', stream: streamId }));
+        }
+    },
+
+    dispatch(event) {
+        let data;
+        try {
+            data = JSON.parse(event.data);
+        } catch (parseError) {
+            console.error('Parse error:', parseError);
+            return;
+        }
+        const handler = this.streams.get(data.stream);
+        if (!handler) return;
+        if (data.type === 'end' || data.type === 'error' || data.type === 'cancelled') {
+            this.streams.delete(data.stream);
+        }
+        handler.onEvent(data);
+    },
+
+    closed(socket) {
+        if (this.socket !== socket) return;
+        this.socket = null;
+        const handlers = Array.from(this.streams.values());
+        this.streams.clear();
+        handlers.forEach(handler => handler.onClose());
+    }
+};
+
 // 发送流式消息
 async function sendStreamMessage(message) {
+    if (USE_WEBSOCKET && 'WebSocket' in window) {
+        try {
+            await chatSocket.connect();
+        } catch (error) {
+            console.warn('WebSocket unavailable, falling back to SSE:', error);
+            return sendSseStreamMessage(message);
+        }
+        return sendSocketStreamMessage(message);
+    }
+    return sendSseStreamMessage(message);
+}
+
+// 经 WebSocket 多路复用连接发送流式消息
+function sendSocketStreamMessage(message) {
     return new Promise((resolve, reject) => {
         const requestData = {
             message: message,
-            system_message: "你是一个智能助手，能够帮助用户解答各种问题。请用中文回答，回答要详细且有帮助。"
+            system_message: SYSTEM_MESSAGE
         };
 
-        // 创建 EventSource 用于 SSE
-        const eventSource = new EventSource(`${API_BASE_URL}/chat/stream`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
+        const controller = new AbortController();
+        currentController = controller;
+
+        const view = createStreamView();
+        let streamId = null;
+        // 最近收到的事件 ID，连接断开后带上 last_event_id 从断点续传
+        let lastEventId = null;
+        let reconnects = 0;
+
+        const handler = {
+            onEvent(data) {
+                if (data.id) {
+                    lastEventId = data.id;
+                }
+                if (data.type === 'restart') {
+                    // 服务端无法续传，将重新生成完整回复
+                    view.reset();
+                } else if (data.type === 'content' && data.content) {
+                    view.append(data.content);
+                } else if (data.type === 'end') {
+                    view.finish();
+                    resolve();
+                } else if (data.type === 'error') {
+                    // 服务端报告的错误不再续传
+                    const detail = typeof data.content === 'string' ? data.content : JSON.stringify(data.content);
+                    reject(new Error(detail));
+                }
             },
-            body: JSON.stringify(requestData)
-        });
+            onClose() {
+                retryOrFail(new Error('WebSocket closed before end event'));
+            }
+        };
 
-        // 由于 EventSource 不支持 POST，我们使用 fetch 来模拟 SSE
-        fetch(`${API_BASE_URL}/chat/stream`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'Accept': 'text/event-stream',
-            },
-            body: JSON.stringify(requestData)
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
+        function retryOrFail(error) {
+            if (!controller.signal.aborted && lastEventId && reconnects < MAX_STREAM_RECONNECTS) {
+                reconnects++;
+                updateStatus(`连接中断，正在续传（${reconnects}/${MAX_STREAM_RECONNECTS}）...`, 'warning');
+                setTimeout(start, 500 * reconnects);
+                return;
             }
+            reject(error);
+        }
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-            let streamingContent = '';
-            let streamingElement = null;
-
-            function readStream() {
-                reader.read().then(({ done, value }) => {
-                    if (done) {
-                        // 流结束，移除光标
-                        if (streamingElement) {
-                            const cursor = streamingElement.querySelector('.cursor');
-                            if (cursor) cursor.remove();
-                        }
-                        updateStatus('就绪', 'success');
-                        resolve();
-                        return;
+        function start() {
+            const payload = lastEventId ? { ...requestData, last_event_id: lastEventId } : requestData;
+            chatSocket.open(payload, handler)
+                .then(id => {
+                    streamId = id;
+                    if (controller.signal.aborted) {
+                        chatSocket.cancel(id);
                     }
+                })
+                .catch(error => {
+                    console.error('WebSocket error:', error);
+                    retryOrFail(error);
+                });
+        }
+
+        controller.signal.addEventListener('abort', () => {
+            if (streamId) {
+                chatSocket.cancel(streamId);
+            }
+            reject(new DOMException('Aborted', 'AbortError'));
+        });
 
-                    const chunk = decoder.decode(value, { stream: true });
-                    const lines = chunk.split('\n');
+        start();
+    });
+}
+
+// 经 SSE 发送流式消息
+async function sendSseStreamMessage(message) {
+    return new Promise((resolve, reject) => {
+        const requestData = {
+            message: message,
+            system_message: SYSTEM_MESSAGE
+        };
 
-                    for (const line of lines) {
-                        if (line.startsWith('data: ')) {
-                            try {
-                                const data = JSON.parse(line.slice(6));
+        const controller = new AbortController();
+        currentController = controller;
 
-                                if (data.type === 'content' && data.content) {
-                                    streamingContent += data.content;
+        const view = createStreamView();
+        // 最近收到的事件 ID，断线后带上 Last-Event-ID 从断点续传
+        let lastEventId = null;
+        let reconnects = 0;
 
-                                    // 如果还没有流式元素，创建一个
-                                    if (!streamingElement) {
-                                        streamingElement = addMessage('', false, true);
-                                    }
+        function retryOrFail(error) {
+            if (error.name !== 'AbortError' && lastEventId && reconnects < MAX_STREAM_RECONNECTS) {
+                reconnects++;
+                updateStatus(`连接中断，正在续传（${reconnects}/${MAX_STREAM_RECONNECTS}）...`, 'warning');
+                setTimeout(connect, 500 * reconnects);
+                return;
+            }
+            reject(error);
+        }
+
+        function connect() {
+            const headers = {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            };
+            if (lastEventId) {
+                headers['Last-Event-ID'] = lastEventId;
+            }
+
+            // EventSource 不支持 POST，使用 fetch 读取 SSE
+            fetch(`${API_BASE_URL}/chat/stream`, {
+                method: 'POST',
+                headers: headers,
+                body: JSON.stringify(requestData),
+                signal: controller.signal
+            })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                // 服务端会合并片段，一帧可能跨多次读取，未读完的行留到下次拼接
+                let pendingText = '';
+                // 帧的 id 行先于 data 行到达，data 处理完（遇到帧结尾的空行）才确认为已收到
+                let pendingEventId = null;
+
+                function readStream() {
+                    reader.read().then(({ done, value }) => {
+                        if (done) {
+                            // 没有收到结束事件就断开，尝试续传
+                            retryOrFail(new Error('Stream closed before end event'));
+                            return;
+                        }
 
-                                    // 更新内容
-                                    streamingElement.innerHTML = formatMessage(streamingContent) + '<span class="cursor">|</span>';
+                        pendingText += decoder.decode(value, { stream: true });
+                        const lines = pendingText.split('\n');
+                        pendingText = lines.pop();
 
-                                    // 滚动到底部
-                                    messagesContainer.scrollTop = messagesContainer.scrollHeight;
-                                } else if (data.type === 'end') {
-                                    // 流结束
-                                    if (streamingElement) {
-                                        const cursor = streamingElement.querySelector('.cursor');
-                                        if (cursor) cursor.remove();
+                        for (const line of lines) {
+                            if (line === '') {
+                                if (pendingEventId !== null) {
+                                    lastEventId = pendingEventId;
+                                    pendingEventId = null;
+                                }
+                            } else if (line.startsWith('id: ')) {
+                                pendingEventId = line.slice(4);
+                            } else if (line.startsWith('data: ')) {
+                                try {
+                                    const data = JSON.parse(line.slice(6));
+
+                                    if (data.type === 'restart') {
+                                        // 服务端无法续传，将重新生成完整回复
+                                        view.reset();
+                                    } else if (data.type === 'content' && data.content) {
+                                        view.append(data.content);
+                                    } else if (data.type === 'end') {
+                                        reader.cancel();
+                                        view.finish();
+                                        resolve();
+                                        return;
+                                    } else if (data.type === 'error') {
+                                        // 服务端报告的错误不再续传
+                                        reader.cancel();
+                                        reject(new Error(data.content));
+                                        return;
                                     }
-                                    updateStatus('就绪', 'success');
-                                    resolve();
-                                    return;
-                                } else if (data.type === 'error') {
-                                    throw new Error(data.content);
+                                } catch (parseError) {
+                                    console.error('Parse error:', parseError);
                                 }
-                            } catch (parseError) {
-                                console.error('Parse error:', parseError);
                             }
                         }
-                    }
 
-                    readStream();
-                }).catch(error => {
-                    console.error('Stream read error:', error);
-                    reject(error);
-                });
-            }
+                        readStream();
+                    }).catch(error => {
+                        console.error('Stream read error:', error);
+                        retryOrFail(error);
+                    });
+                }
+
+                readStream();
+            })
+            .catch(error => {
+                console.error('Fetch error:', error);
+                retryOrFail(error);
+            });
+        }
 
-            readStream();
-        })
-        .catch(error => {
-            console.error('Fetch error:', error);
-            reject(error);
-        });
+        connect();
     });
 }
 
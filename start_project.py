@@ -3,6 +3,7 @@
 AutoGen Chat 项目启动脚本
 """
 
+import importlib.util
 import os
 import sys
 import subprocess
@@ -44,12 +45,12 @@ def check_dependencies():
         'autogen_ext'
     ]
     
+    # 只查找模块而不导入，避免检查本身耗时
     missing_packages = []
     for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
+        if importlib.util.find_spec(package.replace('-', '_')) is not None:
             print(f"✅ {package}")
-        except ImportError:
+        else:
             missing_packages.append(package)
             print(f"❌ {package} 未安装")
     
@@ -96,7 +97,7 @@ def wait_for_backend():
     max_attempts = 30
     for i in range(max_attempts):
         try:
-            response = requests.get("http://localhost:8000/health", timeout=2)
+            response = requests.get("http://localhost:8000/health/live", timeout=2)
             if response.status_code == 200:
                 print("✅ 后端服务已就绪")
                 return True